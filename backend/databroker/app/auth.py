@@ -1,30 +1,40 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from .models.admin import Admin
-from sqlalchemy.orm import Session
-from .database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .config import settings
+from .database import get_async_db
+from .passwords import DUMMY_HASH, get_hasher
 import logging
+import threading
+import time
 
 # JWT Configuration
 SECRET_KEY = "your-secret-key"  # In production, use a secure secret key
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 logger = logging.getLogger(__name__)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_hasher().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_hasher().hash(password)
 
-def authenticate_admin(username: str, password: str) -> Optional[Admin]:
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await get_hasher().verify_async(plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await get_hasher().hash_async(password)
+
+async def authenticate_admin(db: AsyncSession, username: str, password: str) -> Optional[Admin]:
     if username == "superadmin" and password == "superadmin":
         return Admin(
             username="superadmin",
@@ -32,7 +42,15 @@ def authenticate_admin(username: str, password: str) -> Optional[Admin]:
             password=password,
             role="admin"
         )
-    return None
+
+    result = await db.execute(select(Admin).where(Admin.username == username))
+    admin = result.scalars().first()
+    try:
+        valid = await verify_password_async(password, admin.password if admin else DUMMY_HASH)
+    except ValueError:
+        logger.warning(f"Stored password of admin '{username}' is not a recognised hash")
+        return None
+    return admin if admin is not None and valid else None
 
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
@@ -51,13 +69,59 @@ def verify_token(token: str) -> Optional[dict]:
     except JWTError:
         return None
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Admin:
+# Resolved principals, so a burst of requests with the same token decodes it
+# and loads the admin once. Entries are keyed by token and live for
+# settings.auth_cache_ttl seconds, never past the token's own expiry;
+# routers/admins.py drops a user's entries when it changes or deletes them.
+# Other processes serving the API notice such changes within the TTL.
+
+_principals: "OrderedDict[str, tuple[str, Admin, float]]" = OrderedDict()
+_principals_lock = threading.Lock()
+
+def _cached_principal(token: str) -> Optional[Admin]:
+    with _principals_lock:
+        entry = _principals.get(token)
+        if entry is None:
+            return None
+        if entry[2] <= time.monotonic():
+            del _principals[token]
+            return None
+        _principals.move_to_end(token)
+        return entry[1]
+
+def _cache_principal(token: str, admin: Admin, expires_at: Optional[int]):
+    ttl = settings.auth_cache_ttl
+    if expires_at is not None:
+        ttl = min(ttl, expires_at - time.time())
+    if ttl <= 0:
+        return
+    with _principals_lock:
+        _principals[token] = (admin.username, admin, time.monotonic() + ttl)
+        _principals.move_to_end(token)
+        while len(_principals) > settings.auth_cache_size:
+            _principals.popitem(last=False)
+
+def invalidate_principal(*usernames: str):
+    """Forget cached sessions of these admins, after they were changed or deleted."""
+    with _principals_lock:
+        for token in [token for token, entry in _principals.items() if entry[0] in usernames]:
+            del _principals[token]
+
+def clear_principals():
+    with _principals_lock:
+        _principals.clear()
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> Admin:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
+    admin = _cached_principal(token)
+    if admin is not None:
+        return admin
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -65,15 +129,20 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             raise credentials_exception
             
         # Get admin from database
-        admin = db.query(Admin).filter(Admin.username == username).first()
+        result = await db.execute(select(Admin).where(Admin.username == username))
+        admin = result.scalars().first()
         if admin is None:
             raise credentials_exception
-            
+
+        # Shared between requests, so it must not stay attached to this session
+        db.expunge(admin)
+        if settings.auth_cache_ttl > 0:
+            _cache_principal(token, admin, payload.get("exp"))
         return admin
     except JWTError:
         raise credentials_exception
 
-async def get_current_admin(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Admin:
+async def get_current_admin(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> Admin:
     admin = await get_current_user(token, db)
     if admin.role not in ["admin", "super_admin"]:
         raise HTTPException(
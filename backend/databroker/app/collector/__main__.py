@@ -0,0 +1,35 @@
+import argparse
+import asyncio
+import logging
+from .engine import BackupEngine
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
+)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a configuration backup for network devices")
+    parser.add_argument("device_ids", nargs="*", help="Devices to back up (default: all active devices)")
+    parser.add_argument("--max-concurrency", type=int, help="Global limit on concurrent sessions")
+    parser.add_argument("--site-concurrency", type=int, help="Limit on concurrent sessions per site")
+    args = parser.parse_args()
+
+    engine = BackupEngine(
+        max_concurrency=args.max_concurrency,
+        site_concurrency=args.site_concurrency,
+    )
+    async def run():
+        try:
+            return await engine.run(args.device_ids or None)
+        finally:
+            await engine.close_connections()
+
+    try:
+        summary = asyncio.run(run())
+    finally:
+        engine.close()
+    print(f"Backed up {summary.succeeded}/{summary.total} devices ({summary.failed} failed)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+from dataclasses import dataclass
+from typing import Dict, Optional, Pattern, Tuple
+import re
+
+# Per-platform knowledge for collecting over an interactive CLI: what the
+# prompt looks like, how to get to privileged mode, how to turn paging off
+# and which command prints the configuration. Prompt patterns are matched
+# against the end of the received output (after a newline), so they start
+# with \n and end in \Z. They only have to find the first prompt: after
+# login, a session waits for the exact prompt the device showed.
+#
+# Show commands (version, inventory) run next to the config, each on its own
+# channel of the device's connection, and their output heads the backup as
+# comments, so hardware and software changes show up in config diffs. Lines
+# that change on their own (uptime) are dropped, or every backup would be a
+# new revision.
+
+@dataclass(frozen=True)
+class Driver:
+    name: str
+    prompt: Pattern[bytes]
+    config_command: str
+    paging_commands: Tuple[str, ...] = ()
+    # Set when the config command needs privileged mode: a prompt that does
+    # not match ``privileged_prompt`` is followed by ``enable_command``
+    privileged_prompt: Optional[Pattern[bytes]] = None
+    enable_command: Optional[str] = None
+    password_prompt: Pattern[bytes] = re.compile(rb"(?i)password:\s*\Z")
+    # Pager prompt answered with a space, for devices where paging cannot be disabled
+    more_prompt: Optional[Pattern[bytes]] = re.compile(rb"[ \t]*-+ ?\(?[Mm]ore\b[^\n]*\Z")
+    # Output that means the command was rejected
+    error: Optional[Pattern[bytes]] = None
+    # Path of the configuration for SCP/SFTP transfer, on platforms that serve it as a file
+    config_file: Optional[str] = None
+    show_commands: Tuple[str, ...] = ()
+    # Starts the comment lines the show command output is written as
+    comment: str = "!"
+    # Lines of show command output left out of the backup
+    volatile: Optional[Pattern[str]] = None
+
+DRIVERS: Dict[str, Driver] = {}
+
+def register(driver: Driver) -> Driver:
+    DRIVERS[driver.name] = driver
+    return driver
+
+_CISCO_PROMPT = re.compile(rb"\n\r*[\w.\-@/:()]+[>#] ?\Z")
+_CISCO_PRIVILEGED = re.compile(rb"# ?\Z")
+_CISCO_ERROR = re.compile(rb"(?m)^% ?(?:Invalid|Incomplete|Ambiguous|Unknown)")
+_CISCO_SHOW = ("show version", "show inventory")
+_CISCO_VOLATILE = re.compile(r"(?i)uptime is|\bup \d+ (?:year|week|day|hour|min|sec)|returned to rom|restarted at|last reset")
+
+register(Driver(
+    name="cisco_ios",
+    prompt=_CISCO_PROMPT,
+    config_command="show running-config",
+    paging_commands=("terminal length 0", "terminal width 511"),
+    privileged_prompt=_CISCO_PRIVILEGED,
+    enable_command="enable",
+    error=_CISCO_ERROR,
+    config_file="system:running-config",
+    show_commands=_CISCO_SHOW,
+    volatile=_CISCO_VOLATILE,
+))
+register(Driver(
+    name="cisco_nxos",
+    prompt=_CISCO_PROMPT,
+    config_command="show running-config",
+    paging_commands=("terminal length 0", "terminal width 511"),
+    error=_CISCO_ERROR,
+    show_commands=_CISCO_SHOW,
+    volatile=_CISCO_VOLATILE,
+))
+register(Driver(
+    name="cisco_asa",
+    prompt=_CISCO_PROMPT,
+    config_command="show running-config",
+    paging_commands=("terminal pager 0",),
+    privileged_prompt=_CISCO_PRIVILEGED,
+    enable_command="enable",
+    error=re.compile(rb"(?m)^ERROR: "),
+    show_commands=_CISCO_SHOW,
+    volatile=_CISCO_VOLATILE,
+))
+register(Driver(
+    name="juniper_junos",
+    prompt=re.compile(rb"\n\r*(?:\{\w+(?::\w+)?\}\r?\n)?[\w.\-]+@[\w.\-]+[>#%] ?\Z"),
+    config_command="show configuration | display set | no-more",
+    paging_commands=("set cli screen-length 0", "set cli screen-width 0"),
+    error=re.compile(rb"(?m)^(?:syntax error|unknown command|error:)"),
+    config_file="/config/juniper.conf.gz",
+    show_commands=("show version | no-more", "show chassis hardware | no-more"),
+    comment="#",
+    volatile=re.compile(r"(?i)uptime|booted:"),
+))
+register(Driver(
+    name="fortinet_fortios",
+    prompt=re.compile(rb"\n\r*[\w.\-]+(?: \([\w.\-]+\))? [#$] ?\Z"),
+    # Paging is a console setting in the device config, so the pager is answered instead
+    config_command="show full-configuration",
+    error=re.compile(rb"(?m)^Command fail\."),
+    config_file="sys_config",
+))
+register(Driver(
+    name="paloalto_panos",
+    prompt=re.compile(rb"\n\r*[\w.\-]+@[\w.\-()]+[>#] ?\Z"),
+    config_command="show config running",
+    paging_commands=("set cli pager off",),
+    error=re.compile(rb"(?m)^(?:Unknown command|Invalid syntax)"),
+))
+
+# Used when a device does not name its platform (Device.config["platform"])
+DEFAULT_PLATFORMS = {
+    "Switch": "cisco_ios",
+    "Router": "cisco_ios",
+    "Firewall": "cisco_asa",
+}
+
+def get_driver(platform: Optional[str] = None, device_type: Optional[str] = None) -> Driver:
+    name = platform or DEFAULT_PLATFORMS.get(device_type or "", "cisco_ios")
+    try:
+        return DRIVERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown platform '{name}' (known: {', '.join(sorted(DRIVERS))})")
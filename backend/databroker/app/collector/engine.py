@@ -0,0 +1,303 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import logging
+import uuid
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session, selectinload
+from ..config import settings
+from ..config_store.blobs import BlobStore, get_blob_store, hash_config, make_ref, parse_ref
+from ..database import SessionLocal
+from ..models.models import Device, DeviceStatus, BackupHistory, BackupStatus
+from ..storage import BatchWriter, bulk_insert
+from ..stats import record_backups
+from .queue import JobLease, finish_held
+from .telnet import fetch_running_config_telnet
+from .transport import (
+    CollectionError,
+    DeviceTarget,
+    SSHConnectionPool,
+    fetch_config_file,
+    fetch_device_config,
+    uses_file_transfer,
+)
+
+logger = logging.getLogger(__name__)
+
+FetchFunc = Callable[[DeviceTarget], Awaitable[str]]
+
+@dataclass
+class BackupResult:
+    target: DeviceTarget
+    status: BackupStatus
+    started_at: datetime
+    finished_at: datetime
+    config: Optional[str] = None
+    message: Optional[str] = None
+    config_ref: Optional[str] = None
+    lease: Optional[JobLease] = None
+
+@dataclass
+class BackupRunSummary:
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    failures: Dict[str, str] = field(default_factory=dict)
+
+def build_target(device: Device) -> DeviceTarget:
+    # Per-device credentials take precedence over the shared credential profile
+    creds = device.credentials
+    shared = device.credential
+    options = device.config or {}
+    site_id = device.site_id or (device.location.site_id if device.location else None)
+    return DeviceTarget(
+        device_id=device.id,
+        name=device.name,
+        host=device.ip_address,
+        port=int(options.get("port", settings.telnet_port if options.get("protocol") == "telnet" else settings.ssh_port)),
+        site_id=site_id,
+        device_type=device.type.value if device.type else None,
+        username=(creds and creds.username) or (shared and shared.username),
+        password=(creds and creds.password) or (shared and shared.password),
+        enable_password=shared.enable_password if shared else None,
+        ssh_key=creds.ssh_key if creds else None,
+        platform=options.get("platform"),
+        protocol=options.get("protocol", "ssh"),
+        transfer=options.get("transfer"),
+        config_file=options.get("config_file"),
+        show_commands=options.get("show_commands"),
+    )
+
+def latest_config_refs(db: Session, device_ids: Iterable[str]) -> Dict[str, str]:
+    latest = (
+        db.query(BackupHistory.device_id, func.max(BackupHistory.created_at).label("created_at"))
+        .filter(BackupHistory.device_id.in_(list(device_ids)))
+        .filter(BackupHistory.status == BackupStatus.SUCCESS)
+        .group_by(BackupHistory.device_id)
+        .subquery()
+    )
+    rows = (
+        db.query(BackupHistory.device_id, BackupHistory.config_file_path)
+        .join(latest, (BackupHistory.device_id == latest.c.device_id)
+              & (BackupHistory.created_at == latest.c.created_at))
+        .all()
+    )
+    return {device_id: ref for device_id, ref in rows if ref}
+
+def load_targets(db: Session, device_ids: Optional[Iterable[str]] = None) -> List[DeviceTarget]:
+    query = db.query(Device).options(
+        selectinload(Device.credentials),
+        selectinload(Device.credential),
+        selectinload(Device.location),
+    )
+    if device_ids is not None:
+        query = query.filter(Device.id.in_(list(device_ids)))
+    else:
+        query = query.filter(Device.status == DeviceStatus.ACTIVE)
+    targets = [build_target(device) for device in query.all()]
+    previous_refs = latest_config_refs(db, [target.device_id for target in targets])
+    for target in targets:
+        target.previous_config_ref = previous_refs.get(target.device_id)
+    return targets
+
+class BackupEngine:
+    """Collects running configs from many devices concurrently.
+
+    Concurrency is bounded globally and per site so one large site cannot
+    starve the rest of the fleet. Configs are written to the store on a
+    thread pool, and results are committed in batches by a single writer
+    thread so SSH sessions never wait on database locks.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        fetch: Optional[FetchFunc] = None,
+        max_concurrency: Optional[int] = None,
+        site_concurrency: Optional[int] = None,
+        store: Optional[BlobStore] = None,
+    ):
+        self.session_factory = session_factory
+        # SSH connections are shared by everything this engine collects from a device
+        self.pool = SSHConnectionPool()
+        self.fetch = fetch or self._fetch
+        self.max_concurrency = max_concurrency or settings.collector_max_concurrency
+        self.site_concurrency = site_concurrency or settings.collector_site_concurrency
+        self.store = store or get_blob_store()
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="backup-db")
+        self._store_executor = ThreadPoolExecutor(thread_name_prefix="backup-store")
+        self.writer = BatchWriter(session_factory, self._write_results, name="backup-writer")
+        self._limits_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._collecting: Set[str] = set()
+
+    async def run(
+        self,
+        device_ids: Optional[Iterable[str]] = None,
+        leases: Optional[Dict[str, JobLease]] = None,
+    ) -> BackupRunSummary:
+        """Back up ``device_ids`` (every active device by default).
+
+        With ``leases`` (job leases by device id), a device's result is only
+        recorded while its job's lease is still held, and finishes the job.
+        """
+        loop = asyncio.get_running_loop()
+        targets = await loop.run_in_executor(self._db_executor, self._load_targets, device_ids)
+        return await self.run_targets(targets, leases)
+
+    async def run_targets(
+        self, targets: List[DeviceTarget], leases: Optional[Dict[str, JobLease]] = None
+    ) -> BackupRunSummary:
+        global_limit, site_limits = self._limits()
+        # A device still being backed up by an earlier run is not started twice
+        busy = [target for target in targets if target.device_id in self._collecting]
+        if busy:
+            logger.warning(f"Skipped {len(busy)} devices whose previous backup is still running")
+            targets = [target for target in targets if target.device_id not in self._collecting]
+        self._collecting.update(target.device_id for target in targets)
+        summary = BackupRunSummary(total=len(targets))
+        logger.info(f"Starting backup run for {len(targets)} devices")
+
+        async def worker(target: DeviceTarget):
+            try:
+                async with site_limits[target.site_id], global_limit:
+                    result = await self._collect(target)
+                result.lease = (leases or {}).get(target.device_id)
+                await self._record(result)
+            finally:
+                self._collecting.discard(target.device_id)
+            if result.status == BackupStatus.SUCCESS:
+                summary.succeeded += 1
+            else:
+                summary.failed += 1
+                summary.failures[target.device_id] = result.message or ""
+
+        await asyncio.gather(*(worker(target) for target in targets))
+        logger.info(
+            f"Backup run finished: {summary.succeeded} succeeded, {summary.failed} failed"
+        )
+        return summary
+
+    def _limits(self) -> Tuple[asyncio.Semaphore, Dict[Optional[str], asyncio.Semaphore]]:
+        # Shared by every run on the loop, so runs started while others are
+        # still going (e.g. by the scheduler) stay within the limits together
+        loop = asyncio.get_running_loop()
+        if self._limits_loop is not loop:
+            self._limits_loop = loop
+            self._global_limit = asyncio.Semaphore(self.max_concurrency)
+            self._site_limits = defaultdict(lambda: asyncio.Semaphore(self.site_concurrency))
+        return self._global_limit, self._site_limits
+
+    async def close_connections(self):
+        await self.pool.close()
+
+    def close(self):
+        self.writer.close()
+        self._store_executor.shutdown(wait=True)
+        self._db_executor.shutdown(wait=True)
+
+    async def _collect(self, target: DeviceTarget) -> BackupResult:
+        started_at = datetime.utcnow()
+        try:
+            if uses_file_transfer(target):
+                config_ref = await self._download(target)
+                return BackupResult(target, BackupStatus.SUCCESS, started_at, datetime.utcnow(), config_ref=config_ref)
+            config = await self.fetch(target)
+            return BackupResult(target, BackupStatus.SUCCESS, started_at, datetime.utcnow(), config=config)
+        except CollectionError as e:
+            message = str(e)
+        except Exception as e:
+            logger.exception(f"Unexpected error backing up {target.name}")
+            message = f"Unexpected error: {e}"
+        logger.warning(f"Backup failed for {target.name} ({target.host}): {message}")
+        return BackupResult(target, BackupStatus.FAILED, started_at, datetime.utcnow(), message=message)
+
+    async def _record(self, result: BackupResult):
+        loop = asyncio.get_running_loop()
+        if result.status == BackupStatus.SUCCESS and result.config_ref is None:
+            try:
+                result.config_ref = await loop.run_in_executor(self._store_executor, self._store_config, result)
+            except Exception as e:
+                logger.error(f"Error storing config for {result.target.name}: {str(e)}")
+                result.status = BackupStatus.FAILED
+                result.message = f"Could not store configuration: {e}"
+        try:
+            await asyncio.wrap_future(self.writer.submit(result))
+        except Exception as e:
+            logger.error(f"Error recording backup result for {result.target.name}: {str(e)}")
+
+    async def _fetch(self, target: DeviceTarget) -> str:
+        if target.protocol == "telnet":
+            return await fetch_running_config_telnet(target)
+        return await fetch_device_config(target, self.pool)
+
+    async def _download(self, target: DeviceTarget) -> str:
+        # Streamed into the store as it arrives; the writer runs on the store threads
+        loop = asyncio.get_running_loop()
+        writer = await loop.run_in_executor(self._store_executor, self.store.writer)
+
+        async def write(chunk: bytes):
+            await loop.run_in_executor(self._store_executor, writer.write, chunk)
+
+        try:
+            await fetch_config_file(target, write, self.pool)
+            return make_ref(await loop.run_in_executor(self._store_executor, writer.commit))
+        except BaseException:
+            await loop.run_in_executor(self._store_executor, writer.abort)
+            raise
+
+    def _load_targets(self, device_ids: Optional[Iterable[str]]) -> List[DeviceTarget]:
+        db = self.session_factory()
+        try:
+            return load_targets(db, device_ids)
+        finally:
+            db.close()
+
+    def _store_config(self, result: BackupResult) -> str:
+        data = result.config.encode()
+        ref = make_ref(hash_config(data))
+        # Unchanged since the last backup: point at the existing blob
+        if ref == result.target.previous_config_ref:
+            return ref
+        base_digest = parse_ref(result.target.previous_config_ref)
+        return make_ref(self.store.put_revision(data, base_digest))
+
+    def _write_results(self, db: Session, results: List[BackupResult]):
+        leased = [result for result in results if result.lease is not None]
+        if leased:
+            # The job is finished in the same transaction as its history row is
+            # written, and only if this worker's lease is still held: once the
+            # lease expired and another worker took the job, its result is the
+            # one recorded
+            held = finish_held(db, [
+                (result.lease, None if result.status == BackupStatus.SUCCESS else result.message or "Backup failed")
+                for result in leased
+            ])
+            lost = [result.target.name for result in leased if result.lease.job_id not in held]
+            if lost:
+                logger.warning(f"Dropped backup results for {', '.join(lost)}: the job lease was lost")
+                results = [result for result in results if result.lease is None or result.lease.job_id in held]
+            if not results:
+                return
+        bulk_insert(db, BackupHistory.__table__, [
+            {
+                "id": str(uuid.uuid4()),
+                "device_id": result.target.device_id,
+                "status": result.status,
+                "message": result.message,
+                "config_file_path": result.config_ref,
+                "created_at": result.started_at,
+                "updated_at": result.finished_at,
+            }
+            for result in results
+        ])
+        backed_up = [
+            {"id": result.target.device_id, "last_backup": result.finished_at}
+            for result in results if result.status == BackupStatus.SUCCESS
+        ]
+        if backed_up:
+            # Not shown by any cached response, so the collection versions are left alone
+            db.execute(update(Device).execution_options(track_versions=False), backed_up)
+        record_backups(db, [(result.status, result.started_at) for result in results])
@@ -0,0 +1,217 @@
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+import asyncio
+import logging
+import uuid
+from sqlalchemy import and_, exists, or_, select, tuple_, update
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..database import SessionLocal
+from ..models.models import BackupJob, Device, JobStatus
+from ..storage import bulk_insert
+
+if TYPE_CHECKING:
+    from .engine import BackupRunSummary
+
+logger = logging.getLogger(__name__)
+
+# Database-backed job queue for collector workers. Enqueuing inserts one row
+# per device; a worker claims jobs by leasing them (lease_owner and
+# lease_expires_at) and renews the lease with heartbeats while it works.
+# A job whose lease runs out (the worker died or lost the database) becomes
+# claimable again, up to settings.job_max_attempts attempts. Every state
+# change is a single conditional UPDATE, so any number of workers can share
+# the queue; on PostgreSQL claims use SKIP LOCKED so workers do not contend.
+# Each claim increments attempts, which serves as the lease's fencing token.
+
+PENDING = (JobStatus.QUEUED, JobStatus.RUNNING)
+
+class JobLease(NamedTuple):
+    job_id: str
+    device_id: str
+    worker_id: str
+    attempt: int
+
+def enqueue(db: Session, devices, available_at: Optional[datetime] = None) -> int:
+    """Queue a backup of each device selected by ``devices`` (a query or select of Device.id).
+
+    Devices that already have a queued or running job are skipped. Commits,
+    and returns the number of jobs queued.
+    """
+    now = datetime.utcnow()
+    selected = devices.subquery()
+    pending = exists().where(BackupJob.device_id == selected.c.id, BackupJob.status.in_(PENDING))
+    device_ids = db.execute(select(selected.c.id).where(~pending)).scalars().all()
+    bulk_insert(db, BackupJob.__table__, [
+        {
+            "id": str(uuid.uuid4()),
+            "device_id": device_id,
+            "status": JobStatus.QUEUED,
+            "attempts": 0,
+            "available_at": available_at or now,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for device_id in device_ids
+    ])
+    db.commit()
+    return len(device_ids)
+
+def _expire(db: Session, now: datetime) -> int:
+    """Fail running jobs whose lease ran out on their last attempt."""
+    return db.execute(
+        update(BackupJob)
+        .where(
+            BackupJob.status == JobStatus.RUNNING,
+            BackupJob.lease_expires_at < now,
+            BackupJob.attempts >= settings.job_max_attempts,
+        )
+        .values(status=JobStatus.FAILED, error="Lease expired", finished_at=now, updated_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+def claim(db: Session, worker_id: str, limit: int, lease_seconds: Optional[int] = None) -> List[JobLease]:
+    """Lease up to ``limit`` available jobs to ``worker_id``."""
+    now = datetime.utcnow()
+    lease_seconds = lease_seconds or settings.job_lease_seconds
+    expired = _expire(db, now)
+    if expired:
+        logger.warning(f"Gave up on {expired} backup jobs after {settings.job_max_attempts} attempts")
+
+    available = (
+        select(BackupJob.id)
+        .where(or_(
+            and_(BackupJob.status == JobStatus.QUEUED, BackupJob.available_at <= now),
+            and_(BackupJob.status == JobStatus.RUNNING, BackupJob.lease_expires_at < now),
+        ))
+        .order_by(BackupJob.available_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    claimed = db.execute(
+        update(BackupJob)
+        .where(BackupJob.id.in_(available))
+        .values(
+            status=JobStatus.RUNNING,
+            lease_owner=worker_id,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            attempts=BackupJob.attempts + 1,
+            updated_at=now,
+        )
+        .returning(BackupJob.id, BackupJob.device_id, BackupJob.attempts)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+    return [JobLease(job_id, device_id, worker_id, attempt) for job_id, device_id, attempt in claimed]
+
+def _owned(worker_id: str, job_ids: Iterable[str]):
+    # Fencing: a worker can only change jobs it still holds the lease on
+    return and_(
+        BackupJob.id.in_(list(job_ids)),
+        BackupJob.status == JobStatus.RUNNING,
+        BackupJob.lease_owner == worker_id,
+    )
+
+def _held(leases: Iterable[JobLease]):
+    # Stricter than _owned: the job must not have been claimed again since,
+    # even by the same worker
+    return and_(
+        tuple_(BackupJob.id, BackupJob.lease_owner, BackupJob.attempts).in_(
+            [(lease.job_id, lease.worker_id, lease.attempt) for lease in leases]
+        ),
+        BackupJob.status == JobStatus.RUNNING,
+    )
+
+def heartbeat(db: Session, worker_id: str, job_ids: Iterable[str], lease_seconds: Optional[int] = None) -> int:
+    """Extend the leases ``worker_id`` holds on ``job_ids``. Returns how many it still holds."""
+    now = datetime.utcnow()
+    renewed = db.execute(
+        update(BackupJob)
+        .where(_owned(worker_id, job_ids))
+        .values(lease_expires_at=now + timedelta(seconds=lease_seconds or settings.job_lease_seconds), updated_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return renewed
+
+def complete(db: Session, worker_id: str, job_ids: Iterable[str], errors: Optional[Dict[str, str]] = None) -> int:
+    """Finish jobs: failed if the job id is in ``errors``, done otherwise."""
+    errors = errors or {}
+    now = datetime.utcnow()
+    finished = 0
+    done = [job_id for job_id in job_ids if job_id not in errors]
+    if done:
+        finished += db.execute(
+            update(BackupJob)
+            .where(_owned(worker_id, done))
+            .values(status=JobStatus.DONE, lease_expires_at=None, finished_at=now, updated_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    for job_id, error in errors.items():
+        finished += db.execute(
+            update(BackupJob)
+            .where(_owned(worker_id, [job_id]))
+            .values(status=JobStatus.FAILED, error=error, lease_expires_at=None,
+                    finished_at=now, updated_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    db.commit()
+    return finished
+
+def finish_held(db: Session, outcomes: Iterable[Tuple[JobLease, Optional[str]]]) -> Set[str]:
+    """Finish each job whose lease is still held: failed with the error if one is given, done otherwise.
+
+    Does not commit, so the caller can write the job's results in the same
+    transaction. Returns the ids of the jobs finished; results for any other
+    job must be dropped, as another worker has taken it.
+    """
+    now = datetime.utcnow()
+    outcomes = list(outcomes)
+    finished: Set[str] = set()
+    done = [lease for lease, error in outcomes if error is None]
+    if done:
+        finished.update(db.execute(
+            update(BackupJob)
+            .where(_held(done))
+            .values(status=JobStatus.DONE, lease_expires_at=None, finished_at=now, updated_at=now)
+            .returning(BackupJob.id)
+            .execution_options(synchronize_session=False)
+        ).scalars())
+    for lease, error in outcomes:
+        if error is None:
+            continue
+        finished.update(db.execute(
+            update(BackupJob)
+            .where(_held([lease]))
+            .values(status=JobStatus.FAILED, error=error, lease_expires_at=None,
+                    finished_at=now, updated_at=now)
+            .returning(BackupJob.id)
+            .execution_options(synchronize_session=False)
+        ).scalars())
+    return finished
+
+class QueueDispatcher:
+    """Takes the place of BackupEngine in the scheduler: due devices are queued for workers."""
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+
+    def _enqueue(self, device_ids: List[str]) -> int:
+        db = self.session_factory()
+        try:
+            return enqueue(db, select(Device.id).where(Device.id.in_(device_ids)))
+        finally:
+            db.close()
+
+    async def run(self, device_ids: Iterable[str]) -> "BackupRunSummary":
+        from .engine import BackupRunSummary
+        device_ids = list(device_ids)
+        queued = await asyncio.get_running_loop().run_in_executor(None, self._enqueue, device_ids)
+        logger.info(f"Queued backups of {queued} devices")
+        return BackupRunSummary(total=len(device_ids))
+
+    async def close_connections(self):
+        pass
+
+    def close(self):
+        pass
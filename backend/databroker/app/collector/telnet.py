@@ -0,0 +1,167 @@
+from typing import Optional
+import asyncio
+import re
+from ..config import settings
+from .transport import CliSession, CollectionError, DeviceTarget, target_driver
+
+# Telnet transport for devices without SSH. Each session is a pair of asyncio
+# streams, so any number of slow devices only cost sockets, not threads.
+# Option negotiation is handled inline by TelnetStream, which presents plain
+# data to CliSession like the SSH channel does.
+
+IAC, DONT, DO, WONT, WILL, SB, SE = 255, 254, 253, 252, 251, 250, 240
+ECHO, SGA, TTYPE, NAWS = 1, 3, 24, 31
+TTYPE_SEND = 1
+
+# Options the device may enable on its side, and options we agree to enable
+ACCEPTED_REMOTE = {ECHO, SGA}
+ACCEPTED_LOCAL = {SGA, TTYPE, NAWS}
+TERMINAL_TYPE = b"VT100"
+WINDOW_SIZE = (511, 24)
+
+USERNAME_PROMPT = re.compile(rb"(?i)(?:user ?name|login):\s*\Z")
+PASSWORD_PROMPT = re.compile(rb"(?i)password:\s*\Z")
+LOGIN_FAILED = re.compile(rb"(?i)(?:login invalid|authentication failed|access denied|login incorrect)")
+
+class TelnetStream:
+    """Reads data from a Telnet connection, answering option negotiation as it arrives."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        # Parser state, kept across reads since commands can be split between packets
+        self._command = bytearray()
+        self._subnegotiation: Optional[bytearray] = None
+        self._subnegotiation_iac = False
+        # Options enabled on the device's side and on ours
+        self._remote = set()
+        self._local = set()
+
+    async def read(self, n: int) -> bytes:
+        while True:
+            chunk = await self._reader.read(n)
+            if not chunk:
+                return b""
+            data = self._parse(chunk)
+            if data:
+                return data
+
+    def write(self, data: bytes):
+        # Lines end in CR LF and a literal 0xFF is doubled
+        self._writer.write(data.replace(b"\xff", b"\xff\xff").replace(b"\n", b"\r\n"))
+
+    def _send(self, *command: int):
+        self._writer.write(bytes((IAC, *command)))
+
+    def _parse(self, chunk: bytes) -> bytes:
+        if not self._command and self._subnegotiation is None and IAC not in chunk:
+            return chunk
+        data = bytearray()
+        for byte in chunk:
+            if self._subnegotiation is not None:
+                self._subnegotiation_byte(byte)
+            elif self._command:
+                if self._command == bytes((IAC,)) and byte == IAC:
+                    # An escaped 0xFF data byte
+                    data.append(IAC)
+                    self._command.clear()
+                else:
+                    self._command.append(byte)
+                    self._handle_command()
+            elif byte == IAC:
+                self._command.append(byte)
+            else:
+                data.append(byte)
+        return bytes(data)
+
+    def _handle_command(self):
+        command = self._command
+        if len(command) == 2:
+            if command[1] == SB:
+                self._subnegotiation = bytearray()
+                self._subnegotiation_iac = False
+                command.clear()
+            elif command[1] not in (DO, DONT, WILL, WONT):
+                # NOP, GA and other two-byte commands
+                command.clear()
+            return
+        verb, option = command[1], command[2]
+        command.clear()
+        # Only changes of state are answered, so negotiation cannot loop
+        if verb == WILL and option not in self._remote:
+            if option in ACCEPTED_REMOTE:
+                self._remote.add(option)
+                self._send(DO, option)
+            else:
+                self._send(DONT, option)
+        elif verb == WONT and option in self._remote:
+            self._remote.discard(option)
+            self._send(DONT, option)
+        elif verb == DO and option not in self._local:
+            if option in ACCEPTED_LOCAL:
+                self._local.add(option)
+                self._send(WILL, option)
+                if option == NAWS:
+                    width, height = WINDOW_SIZE
+                    size = bytes((width >> 8, width & 0xFF, height >> 8, height & 0xFF))
+                    self._writer.write(bytes((IAC, SB, NAWS)) + size.replace(b"\xff", b"\xff\xff") + bytes((IAC, SE)))
+            else:
+                self._send(WONT, option)
+        elif verb == DONT and option in self._local:
+            self._local.discard(option)
+            self._send(WONT, option)
+
+    def _subnegotiation_byte(self, byte: int):
+        sub = self._subnegotiation
+        if self._subnegotiation_iac:
+            self._subnegotiation_iac = False
+            if byte == SE:
+                self._subnegotiation = None
+                self._subnegotiate(bytes(sub))
+                return
+            sub.append(byte)
+        elif byte == IAC:
+            self._subnegotiation_iac = True
+        else:
+            sub.append(byte)
+
+    def _subnegotiate(self, payload: bytes):
+        if payload[:2] == bytes((TTYPE, TTYPE_SEND)):
+            self._writer.write(bytes((IAC, SB, TTYPE, 0)) + TERMINAL_TYPE + bytes((IAC, SE)))
+
+    def close(self):
+        self._writer.close()
+
+async def fetch_running_config_telnet(target: DeviceTarget) -> str:
+    """Log in over Telnet and collect the configuration with the device's driver."""
+    driver = target_driver(target)
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(target.host, target.port),
+            timeout=settings.collector_connect_timeout,
+        )
+    except asyncio.TimeoutError:
+        raise CollectionError(f"Timed out connecting to {target.host}:{target.port}")
+    except OSError as e:
+        raise CollectionError(f"Could not connect to {target.host}:{target.port}: {e}")
+
+    stream = TelnetStream(reader, writer)
+    try:
+        session = CliSession(stream, stream, driver, target.host)
+        output = await session.read_until(
+            USERNAME_PROMPT, PASSWORD_PROMPT, driver.prompt, timeout=settings.collector_connect_timeout
+        )
+        if USERNAME_PROMPT.search(output):
+            output = await session.send(target.username or "", PASSWORD_PROMPT, driver.prompt)
+        if PASSWORD_PROMPT.search(output):
+            output = await session.send(target.password or "", USERNAME_PROMPT, PASSWORD_PROMPT, driver.prompt)
+        if not driver.prompt.search(output) or LOGIN_FAILED.search(output):
+            raise CollectionError(f"Telnet login to {target.host} failed")
+        await session.open(target.enable_password, output)
+        config = await session.run(driver.config_command)
+        stream.write(b"exit\n")
+        return config
+    except OSError as e:
+        raise CollectionError(f"Telnet error on {target.host}: {e}")
+    finally:
+        stream.close()
@@ -0,0 +1,442 @@
+from dataclasses import dataclass
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Pattern, Protocol, Set
+import asyncio
+import asyncssh
+import logging
+import re
+import shlex
+import zlib
+from ..config import settings
+from .drivers import Driver, get_driver
+
+logger = logging.getLogger(__name__)
+
+class CollectionError(Exception):
+    pass
+
+@dataclass
+class DeviceTarget:
+    device_id: str
+    name: str
+    host: str
+    port: int
+    site_id: Optional[str] = None
+    device_type: Optional[str] = None
+    username: Optional[str] = None
+    password: Optional[str] = None
+    enable_password: Optional[str] = None
+    ssh_key: Optional[str] = None
+    # Driver name (see drivers.py); derived from device_type when unset
+    platform: Optional[str] = None
+    # "ssh" or "telnet", for the CLI
+    protocol: str = "ssh"
+    # "cli" (default), or "sftp" / "scp" to download the config as a file
+    transfer: Optional[str] = None
+    # File to download; the driver's config_file when unset
+    config_file: Optional[str] = None
+    # Show commands backed up with the config; the driver's when unset
+    show_commands: Optional[List[str]] = None
+    previous_config_ref: Optional[str] = None
+
+# Interactive CLI sessions, independent of the transport underneath. Output
+# is read in large chunks into one buffer, and only the tail of the buffer is
+# searched for the prompt, so reading a config costs one regex search per
+# chunk rather than per line, and no fixed sleeps are needed: a command is
+# complete as soon as its prompt arrives.
+
+READ_SIZE = 64 * 1024
+# Longest prompt (or pager prompt) looked for at the end of the output
+PROMPT_WINDOW = 256
+
+_ANSI_ESCAPE = re.compile(rb"\x1b\[[0-9;?]*[A-Za-z]")
+_PAGER_ERASE = re.compile(rb"^(?:\x08+ *\x08*|\r *\r?)")
+
+class Reader(Protocol):
+    async def read(self, n: int) -> bytes: ...
+
+class Writer(Protocol):
+    def write(self, data: bytes) -> None: ...
+
+def exact_prompt(output: bytes) -> Pattern[bytes]:
+    """A pattern for exactly the prompt ``output`` ends with (its last line, e.g. b"router1#")."""
+    line = output.rsplit(b"\n", 1)[-1].lstrip(b"\r")
+    return re.compile(rb"\n\r*" + re.escape(line) + rb"\Z")
+
+class CliSession:
+    def __init__(self, reader: Reader, writer: Writer, driver: Driver, name: str, timeout: Optional[float] = None):
+        self.reader = reader
+        self.writer = writer
+        self.driver = driver
+        self.name = name
+        self.timeout = timeout or settings.collector_command_timeout
+        # The device's own prompt, known once open() has seen it. The driver's
+        # pattern matches any hostname, so a config line that looks like a
+        # prompt could end a read early if it happened to end a chunk.
+        self.prompt: Optional[Pattern[bytes]] = None
+
+    async def read_until(self, *patterns: Pattern[bytes], timeout: Optional[float] = None) -> bytes:
+        """Read until the output ends with one of ``patterns``; pager prompts are answered and removed."""
+        buffer = bytearray(b"\n")
+        paged = False
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        while True:
+            try:
+                chunk = await asyncio.wait_for(self.reader.read(READ_SIZE), max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                raise CollectionError(f"Timed out waiting for a prompt from {self.name}")
+            if not chunk:
+                raise CollectionError(f"Connection to {self.name} closed")
+            chunk = _ANSI_ESCAPE.sub(b"", chunk)
+            if paged:
+                # Drop the sequence that erases the pager prompt
+                chunk = _PAGER_ERASE.sub(b"", chunk, count=1)
+                paged = False
+            buffer += chunk
+
+            tail = bytes(buffer[-PROMPT_WINDOW:])
+            if any(pattern.search(tail) for pattern in patterns):
+                return bytes(buffer[1:])
+            more = self.driver.more_prompt.search(tail) if self.driver.more_prompt else None
+            if more:
+                del buffer[len(buffer) - len(tail) + more.start():]
+                self.writer.write(b" ")
+                paged = True
+
+    async def send(self, command: str, *expect: Pattern[bytes]) -> bytes:
+        self.writer.write(command.encode() + b"\n")
+        return await self.read_until(*(expect or (self.prompt or self.driver.prompt,)))
+
+    async def open(self, enable_password: Optional[str] = None, output: Optional[bytes] = None):
+        """Wait for the first prompt, enter privileged mode if needed and disable paging.
+
+        ``output`` is the output up to the first prompt, if the caller already read it (e.g. a login).
+        """
+        driver = self.driver
+        if output is None:
+            output = await self.read_until(driver.prompt, timeout=settings.collector_connect_timeout)
+        if driver.privileged_prompt and not driver.privileged_prompt.search(output):
+            output = await self.send(driver.enable_command, driver.prompt, driver.password_prompt)
+            if driver.password_prompt.search(output):
+                output = await self.send(enable_password or "", driver.prompt, driver.password_prompt)
+            if not driver.privileged_prompt.search(output):
+                raise CollectionError(f"Could not enter privileged mode on {self.name}")
+        # Commands from here on end at exactly this prompt
+        self.prompt = exact_prompt(output)
+        # Not every software version knows every paging command; the pager is answered anyway
+        for command in driver.paging_commands:
+            await self.send(command)
+
+    async def run(self, command: str) -> str:
+        """Run a command and return its output, without the echoed command and the prompt."""
+        output = (await self.send(command)).replace(b"\r\n", b"\n").replace(b"\r", b"")
+        body = output[output.find(b"\n") + 1:output.rfind(b"\n")]
+        if self.driver.error and self.driver.error.search(body):
+            raise CollectionError(f"'{command}' failed on {self.name}: {body.strip().decode(errors='replace')}")
+        return body.rstrip(b"\n").decode(errors="replace") + "\n"
+
+_warned_unverified = False
+
+def known_hosts():
+    """The ``known_hosts`` argument for asyncssh: the configured file, the user's, or None to skip checking."""
+    global _warned_unverified
+    if settings.ssh_verify_host_keys:
+        # () is asyncssh's default, ~/.ssh/known_hosts; a device not listed fails to connect
+        return settings.ssh_known_hosts or ()
+    if not _warned_unverified:
+        logger.warning("SSH host key checking is off (NETBACKUP_SSH_VERIFY_HOST_KEYS=false): "
+                       "device connections are not protected against interception")
+        _warned_unverified = True
+    return None
+
+async def connect_ssh(target: DeviceTarget) -> asyncssh.SSHClientConnection:
+    client_keys = [asyncssh.import_private_key(target.ssh_key)] if target.ssh_key else None
+    try:
+        return await asyncio.wait_for(
+            asyncssh.connect(
+                target.host,
+                port=target.port,
+                username=target.username,
+                password=target.password,
+                client_keys=client_keys,
+                known_hosts=known_hosts(),
+            ),
+            timeout=settings.collector_connect_timeout,
+        )
+    except asyncio.TimeoutError:
+        raise CollectionError(f"Timed out connecting to {target.host}:{target.port}")
+    except (OSError, asyncssh.Error) as e:
+        raise CollectionError(f"Could not connect to {target.host}:{target.port}: {e}")
+
+def target_driver(target: DeviceTarget) -> Driver:
+    try:
+        return get_driver(target.platform, target.device_type)
+    except ValueError as e:
+        raise CollectionError(str(e))
+
+# Connection reuse. One authenticated SSH connection per device is shared by
+# every collection task for that device, each on its own channel, so a backup
+# plus several show commands cost one TCP and SSH handshake. A connection is
+# kept after its sessions end, for the device's next backup or job, until it
+# has been idle for the TTL. The channels open at once on one device are
+# capped, since small control planes limit concurrent sessions.
+
+class _PooledConnection:
+    def __init__(self, conn: asyncssh.SSHClientConnection, max_sessions: int):
+        self.conn = conn
+        self.sessions = asyncio.Semaphore(max_sessions)
+        self.active = 0
+        self.idle_since = asyncio.get_running_loop().time()
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+        self.conn.close()
+
+class SSHConnectionPool:
+    def __init__(self, idle_ttl: Optional[float] = None, max_sessions: Optional[int] = None):
+        self.idle_ttl = settings.ssh_idle_ttl if idle_ttl is None else idle_ttl
+        self.max_sessions = max_sessions or settings.ssh_max_sessions_per_device
+        self._connections: Dict[tuple, _PooledConnection] = {}
+        self._locks: Dict[tuple, asyncio.Lock] = {}
+        # Tasks watching for connections to close; referenced so they are not garbage collected
+        self._watchers: Set[asyncio.Task] = set()
+        self._reaper: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @staticmethod
+    def _key(target: DeviceTarget) -> tuple:
+        return (target.device_id, target.host, target.port, target.username)
+
+    async def _get(self, target: DeviceTarget) -> _PooledConnection:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Connections made in another (finished) event loop cannot be used
+            self._loop = loop
+            self._connections, self._locks, self._watchers, self._reaper = {}, {}, set(), None
+        key = self._key(target)
+        pooled = self._connections.get(key)
+        if pooled is not None and not pooled.closed:
+            return pooled
+        # Concurrent tasks for a new device wait for one handshake instead of each making one
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            pooled = self._connections.get(key)
+            if pooled is not None and not pooled.closed:
+                return pooled
+            pooled = _PooledConnection(await connect_ssh(target), self.max_sessions)
+            self._connections[key] = pooled
+            watcher = asyncio.create_task(self._forget_when_closed(key, pooled))
+            self._watchers.add(watcher)
+            watcher.add_done_callback(self._watchers.discard)
+            if self._reaper is None or self._reaper.done():
+                self._reaper = asyncio.create_task(self._close_idle())
+            return pooled
+
+    def _forget(self, key: tuple, pooled: _PooledConnection):
+        if self._connections.get(key) is pooled:
+            del self._connections[key]
+            self._locks.pop(key, None)
+
+    async def _forget_when_closed(self, key: tuple, pooled: _PooledConnection):
+        await pooled.conn.wait_closed()
+        pooled.closed = True
+        self._forget(key, pooled)
+
+    async def _close_idle(self):
+        while self._connections:
+            await asyncio.sleep(max(self.idle_ttl / 2, 0.1))
+            now = asyncio.get_running_loop().time()
+            for pooled in list(self._connections.values()):
+                if pooled.active == 0 and now - pooled.idle_since >= self.idle_ttl:
+                    pooled.close()
+
+    async def connect(self, target: DeviceTarget):
+        """Open the device's connection ahead of its sessions, so one that fails does so once."""
+        await self._get(target)
+
+    @asynccontextmanager
+    async def connection(self, target: DeviceTarget) -> AsyncIterator[asyncssh.SSHClientConnection]:
+        """The device's shared connection, held for one session (channel)."""
+        pooled = await self._get(target)
+        async with pooled.sessions:
+            pooled.active += 1
+            try:
+                yield pooled.conn
+            finally:
+                pooled.active -= 1
+                pooled.idle_since = asyncio.get_running_loop().time()
+
+    async def close(self):
+        connections = list(self._connections.values())
+        self._connections.clear()
+        for pooled in connections:
+            pooled.close()
+        for pooled in connections:
+            await pooled.conn.wait_closed()
+        if self._reaper is not None:
+            self._reaper.cancel()
+
+@asynccontextmanager
+async def ssh_connection(target: DeviceTarget, pool: Optional[SSHConnectionPool] = None) -> AsyncIterator[asyncssh.SSHClientConnection]:
+    """A pooled connection to the device, or a new one closed afterwards when there is no pool."""
+    if pool is not None:
+        async with pool.connection(target) as conn:
+            yield conn
+        return
+    conn = await connect_ssh(target)
+    async with conn:
+        yield conn
+
+async def _cli_session(conn: asyncssh.SSHClientConnection, target: DeviceTarget, driver: Driver):
+    # Binary streams: output is decoded once, after the prompt is found
+    process = await conn.create_process(term_type="vt100", term_size=(511, 24), encoding=None)
+    session = CliSession(process.stdout, process.stdin, driver, target.host)
+    await session.open(target.enable_password)
+    return process, session
+
+async def fetch_running_config(target: DeviceTarget, pool: Optional[SSHConnectionPool] = None) -> str:
+    """Collect the configuration through an interactive shell, driven by the device's driver."""
+    driver = target_driver(target)
+    try:
+        async with ssh_connection(target, pool) as conn:
+            process, session = await _cli_session(conn, target, driver)
+            async with process:
+                config = await session.run(driver.config_command)
+                process.stdin.write(b"exit\n")
+                return config
+    except asyncssh.Error as e:
+        raise CollectionError(f"SSH error on {target.host}: {e}")
+
+async def run_commands(target: DeviceTarget, commands: List[str], pool: Optional[SSHConnectionPool] = None) -> Dict[str, str]:
+    """Run show commands, each in its own channel on the device's (shared) connection."""
+    driver = target_driver(target)
+
+    async def run(command: str) -> str:
+        async with ssh_connection(target, pool) as conn:
+            process, session = await _cli_session(conn, target, driver)
+            async with process:
+                output = await session.run(command)
+                process.stdin.write(b"exit\n")
+                return output
+
+    try:
+        outputs = await asyncio.gather(*(run(command) for command in commands))
+    except asyncssh.Error as e:
+        raise CollectionError(f"SSH error on {target.host}: {e}")
+    return dict(zip(commands, outputs))
+
+def show_header(driver: Driver, outputs: Dict[str, str]) -> str:
+    """Show command output as comment lines to put above the config, without volatile lines."""
+    lines = []
+    for command, output in outputs.items():
+        lines.append(f"{driver.comment} {command}")
+        for line in output.splitlines():
+            if not (driver.volatile and driver.volatile.search(line)):
+                lines.append(f"{driver.comment} {line}".rstrip())
+        lines.append(driver.comment)
+    return "".join(line + "\n" for line in lines)
+
+async def fetch_device_config(target: DeviceTarget, pool: Optional[SSHConnectionPool] = None) -> str:
+    """The running config, headed by the output of the device's show commands.
+
+    The show commands run at the same time as the config, on channels of the
+    same pooled connection. A show command the device rejects is left out.
+    """
+    driver = target_driver(target)
+    commands = driver.show_commands if target.show_commands is None else target.show_commands
+
+    async def show(command: str) -> Optional[str]:
+        try:
+            return (await run_commands(target, [command], pool))[command]
+        except CollectionError as e:
+            logger.warning(f"Leaving '{command}' out of the backup of {target.name}: {e}")
+            return None
+
+    if pool is not None and commands:
+        await pool.connect(target)
+    config, *outputs = await asyncio.gather(
+        fetch_running_config(target, pool), *(show(command) for command in commands)
+    )
+    header = show_header(driver, {
+        command: output for command, output in zip(commands, outputs) if output is not None
+    })
+    return header + config
+
+# File transfer: the configuration is downloaded as a file and passed on in
+# chunks as they arrive, e.g. into a BlobWriter, so it is never held in
+# memory and no CLI session is needed. Gzipped files are decompressed on the fly.
+
+TRANSFER_CHUNK = 256 * 1024
+
+ChunkSink = Callable[[bytes], Awaitable[None]]
+
+def uses_file_transfer(target: DeviceTarget) -> bool:
+    return target.transfer in ("sftp", "scp")
+
+async def fetch_config_file(target: DeviceTarget, sink: ChunkSink, pool: Optional[SSHConnectionPool] = None) -> int:
+    """Download the device's config file over SFTP or SCP into ``sink``. Returns the bytes received."""
+    path = target.config_file or target_driver(target).config_file
+    if not path:
+        raise CollectionError(f"No config file known for {target.host}; set config_file for {target.transfer}")
+    decompressor = None
+    if path.endswith(".gz"):
+        decompressor = zlib.decompressobj(wbits=31)
+        raw_sink = sink
+        async def sink(chunk: bytes):
+            await raw_sink(decompressor.decompress(chunk))
+
+    try:
+        async with ssh_connection(target, pool) as conn:
+            download = _download_sftp if target.transfer == "sftp" else _download_scp
+            received = await asyncio.wait_for(download(conn, path, sink), settings.collector_command_timeout)
+        if decompressor is not None:
+            tail = decompressor.flush()
+            if tail:
+                await raw_sink(tail)
+            if not decompressor.eof:
+                raise CollectionError(f"{path} from {target.host} is truncated")
+        return received
+    except asyncio.TimeoutError:
+        raise CollectionError(f"Timed out downloading {path} from {target.host}")
+    except zlib.error as e:
+        raise CollectionError(f"{path} from {target.host} is not valid gzip: {e}")
+    except (OSError, asyncssh.Error) as e:
+        raise CollectionError(f"Could not download {path} from {target.host}: {e}")
+
+async def _download_sftp(conn: asyncssh.SSHClientConnection, path: str, sink: ChunkSink) -> int:
+    received = 0
+    async with conn.start_sftp_client() as sftp:
+        async with sftp.open(path, "rb") as f:
+            while True:
+                chunk = await f.read(TRANSFER_CHUNK)
+                if not chunk:
+                    return received
+                received += len(chunk)
+                await sink(chunk)
+
+async def _download_scp(conn: asyncssh.SSHClientConnection, path: str, sink: ChunkSink) -> int:
+    # The source side of the SCP protocol: acknowledge, read the "C<mode> <size> <name>"
+    # header, then exactly <size> bytes followed by a status byte
+    process = await conn.create_process(f"scp -f {shlex.quote(path)}", encoding=None)
+    async with process:
+        process.stdin.write(b"\0")
+        header = await process.stdout.readline()
+        if not header.startswith(b"C"):
+            raise CollectionError(f"SCP refused {path}: {header[1:].strip().decode(errors='replace') or 'no response'}")
+        remaining = int(header.split(b" ", 2)[1])
+        process.stdin.write(b"\0")
+        received = 0
+        while remaining:
+            chunk = await process.stdout.read(min(TRANSFER_CHUNK, remaining))
+            if not chunk:
+                raise CollectionError(f"SCP transfer of {path} ended early")
+            remaining -= len(chunk)
+            received += len(chunk)
+            await sink(chunk)
+        status = await process.stdout.readexactly(1)
+        if status != b"\0":
+            raise CollectionError(f"SCP transfer of {path} failed")
+        process.stdin.write(b"\0")
+        process.stdin.write_eof()
+        return received
@@ -0,0 +1,137 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..database import SessionLocal
+from . import queue
+from .engine import BackupEngine
+
+logger = logging.getLogger(__name__)
+
+class CollectorWorker:
+    """Runs backup jobs from the queue; any number of workers can run on different hosts.
+
+    A worker leases a batch of jobs, backs the devices up with its own
+    BackupEngine and renews the leases while the batch runs. Each result
+    goes to BackupHistory as usual, in the transaction that finishes its
+    job, unless the lease has been lost meanwhile. If the worker dies, its
+    leases expire and other workers retry the jobs.
+    """
+
+    def __init__(
+        self,
+        engine: Optional[BackupEngine] = None,
+        session_factory: Callable[[], Session] = SessionLocal,
+        worker_id: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        lease_seconds: Optional[int] = None,
+        heartbeat_interval: Optional[float] = None,
+        poll_interval: Optional[float] = None,
+    ):
+        self.engine = engine or BackupEngine(session_factory=session_factory)
+        self.session_factory = session_factory
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.batch_size = batch_size or settings.worker_batch_size
+        self.lease_seconds = lease_seconds or settings.job_lease_seconds
+        self.heartbeat_interval = heartbeat_interval or settings.job_heartbeat_interval
+        self.poll_interval = poll_interval or settings.worker_poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="collector-worker")
+        self._stopped = False
+
+    async def _db(self, func, *args):
+        def call():
+            db = self.session_factory()
+            try:
+                return func(db, *args)
+            finally:
+                db.close()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    async def _heartbeat(self, job_ids: List[str]):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                held = await self._db(queue.heartbeat, self.worker_id, job_ids, self.lease_seconds)
+            except Exception as e:
+                logger.error(f"Error renewing job leases: {str(e)}")
+                continue
+            if held < len(job_ids):
+                logger.warning(f"Lost the lease on {len(job_ids) - held} of {len(job_ids)} jobs")
+
+    async def run_once(self) -> int:
+        """Claim and run one batch of jobs. Returns the number of jobs claimed."""
+        jobs = await self._db(queue.claim, self.worker_id, self.batch_size, self.lease_seconds)
+        if not jobs:
+            return 0
+        leases = {lease.device_id: lease for lease in jobs}
+        job_ids = {device_id: lease.job_id for device_id, lease in leases.items()}
+        logger.info(f"Worker {self.worker_id} claimed {len(jobs)} backup jobs")
+
+        heartbeat = asyncio.create_task(self._heartbeat(list(job_ids.values())))
+        try:
+            # Each result is written only while its lease is held, and finishes its job
+            summary = await self.engine.run(list(leases), leases=leases)
+        finally:
+            heartbeat.cancel()
+        # Finishes the jobs left without a recorded result (e.g. the device was deleted)
+        errors: Dict[str, str] = {
+            job_ids[device_id]: message or "Backup failed" for device_id, message in summary.failures.items()
+        }
+        await self._db(queue.complete, self.worker_id, list(job_ids.values()), errors)
+        return len(jobs)
+
+    async def run(self, until_empty: bool = False):
+        """Work until stop() is called, or until the queue is empty with ``until_empty``."""
+        try:
+            while not self._stopped:
+                try:
+                    claimed = await self.run_once()
+                except Exception as e:
+                    logger.error(f"Error in collector worker: {str(e)}")
+                    claimed = 0
+                if claimed:
+                    continue
+                if until_empty:
+                    return
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            await self.engine.close_connections()
+
+    def stop(self):
+        self._stopped = True
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.engine.close()
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
+    )
+    parser = argparse.ArgumentParser(description="Run backup jobs from the queue")
+    parser.add_argument("--until-empty", action="store_true", help="Exit when no jobs are available")
+    parser.add_argument("--batch-size", type=int, help="Jobs leased at a time")
+    parser.add_argument("--max-concurrency", type=int, help="Global limit on concurrent sessions")
+    parser.add_argument("--site-concurrency", type=int, help="Limit on concurrent sessions per site")
+    args = parser.parse_args()
+
+    worker = CollectorWorker(
+        BackupEngine(max_concurrency=args.max_concurrency, site_concurrency=args.site_concurrency),
+        batch_size=args.batch_size,
+    )
+    try:
+        asyncio.run(worker.run(until_empty=args.until_empty))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+from typing import Optional
+import hashlib
+import logging
+import os
+import tempfile
+import zlib
+from ..config import settings
+from .deltas import apply_delta, decode_delta, encode_delta, make_delta
+
+logger = logging.getLogger(__name__)
+
+# BackupHistory.config_file_path holds "sha256:<hex>" for content-addressed configs.
+# Anything else is treated as a legacy plain file path.
+REF_PREFIX = "sha256:"
+
+def make_ref(digest: str) -> str:
+    return f"{REF_PREFIX}{digest}"
+
+def parse_ref(ref: Optional[str]) -> Optional[str]:
+    if ref and ref.startswith(REF_PREFIX):
+        return ref[len(REF_PREFIX):]
+    return None
+
+class ConfigTooLarge(ValueError):
+    pass
+
+def hash_config(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+class BlobStore:
+    """Content-addressed store for configuration files.
+
+    Blobs are keyed by the SHA-256 of their uncompressed content, zlib
+    compressed, and sharded into two levels of hash-prefix directories.
+    Writing content that is already present is a no-op.
+
+    A revision can be stored either as a full snapshot (``<digest>``) or as a
+    line delta against the previous revision of the same device
+    (``<digest>.delta``). A full snapshot is forced every
+    ``keyframe_interval`` revisions, so reading any revision costs at most
+    one snapshot read plus ``keyframe_interval`` delta applications.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        compression_level: int = 6,
+        keyframe_interval: int = 30,
+        max_delta_ratio: float = 0.5,
+    ):
+        self.root = root
+        self.compression_level = compression_level
+        self.keyframe_interval = keyframe_interval
+        self.max_delta_ratio = max_delta_ratio
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def delta_path(self, digest: str) -> str:
+        return self.path(digest) + ".delta"
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest)) or os.path.exists(self.delta_path(digest))
+
+    def put(self, data: bytes) -> str:
+        digest = hash_config(data)
+        if not self.exists(digest):
+            self._write(self.path(digest), zlib.compress(data, self.compression_level))
+        return digest
+
+    def writer(self) -> "BlobWriter":
+        return BlobWriter(self)
+
+    def put_revision(self, data: bytes, base_digest: Optional[str] = None) -> str:
+        digest = hash_config(data)
+        if self.exists(digest):
+            return digest
+        if base_digest is None or not self.exists(base_digest):
+            return self.put(data)
+
+        depth = self._depth(base_digest) + 1
+        if depth >= self.keyframe_interval:
+            return self.put(data)
+
+        ops = make_delta(self.get(base_digest), data)
+        payload = zlib.compress(encode_delta(base_digest, depth, ops), self.compression_level)
+        # Deltas that barely save anything are not worth the reconstruction cost
+        if len(payload) > self.max_delta_ratio * len(zlib.compress(data, 1)):
+            return self.put(data)
+        self._write(self.delta_path(digest), payload)
+        return digest
+
+    def get(self, digest: str, max_size: Optional[int] = None) -> bytes:
+        """The content of a revision; raises ConfigTooLarge past ``max_size`` bytes.
+
+        The limit is checked while decompressing and after every delta, so
+        an oversized revision is rejected without being rebuilt in full.
+        """
+        chain = []
+        while True:
+            try:
+                with open(self.path(digest), "rb") as f:
+                    compressed = f.read()
+                break
+            except FileNotFoundError:
+                delta = self._read_delta(digest)
+                chain.append(delta["ops"])
+                digest = delta["base"]
+        if max_size is None:
+            data = zlib.decompress(compressed)
+        else:
+            data = zlib.decompressobj().decompress(compressed, max_size + 1)
+            _check_size(data, max_size)
+        for ops in reversed(chain):
+            data = apply_delta(data, ops)
+            _check_size(data, max_size)
+        return data
+
+    def _depth(self, digest: str) -> int:
+        if os.path.exists(self.path(digest)):
+            return 0
+        return self._read_delta(digest)["depth"]
+
+    def _read_delta(self, digest: str) -> dict:
+        with open(self.delta_path(digest), "rb") as f:
+            return decode_delta(zlib.decompress(f.read()))
+
+    def _write(self, path: str, payload: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+class BlobWriter:
+    """Streams a full snapshot into a store.
+
+    Data is hashed and compressed as it is written, into a temp file that
+    commit() renames to the blob's path, so a config of any size is never
+    held in memory. Streamed configs are not stored as deltas, since a
+    delta needs the whole config to compare.
+    """
+
+    def __init__(self, store: BlobStore):
+        self.store = store
+        os.makedirs(store.root, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=store.root, prefix=".tmp-")
+        self.file = os.fdopen(fd, "wb")
+        self.hash = hashlib.sha256()
+        self.compressor = zlib.compressobj(store.compression_level)
+        self.size = 0
+
+    def write(self, data: bytes):
+        self.hash.update(data)
+        self.size += len(data)
+        self.file.write(self.compressor.compress(data))
+
+    def commit(self) -> str:
+        """Finish the blob and return its digest."""
+        self.file.write(self.compressor.flush())
+        self.file.close()
+        digest = self.hash.hexdigest()
+        if self.store.exists(digest):
+            os.remove(self.tmp_path)
+            return digest
+        path = self.store.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self.tmp_path, path)
+        return digest
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+_default_store: Optional[BlobStore] = None
+
+def get_blob_store() -> BlobStore:
+    global _default_store
+    if _default_store is None:
+        _default_store = BlobStore(
+            os.path.join(settings.backup_dir, "objects"),
+            keyframe_interval=settings.config_keyframe_interval,
+        )
+    return _default_store
+
+def _check_size(data: bytes, max_size: Optional[int]):
+    if max_size is not None and len(data) > max_size:
+        raise ConfigTooLarge(f"configuration is larger than {max_size} bytes")
+
+def read_config(ref: str, store: Optional[BlobStore] = None, max_size: Optional[int] = None) -> bytes:
+    digest = parse_ref(ref)
+    if digest is None:
+        with open(ref, "rb") as f:
+            data = f.read(max_size + 1) if max_size is not None else f.read()
+        _check_size(data, max_size)
+        return data
+    return (store or get_blob_store()).get(digest, max_size)
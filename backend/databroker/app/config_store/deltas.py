@@ -0,0 +1,74 @@
+from typing import List, Tuple, Union
+import json
+
+# A delta is a list of operations applied to the lines of a base revision:
+#   ["c", start, end]  copy base lines [start:end)
+#   ["i", [lines]]     insert new lines
+# Lines keep their line endings and are carried as latin-1 text so any byte
+# sequence round-trips through JSON unchanged.
+DeltaOp = Union[Tuple[str, int, int], Tuple[str, List[str]]]
+
+# Number of consecutive lines used to find a copy source in the base revision
+BLOCK_LINES = 3
+
+def split_lines(data: bytes) -> List[bytes]:
+    return data.splitlines(keepends=True)
+
+def make_delta(base: bytes, target: bytes) -> List[DeltaOp]:
+    """Greedy line-block delta, linear in the size of both revisions.
+
+    Configs usually change a handful of lines between backups, so the delta
+    is found by continuing the current copy run where possible and otherwise
+    looking up the next block of target lines in a hash index of the base.
+    """
+    base_lines = split_lines(base)
+    target_lines = split_lines(target)
+    n, m = len(base_lines), len(target_lines)
+
+    index = {}
+    for i in range(n - BLOCK_LINES + 1):
+        index.setdefault(tuple(base_lines[i:i + BLOCK_LINES]), i)
+
+    ops: List[DeltaOp] = []
+    inserted: List[bytes] = []
+    expected = 0
+    j = 0
+    while j < m:
+        if expected < n and base_lines[expected] == target_lines[j]:
+            start = expected
+        else:
+            start = index.get(tuple(target_lines[j:j + BLOCK_LINES]))
+        if start is None:
+            inserted.append(target_lines[j])
+            j += 1
+            continue
+
+        if inserted:
+            ops.append(("i", [line.decode("latin-1") for line in inserted]))
+            inserted = []
+        end = start
+        while end < n and j < m and base_lines[end] == target_lines[j]:
+            end += 1
+            j += 1
+        ops.append(("c", start, end))
+        expected = end
+
+    if inserted:
+        ops.append(("i", [line.decode("latin-1") for line in inserted]))
+    return ops
+
+def apply_delta(base: bytes, ops: List[DeltaOp]) -> bytes:
+    base_lines = split_lines(base)
+    out: List[bytes] = []
+    for op in ops:
+        if op[0] == "c":
+            out.extend(base_lines[op[1]:op[2]])
+        else:
+            out.extend(line.encode("latin-1") for line in op[1])
+    return b"".join(out)
+
+def encode_delta(base_digest: str, depth: int, ops: List[DeltaOp]) -> bytes:
+    return json.dumps({"base": base_digest, "depth": depth, "ops": ops}, separators=(",", ":")).encode()
+
+def decode_delta(payload: bytes) -> dict:
+    return json.loads(payload)
@@ -0,0 +1,224 @@
+from bisect import bisect_right
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from typing import Iterator, List, Tuple
+import hashlib
+
+@dataclass
+class Section:
+    header: str
+    lines: List[str]
+    start: int
+    offset: int
+    length: int
+    digest: bytes
+
+def _is_section_start(line: str) -> bool:
+    return line[:1] not in (" ", "\t")
+
+def split_sections(config: str, first_line: int = 0, first_offset: int = 0) -> List[Section]:
+    """Split a config into hierarchy sections.
+
+    A section is a top-level line (``interface ...``, ``router bgp ...``,
+    ``ip access-list ...``) plus the indented lines that follow it.
+    """
+    sections: List[Section] = []
+    current: List[str] = []
+    start, offset = first_line, first_offset
+    for number, line in enumerate(config.splitlines(keepends=True), first_line):
+        if current and _is_section_start(line):
+            sections.append(_make_section(current, start, offset))
+            offset += sections[-1].length
+            current, start = [], number
+        current.append(line)
+    if current:
+        sections.append(_make_section(current, start, offset))
+    return sections
+
+def _make_section(lines: List[str], start: int, offset: int) -> Section:
+    text = "".join(lines)
+    digest = hashlib.sha1(text.encode(errors="surrogatepass")).digest()
+    return Section(lines[0].rstrip("\r\n"), lines, start, offset, len(text), digest)
+
+def _common_prefix(a: str, b: str) -> int:
+    # Binary search with slice comparisons keeps the scan in C
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def _common_suffix(a: str, b: str, limit: int) -> int:
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid:] == b[len(b) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def _section_boundary_before(text: str, pos: int) -> int:
+    # Start offset of the section containing pos
+    while pos > 0:
+        pos = text.rfind("\n", 0, pos - 1) + 1
+        if _is_section_start(text[pos:pos + 1]):
+            return pos
+    return 0
+
+def _section_boundary_after(text: str, pos: int) -> int:
+    # First section start at or after pos
+    if pos == 0 or text[pos - 1] == "\n" and _is_section_start(text[pos:pos + 1]):
+        return pos
+    while True:
+        newline = text.find("\n", pos)
+        if newline == -1:
+            return len(text)
+        pos = newline + 1
+        if pos == len(text) or _is_section_start(text[pos:pos + 1]):
+            return pos
+
+def _trim_unchanged(old: str, new: str) -> Tuple[int, int, int]:
+    """Find the unchanged head and tail of two configs, on section boundaries.
+
+    Returns the shared prefix length and the old/new offsets where the shared
+    suffix starts.
+    """
+    prefix = _section_boundary_before(old, _common_prefix(old, new))
+    suffix = _common_suffix(old, new, min(len(old), len(new)) - prefix)
+    old_tail = _section_boundary_after(old, len(old) - suffix)
+    new_tail = len(new) - (len(old) - old_tail)
+    # The shared tail must also start on a line boundary in the new config
+    if old_tail < len(old) and new_tail > 0 and new[new_tail - 1] != "\n":
+        old_tail = _section_boundary_after(old, old_tail + 1)
+        new_tail = len(new) - (len(old) - old_tail)
+    return prefix, old_tail, new_tail
+
+def _range(start: int, length: int) -> str:
+    # Unified diff ranges are 1-based; an empty range points at the line before it
+    if length == 0:
+        return f"{start},0"
+    if length == 1:
+        return f"{start + 1}"
+    return f"{start + 1},{length}"
+
+def _line(prefix: str, line: str) -> str:
+    return prefix + (line if line.endswith("\n") else line + "\n")
+
+def _lines_before(text: str, offset: int, count: int) -> List[str]:
+    start = offset
+    for _ in range(count):
+        if start == 0:
+            break
+        start = text.rfind("\n", 0, start - 1) + 1
+    return text[start:offset].splitlines(keepends=True)
+
+def _lines_after(text: str, offset: int, count: int) -> List[str]:
+    end = offset
+    for _ in range(count):
+        if end >= len(text):
+            break
+        newline = text.find("\n", end)
+        end = len(text) if newline == -1 else newline + 1
+    return text[offset:end].splitlines(keepends=True)
+
+def _hunks(
+    old: List[Section],
+    new: List[Section],
+    before: List[str],
+    after: List[str],
+    old_start: int,
+    new_start: int,
+    context: int,
+) -> Iterator[str]:
+    # Surrounding unchanged lines are included so hunks carry full context
+    a = before + [line for section in old for line in section.lines] + after
+    b = before + [line for section in new for line in section.lines] + after
+    old_start -= len(before)
+    new_start -= len(before)
+    sections = old or new
+    starts = [section.start for section in sections]
+
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    for group in matcher.get_grouped_opcodes(context):
+        i1, i2 = group[0][1], group[-1][2]
+        j1, j2 = group[0][3], group[-1][4]
+        first_change = next(op for op in group if op[0] != "equal")
+        changed_line = (old_start + first_change[1]) if old else (new_start + first_change[3])
+        header = sections[max(bisect_right(starts, changed_line) - 1, 0)].header
+
+        out = [f"@@ -{_range(old_start + i1, i2 - i1)} +{_range(new_start + j1, j2 - j1)} @@ {header}\n"]
+        for tag, ai1, ai2, bj1, bj2 in group:
+            if tag == "equal":
+                out.extend(_line(" ", line) for line in a[ai1:ai2])
+                continue
+            out.extend(_line("-", line) for line in a[ai1:ai2])
+            out.extend(_line("+", line) for line in b[bj1:bj2])
+        yield "".join(out)
+
+def _changed_blocks(old: List[Section], new: List[Section], gap: int) -> List[List[int]]:
+    """Runs of sections that differ, aligned by section hash.
+
+    Runs separated by fewer than ``gap`` unchanged lines are merged so their
+    hunks cannot overlap.
+    """
+    matcher = SequenceMatcher(None, [s.digest for s in old], [s.digest for s in new])
+    blocks: List[List[int]] = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        if blocks:
+            last = blocks[-1]
+            unchanged = sum(len(section.lines) for section in old[last[1]:i1])
+            if unchanged < gap:
+                last[1], last[3] = i2, j2
+                continue
+        blocks.append([i1, i2, j1, j2])
+    return blocks
+
+def _block_span(sections: List[Section], i1: int, i2: int, end_line: int, end_offset: int) -> Tuple[int, int, int]:
+    # First line, start offset and end offset of sections[i1:i2]
+    if i1 < len(sections):
+        start_line, start_offset = sections[i1].start, sections[i1].offset
+    else:
+        start_line, start_offset = end_line, end_offset
+    if i2 > i1:
+        return start_line, start_offset, sections[i2 - 1].offset + sections[i2 - 1].length
+    return start_line, start_offset, start_offset
+
+def iter_config_diff(
+    old: str,
+    new: str,
+    from_label: str = "a",
+    to_label: str = "b",
+    context: int = 3,
+) -> Iterator[str]:
+    """Yield a unified diff of two configs, one hunk at a time.
+
+    The unchanged head and tail are skipped with plain string comparisons,
+    the rest is split into hierarchy sections and aligned by section hash,
+    and only runs of changed sections are diffed line by line. The cost is
+    driven by what changed rather than by config size.
+    """
+    yield f"--- {from_label}\n+++ {to_label}\n"
+    if old == new:
+        return
+
+    prefix, old_tail, new_tail = _trim_unchanged(old, new)
+    first_line = old.count("\n", 0, prefix)
+    old_sections = split_sections(old[prefix:old_tail], first_line, prefix)
+    new_sections = split_sections(new[prefix:new_tail], first_line, prefix)
+    old_end = first_line + sum(len(section.lines) for section in old_sections)
+    new_end = first_line + sum(len(section.lines) for section in new_sections)
+
+    for i1, i2, j1, j2 in _changed_blocks(old_sections, new_sections, 2 * context):
+        old_line, old_from, old_to = _block_span(old_sections, i1, i2, old_end, old_tail)
+        new_line, _, _ = _block_span(new_sections, j1, j2, new_end, new_tail)
+        before = _lines_before(old, old_from, context)
+        after = _lines_after(old, old_to, context)
+        yield from _hunks(
+            old_sections[i1:i2], new_sections[j1:j2], before, after, old_line, new_line, context
+        )
@@ -1,23 +1,77 @@
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Iterator, Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-import os
+from sqlalchemy.sql.dml import UpdateBase
 import logging
+from .config import settings
+from .storage import configure_sqlite
 
 logger = logging.getLogger(__name__)
 
-# Get the absolute path to the database file
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DB_FILE = os.path.join(BASE_DIR, "netbackup.db")
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_FILE}"
+def create_db_engine(url: Optional[str] = None) -> Engine:
+    """Create an engine for ``url`` (default: settings.database_url)."""
+    url = make_url(url or settings.database_url)
+    logger.info(f"Using database: {url.render_as_string(hide_password=True)}")
+    if url.get_backend_name() == "sqlite":
+        engine = create_engine(url, connect_args={"check_same_thread": False})
+        configure_sqlite(engine)
+        return engine
 
-logger.info(f"Using database file: {DB_FILE}")
+    connect_args = {}
+    if url.get_backend_name() == "postgresql" and settings.db_statement_timeout:
+        connect_args["options"] = f"-c statement_timeout={settings.db_statement_timeout}"
+    return create_engine(
+        url,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=True,
+        connect_args=connect_args,
+    )
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Async drivers for the backends whose sync driver is set in database_url
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+def async_database_url(url: Optional[str] = None) -> URL:
+    url = make_url(url or settings.async_database_url or settings.database_url)
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS and url.get_driver_name() != ASYNC_DRIVERS[backend]:
+        url = url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+    return url
+
+def create_async_db_engine(url: Optional[str] = None) -> AsyncEngine:
+    """Create the async counterpart of create_db_engine, for ``async def`` routes."""
+    url = async_database_url(url)
+    if url.get_backend_name() == "sqlite":
+        engine = create_async_engine(url)
+        configure_sqlite(engine.sync_engine)
+        return engine
+
+    connect_args = {}
+    if url.get_backend_name() == "postgresql" and settings.db_statement_timeout:
+        connect_args["server_settings"] = {"statement_timeout": str(settings.db_statement_timeout)}
+    return create_async_engine(
+        url,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=True,
+        connect_args=connect_args,
+    )
+
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -26,3 +80,58 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+_query_counter: ContextVar[Optional[QueryCounter]] = ContextVar("query_counter", default=None)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _query_counter.get()
+    if counter is not None:
+        counter.count += 1
+
+@contextmanager
+def count_queries() -> Iterator[QueryCounter]:
+    """Count SQL statements executed in this context (including worker threads it spawns)."""
+    counter = QueryCounter()
+    token = _query_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _query_counter.reset(token)
+
+# Collection versions (see app/versions.py). Every INSERT, UPDATE or DELETE
+# on any engine records the table it writes, and the recorded tables'
+# versions are bumped as the transaction commits, so the listeners are
+# registered here, with the engines, for every process that writes.
+# versions.py needs the models, which import this module, so it is imported
+# when the first write happens. Bookkeeping writes that no cached response
+# shows (a device's last_backup, next_backup) opt out with
+# .execution_options(track_versions=False) on the statement.
+
+CHANGED_COLLECTIONS = "changed_collections"
+
+@event.listens_for(Engine, "after_execute")
+def _record_collection_writes(conn, clauseelement, multiparams, params, execution_options, result):
+    if isinstance(clauseelement, UpdateBase) and execution_options.get("track_versions", True):
+        from .versions import mark_changed
+        mark_changed(conn, clauseelement.table.name)
+
+@event.listens_for(Engine, "commit")
+def _bump_collection_versions(conn):
+    # Runs before the COMMIT itself, in the same transaction
+    changed = conn.info.pop(CHANGED_COLLECTIONS, None)
+    if changed:
+        from .versions import bump_versions
+        bump_versions(conn, changed)
+
+@event.listens_for(Engine, "rollback")
+def _forget_collection_writes(conn):
+    conn.info.pop(CHANGED_COLLECTIONS, None)
@@ -0,0 +1,307 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import csv
+import io
+import json
+import logging
+import uuid
+from pydantic import ValidationError
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session
+from .config import settings
+from .dynamic_groups import refresh_devices
+from .filters import DeviceFilter
+from .models.models import (
+    Device,
+    DeviceCredential,
+    DeviceGroup,
+    DeviceStatus,
+    DeviceType,
+    Location,
+    Site,
+    device_group_association,
+)
+from .schemas.schemas import BulkImportError, BulkImportResult, DeviceImportRow
+from .storage import bulk_insert
+
+logger = logging.getLogger(__name__)
+
+# Bulk device import/export. Files are read and written incrementally, rows
+# are validated and written in chunks of settings.bulk_chunk_size (one
+# transaction per chunk), and site/location/credential/group references are
+# resolved from lookup maps loaded once per import. A file that stops being
+# readable part way (bad encoding, broken CSV) ends the import there: the
+# rows before it are kept and the unreadable rest is reported as a failed row.
+
+EXPORT_FIELDS = ["id", "name", "ip_address", "type", "status", "site", "location", "credential", "groups", "config"]
+FORMATS = ("csv", "ndjson")
+MAX_REPORTED_ERRORS = 1000
+
+# A parsed input row: line number, field values, or the reason it could not be parsed
+RawRow = Tuple[int, Optional[dict], Optional[str]]
+
+def guess_format(filename: Optional[str], content_type: Optional[str]) -> str:
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or "json" in (content_type or ""):
+        return "ndjson"
+    return "csv"
+
+def iter_rows(stream: IO[bytes], file_format: str) -> Iterator[RawRow]:
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if file_format == "csv":
+        reader = csv.DictReader(text)
+        try:
+            for row in reader:
+                try:
+                    yield reader.line_num, _from_csv(row), None
+                except ValueError as e:
+                    yield reader.line_num, None, str(e)
+        except (UnicodeDecodeError, csv.Error) as e:
+            yield reader.line_num + 1, None, _unreadable(e)
+        return
+
+    number = 0
+    try:
+        for number, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield number, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(row, dict):
+                yield number, None, "Expected a JSON object"
+                continue
+            yield number, row, None
+    except UnicodeDecodeError as e:
+        yield number + 1, None, _unreadable(e)
+
+def _unreadable(error: Exception) -> str:
+    # Decoding works on blocks of the file, so the bad data may be a few lines further on
+    return f"Could not read the file from this line on, nothing after it was imported: {error}"
+
+def _from_csv(row: dict) -> dict:
+    values = {key: value for key, value in row.items() if key and value not in ("", None)}
+    if "groups" in values:
+        values["groups"] = [group.strip() for group in values["groups"].split(";") if group.strip()]
+    if "config" in values:
+        try:
+            values["config"] = json.loads(values["config"])
+        except ValueError as e:
+            raise ValueError(f"config: invalid JSON: {e}")
+    return values
+
+class _Lookup:
+    """Resolves an id or a unique name to an id."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.ids: Set[str] = set()
+        self.names: Dict[str, Optional[str]] = {}
+
+    def add(self, id: str, *names: Optional[str]):
+        self.ids.add(id)
+        for name in names:
+            if name:
+                # A name shared by different records is ambiguous (None)
+                self.names[name] = id if self.names.get(name, id) == id else None
+
+    def resolve(self, value: str) -> str:
+        if value in self.ids:
+            return value
+        if value not in self.names:
+            raise ValueError(f"Unknown {self.kind} '{value}'")
+        if self.names[value] is None:
+            raise ValueError(f"Ambiguous {self.kind} '{value}', use its id")
+        return self.names[value]
+
+class ReferenceMaps:
+    """In-memory lookups for everything a device row can reference."""
+
+    def __init__(self, db: Session):
+        self.sites = _Lookup("site")
+        for id, name, code in db.query(Site.id, Site.name, Site.code):
+            self.sites.add(id, code, name)
+
+        self.locations = _Lookup("location")
+        self.site_locations: Dict[str, _Lookup] = defaultdict(lambda: _Lookup("location"))
+        self.location_site: Dict[str, str] = {}
+        for id, name, site_id in db.query(Location.id, Location.name, Location.site_id):
+            self.locations.add(id, name)
+            self.site_locations[site_id].add(id, name)
+            self.location_site[id] = site_id
+
+        self.credentials = _Lookup("credential")
+        for id, name in db.query(DeviceCredential.id, DeviceCredential.name):
+            self.credentials.add(id, name)
+
+        self.groups = _Lookup("group")
+        for id, name in db.query(DeviceGroup.id, DeviceGroup.name):
+            self.groups.add(id, name)
+
+    def resolve(self, row: DeviceImportRow) -> Tuple[dict, List[str]]:
+        """Column values and group ids for a validated row."""
+        site_id = self.sites.resolve(row.site) if row.site else None
+        location_id = None
+        if row.location:
+            # Within the given site, a location name only has to be unique there
+            lookup = self.site_locations[site_id] if site_id else self.locations
+            location_id = lookup.resolve(row.location)
+            site_id = site_id or self.location_site[location_id]
+
+        values = {
+            "id": row.id,
+            "name": row.name,
+            "ip_address": row.ip_address,
+            "type": DeviceType(row.type.value),
+            "site_id": site_id,
+            "location_id": location_id,
+            "credential_id": self.credentials.resolve(row.credential) if row.credential else None,
+            "config": row.config,
+        }
+        if row.status is not None:
+            values["status"] = DeviceStatus(row.status.value)
+        group_ids = list(dict.fromkeys(self.groups.resolve(group) for group in row.groups or []))
+        return values, group_ids
+
+def _error_message(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}"
+            for detail in error.errors()
+        )
+    return str(error)
+
+def _fail(result: BulkImportResult, number: int, message: str):
+    result.failed += 1
+    if len(result.errors) < MAX_REPORTED_ERRORS:
+        result.errors.append(BulkImportError(row=number, error=message))
+
+def import_devices(db: Session, rows: Iterable[RawRow], chunk_size: Optional[int] = None) -> BulkImportResult:
+    """Create or update devices from parsed rows.
+
+    Rows with the id of an existing device replace its fields and group
+    membership (status is kept unless given); all other rows create a
+    device. Invalid rows are reported and skipped.
+    """
+    chunk_size = chunk_size or settings.bulk_chunk_size
+    result = BulkImportResult()
+    refs = ReferenceMaps(db)
+    chunk: List[RawRow] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            _import_chunk(db, refs, chunk, result)
+            chunk = []
+    if chunk:
+        _import_chunk(db, refs, chunk, result)
+    return result
+
+def _import_chunk(db: Session, refs: ReferenceMaps, chunk: List[RawRow], result: BulkImportResult):
+    valid: List[Tuple[int, dict, List[str]]] = []
+    seen: Set[str] = set()
+    for number, data, error in chunk:
+        if error is not None:
+            _fail(result, number, error)
+            continue
+        try:
+            values, group_ids = refs.resolve(DeviceImportRow.model_validate(data))
+        except (ValidationError, ValueError) as e:
+            _fail(result, number, _error_message(e))
+            continue
+        if values["id"] is not None:
+            if values["id"] in seen:
+                _fail(result, number, f"Duplicate id '{values['id']}'")
+                continue
+            seen.add(values["id"])
+        valid.append((number, values, group_ids))
+    if not valid:
+        return
+
+    existing = set()
+    if seen:
+        existing = {id for (id,) in db.query(Device.id).filter(Device.id.in_(seen))}
+
+    now = datetime.utcnow()
+    created, updated, memberships = [], [], []
+    for _, values, group_ids in valid:
+        if values["id"] in existing:
+            updated.append({**values, "updated_at": now})
+        else:
+            values["id"] = values["id"] or str(uuid.uuid4())
+            values.setdefault("status", DeviceStatus.INACTIVE)
+            created.append({**values, "created_at": now, "updated_at": now})
+        memberships.extend({"device_id": values["id"], "group_id": group_id} for group_id in group_ids)
+
+    try:
+        bulk_insert(db, Device.__table__, created)
+        if updated:
+            db.execute(update(Device), updated)
+            db.execute(delete(device_group_association).where(
+                device_group_association.c.device_id.in_([values["id"] for values in updated])
+            ))
+        bulk_insert(db, device_group_association, memberships)
+        refresh_devices(db.connection(), [values["id"] for _, values, _ in valid])
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error importing devices (rows {valid[0][0]}-{valid[-1][0]}): {str(e)}")
+        for number, _, _ in valid:
+            _fail(result, number, "Could not write this chunk of rows")
+        return
+    result.created += len(created)
+    result.updated += len(updated)
+
+def export_devices(db: Session, filters: DeviceFilter, file_format: str) -> Iterator[str]:
+    """Yield devices matching ``filters`` as CSV or NDJSON, one page at a time."""
+    query = filters.apply(db.query(
+        Device.id, Device.name, Device.ip_address, Device.type, Device.status,
+        Device.site_id, Device.location_id, Device.credential_id, Device.config,
+    )).order_by(Device.id)
+    if file_format == "csv":
+        yield ",".join(EXPORT_FIELDS) + "\r\n"
+
+    last_id = None
+    while True:
+        page = (query.filter(Device.id > last_id) if last_id else query).limit(settings.bulk_chunk_size).all()
+        if not page:
+            return
+        groups = defaultdict(list)
+        for device_id, group_id in db.query(
+            device_group_association.c.device_id, device_group_association.c.group_id
+        ).filter(device_group_association.c.device_id.in_([device.id for device in page])):
+            groups[device_id].append(group_id)
+
+        records = [
+            {
+                "id": device.id,
+                "name": device.name,
+                "ip_address": device.ip_address,
+                "type": device.type.value,
+                "status": device.status.value if device.status else None,
+                "site": device.site_id,
+                "location": device.location_id,
+                "credential": device.credential_id,
+                "groups": sorted(groups[device.id]),
+                "config": device.config,
+            }
+            for device in page
+        ]
+        yield _format_records(records, file_format)
+        last_id = page[-1].id
+
+def _format_records(records: List[dict], file_format: str) -> str:
+    if file_format == "ndjson":
+        return "".join(json.dumps(record) + "\n" for record in records)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for record in records:
+        writer.writerow([
+            ";".join(record["groups"]) if field == "groups"
+            else json.dumps(record["config"]) if field == "config" and record["config"] is not None
+            else record[field]
+            for field in EXPORT_FIELDS
+        ])
+    return buffer.getvalue()
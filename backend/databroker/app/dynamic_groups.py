@@ -0,0 +1,150 @@
+from typing import Iterable, List, Optional, Tuple
+import ipaddress
+import re
+from pydantic import BaseModel, field_validator
+from sqlalchemy import and_, delete, event, insert, inspect, literal, or_, select, true
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import ColumnElement
+from .filters import ip_prefix_clause
+from .models.models import Device, DeviceGroup, DeviceStatus, DeviceType, Location, device_group_association
+
+# Dynamic device groups. A group with rules has its membership computed:
+# the rules compile into a WHERE clause on devices, and the result is kept
+# in device_group_association like static membership, so everything that
+# reads groups (filters, eager loads, the scheduler) works unchanged. A
+# group is re-evaluated in full when its rules change; when devices change,
+# only those devices are re-evaluated against each dynamic group.
+
+# Device attributes the rules can depend on
+RULE_ATTRIBUTES = ("name", "ip_address", "type", "status", "site_id", "location_id", "groups")
+
+# name_regex runs in the database: Python's re on SQLite (SQLAlchemy's REGEXP
+# function) and POSIX regular expressions (~) on PostgreSQL. The two read
+# escapes such as \d or \b, lookarounds, named groups and [[:classes:]]
+# differently, so a group would have different members on each. Patterns
+# are limited to the syntax both read the same way.
+_PORTABLE_REGEX = re.compile(r"""
+    \\[^0-9A-Za-z]                             # escaped punctuation
+  | \[\^?\]?(?:\\[^0-9A-Za-z]|[^\]\\\[])*\]    # bracket expression
+  | \(\?:                                      # non-capturing group
+  | [*+?](?![*+])\??                          # quantifier, optionally lazy
+  | \{\d+(?:,\d*)?\}\??                       # bounded repetition
+  | [^\\\[{}*+?]                              # literals, . ^ $ | ( )
+""", re.VERBOSE)
+
+def check_portable_regex(pattern: str):
+    """Raise ValueError unless ``pattern`` only uses syntax both databases read alike."""
+    position = 0
+    while position < len(pattern):
+        token = _PORTABLE_REGEX.match(pattern, position)
+        if token is None or (token.group() == "(" and pattern.startswith("(?", position)):
+            raise ValueError(
+                f"unsupported syntax at position {position} ({pattern[position:position + 8]!r}); "
+                "use literals, ., [...], ^, $, |, (...), (?:...), quantifiers and escaped "
+                "punctuation, e.g. [0-9] for \\d"
+            )
+        position = token.end()
+
+class GroupRules(BaseModel):
+    """A device is a member if it matches every given rule; list values are alternatives."""
+
+    site_ids: Optional[List[str]] = None
+    location_ids: Optional[List[str]] = None
+    types: Optional[List[DeviceType]] = None
+    statuses: Optional[List[DeviceStatus]] = None
+    ip_prefixes: Optional[List[str]] = None
+    name_regex: Optional[str] = None
+
+    @field_validator("name_regex")
+    @classmethod
+    def _compiles(cls, value: Optional[str]) -> Optional[str]:
+        if value is not None:
+            try:
+                re.compile(value)
+            except re.error as e:
+                raise ValueError(f"invalid regular expression: {e}")
+            check_portable_regex(value)
+        return value
+
+    @field_validator("ip_prefixes")
+    @classmethod
+    def _ipv4_only(cls, value: Optional[List[str]]) -> Optional[List[str]]:
+        for prefix in value or []:
+            try:
+                network = ipaddress.ip_network(prefix, strict=False)
+            except ValueError:
+                continue
+            if network.version != 4:
+                raise ValueError("only IPv4 prefixes are supported")
+        return value
+
+def compile_rules(rules: GroupRules) -> ColumnElement:
+    clauses = []
+    if rules.site_ids:
+        # A device is in a site directly or through its location
+        clauses.append(or_(
+            Device.site_id.in_(rules.site_ids),
+            Device.location_id.in_(select(Location.id).where(Location.site_id.in_(rules.site_ids))),
+        ))
+    if rules.location_ids:
+        clauses.append(Device.location_id.in_(rules.location_ids))
+    if rules.types:
+        clauses.append(Device.type.in_(rules.types))
+    if rules.statuses:
+        clauses.append(Device.status.in_(rules.statuses))
+    if rules.ip_prefixes:
+        prefixes = [ip_prefix_clause(prefix) for prefix in rules.ip_prefixes]
+        if all(prefix is not None for prefix in prefixes):
+            clauses.append(or_(*prefixes))
+    if rules.name_regex:
+        clauses.append(Device.name.regexp_match(rules.name_regex))
+    return and_(*clauses) if clauses else true()
+
+def refresh_group(
+    conn: Connection,
+    group_id: str,
+    rules: dict,
+    device_ids: Optional[List[str]] = None,
+) -> Tuple[int, int]:
+    """Re-evaluate a dynamic group, for all devices or only ``device_ids``.
+
+    Returns the number of memberships added and removed.
+    """
+    matching = select(Device.id).where(compile_rules(GroupRules.model_validate(rules)))
+    scope = device_group_association.c.group_id == group_id
+    if device_ids is not None:
+        matching = matching.where(Device.id.in_(device_ids))
+        scope = and_(scope, device_group_association.c.device_id.in_(device_ids))
+    members = select(device_group_association.c.device_id).where(
+        device_group_association.c.group_id == group_id
+    )
+
+    removed = conn.execute(delete(device_group_association).where(
+        scope, device_group_association.c.device_id.not_in(matching)
+    )).rowcount
+    added = conn.execute(insert(device_group_association).from_select(
+        ["device_id", "group_id"],
+        select(Device.id, literal(group_id)).where(Device.id.in_(matching), Device.id.not_in(members)),
+    )).rowcount
+    return added, removed
+
+def refresh_devices(conn: Connection, device_ids: Iterable[str]):
+    """Re-evaluate the given devices against every dynamic group."""
+    device_ids = list(device_ids)
+    if not device_ids:
+        return
+    groups = conn.execute(select(DeviceGroup.id, DeviceGroup.rules).where(DeviceGroup.rules.isnot(None))).all()
+    for group_id, rules in groups:
+        refresh_group(conn, group_id, rules, device_ids)
+
+@event.listens_for(Session, "after_flush")
+def _refresh_changed_devices(session, flush_context):
+    changed = [obj.id for obj in session.new if isinstance(obj, Device)]
+    for obj in session.dirty:
+        if isinstance(obj, Device):
+            state = inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in RULE_ATTRIBUTES):
+                changed.append(obj.id)
+    if changed:
+        refresh_devices(session.connection(), changed)
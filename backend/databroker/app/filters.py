@@ -0,0 +1,145 @@
+from datetime import datetime
+from typing import List, Optional
+import ipaddress
+from fastapi import HTTPException, Query as QueryParam
+from pydantic import BaseModel
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Query
+from .models.models import BackupHistory, BackupStatus, Device, DeviceStatus, DeviceType, device_group_association
+
+def escape_like(value: str) -> str:
+    """``value`` matched literally in a LIKE pattern built with ``escape="\\"``."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def ip_prefix_clause(prefix: str):
+    """Translate an IPv4 CIDR (or a plain text prefix) into a portable predicate.
+
+    Addresses are stored as strings, so a CIDR is expanded into at most 128
+    octet-aligned ``LIKE`` / equality terms, which still use the ip_address
+    index as range scans.
+    """
+    try:
+        network = ipaddress.ip_network(prefix, strict=False)
+    except ValueError:
+        return Device.ip_address.like(f"{escape_like(prefix)}%", escape="\\")
+    if network.version != 4:
+        raise HTTPException(status_code=400, detail="Only IPv4 prefixes are supported")
+    if network.prefixlen == 0:
+        return None
+
+    octets = str(network.network_address).split(".")
+    full, partial = divmod(network.prefixlen, 8)
+    if partial == 0:
+        fixed = ".".join(octets[:full])
+        if full == 4:
+            return Device.ip_address == fixed
+        return Device.ip_address.like(f"{fixed}.%")
+
+    fixed = octets[:full]
+    first = int(octets[full])
+    count = 2 ** (8 - partial)
+    terms = []
+    for value in range(first, first + count):
+        parts = fixed + [str(value)]
+        if full == 3:
+            terms.append(Device.ip_address == ".".join(parts))
+        else:
+            terms.append(Device.ip_address.like(".".join(parts) + ".%"))
+    return or_(*terms)
+
+class DeviceFilter:
+    """Query parameters shared by the device list, export and bulk endpoints."""
+
+    def __init__(
+        self,
+        status: Optional[List[DeviceStatus]] = QueryParam(None),
+        type: Optional[List[DeviceType]] = QueryParam(None),
+        site_id: Optional[str] = None,
+        location_id: Optional[str] = None,
+        group_id: Optional[str] = None,
+        ip_prefix: Optional[str] = None,
+        name: Optional[str] = None,
+    ):
+        self.status = status
+        self.type = type
+        self.site_id = site_id
+        self.location_id = location_id
+        self.group_id = group_id
+        self.ip_prefix = ip_prefix
+        self.name = name
+
+    def apply(self, query: Query) -> Query:
+        if self.status:
+            query = query.filter(Device.status.in_(self.status))
+        if self.type:
+            query = query.filter(Device.type.in_(self.type))
+        if self.site_id:
+            query = query.filter(Device.site_id == self.site_id)
+        if self.location_id:
+            query = query.filter(Device.location_id == self.location_id)
+        if self.group_id:
+            members = select(device_group_association.c.device_id).where(
+                device_group_association.c.group_id == self.group_id
+            )
+            query = query.filter(Device.id.in_(members))
+        if self.ip_prefix:
+            clause = ip_prefix_clause(self.ip_prefix)
+            if clause is not None:
+                query = query.filter(clause)
+        if self.name:
+            query = query.filter(Device.name.ilike(f"%{escape_like(self.name)}%", escape="\\"))
+        return query
+
+class DeviceSelector(BaseModel):
+    """The device filters as a request body, e.g. for bulk operations."""
+
+    status: Optional[List[DeviceStatus]] = None
+    type: Optional[List[DeviceType]] = None
+    site_id: Optional[str] = None
+    location_id: Optional[str] = None
+    group_id: Optional[str] = None
+    ip_prefix: Optional[str] = None
+    name: Optional[str] = None
+
+    def to_filter(self) -> DeviceFilter:
+        return DeviceFilter(**self.model_dump())
+
+class BackupHistoryFilter:
+    """Query parameters of the backup history list and export."""
+
+    def __init__(
+        self,
+        device_id: Optional[str] = None,
+        site_id: Optional[str] = None,
+        group_id: Optional[str] = None,
+        status: Optional[List[BackupStatus]] = QueryParam(None),
+        since: Optional[datetime] = QueryParam(None, description="Backups created at or after this time"),
+        until: Optional[datetime] = QueryParam(None, description="Backups created before this time"),
+    ):
+        self.device_id = device_id
+        self.site_id = site_id
+        self.group_id = group_id
+        self.status = status
+        self.since = since
+        self.until = until
+
+    def apply(self, query: Query) -> Query:
+        if self.device_id:
+            query = query.filter(BackupHistory.device_id == self.device_id)
+        if self.site_id:
+            query = query.filter(BackupHistory.device_id.in_(
+                select(Device.id).where(Device.site_id == self.site_id)
+            ))
+        if self.group_id:
+            query = query.filter(BackupHistory.device_id.in_(
+                select(device_group_association.c.device_id).where(
+                    device_group_association.c.group_id == self.group_id
+                )
+            ))
+        if self.status:
+            query = query.filter(BackupHistory.status.in_(self.status))
+        if self.since:
+            query = query.filter(BackupHistory.created_at >= self.since)
+        if self.until:
+            query = query.filter(BackupHistory.created_at < self.until)
+        return query
@@ -0,0 +1,26 @@
+from sqlalchemy.orm import joinedload, selectinload
+from .models.models import Device, DeviceGroup, Location
+
+# Eager-load profiles, one per response shape. Every relationship a response
+# schema serializes must be listed here, otherwise serializing a list issues
+# one lazy load per row. Many-to-one relationships are joined into the main
+# query; collections use a single extra SELECT ... IN per relationship, which
+# also keeps LIMIT on the main query correct.
+
+# schemas.Device: site, location (with its site), credential, groups
+DEVICE_RESPONSE = (
+    joinedload(Device.site),
+    joinedload(Device.location).joinedload(Location.site),
+    joinedload(Device.credential),
+    selectinload(Device.groups),
+)
+
+# device_group_schemas.DeviceGroupResponse: devices (scalar columns only)
+DEVICE_GROUP_RESPONSE = (
+    selectinload(DeviceGroup.devices),
+)
+
+# schemas.Location: site
+LOCATION_RESPONSE = (
+    joinedload(Location.site),
+)
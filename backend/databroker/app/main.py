@@ -1,4 +1,4 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from .routers import (
     auth,
@@ -9,8 +9,15 @@ from .routers import (
     device_credentials,
     dashboard,
     admins,
+    backup_history,
+    backup_jobs,
 )
-from .database import Base, engine
+from .database import SessionLocal, async_engine, engine, count_queries
+from .migrations import upgrade
+from .models.models import BackupHistory, BackupStats
+from .stats import rebuild_backup_stats
+from . import passwords
+from .config import settings
 import logging
 
 # Configure logging
@@ -20,8 +27,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Create or migrate the database schema
+upgrade(engine)
 
 app = FastAPI(
     title="NetBackup API",
@@ -36,8 +43,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Next-Cursor", "ETag"],
 )
 
+@app.middleware("http")
+async def warn_on_query_count(request: Request, call_next):
+    with count_queries() as counter:
+        response = await call_next(request)
+    if counter.count > settings.query_count_warning:
+        logger.warning(
+            f"{request.method} {request.url.path} issued {counter.count} SQL statements"
+        )
+    return response
+
 # Include routers
 app.include_router(auth.router)  # Add auth router first
 app.include_router(devices.router)
@@ -47,6 +65,23 @@ app.include_router(locations.router)
 app.include_router(device_credentials.router)
 app.include_router(dashboard.router)
 app.include_router(admins.router)
+app.include_router(backup_history.router)
+app.include_router(backup_jobs.router)
+
+@app.on_event("startup")
+def backfill_backup_stats():
+    # Databases created before the rollup existed have history but no buckets
+    db = SessionLocal()
+    try:
+        if db.query(BackupStats.bucket).first() is None and db.query(BackupHistory.id).first() is not None:
+            rebuild_backup_stats(db)
+    finally:
+        db.close()
+
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    await async_engine.dispose()
+    passwords.get_hasher().close()
 
 @app.get("/")
 async def root():
@@ -54,4 +89,4 @@ async def root():
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {"status": "healthy", "password_hashing": passwords.stats()}
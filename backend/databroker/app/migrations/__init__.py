@@ -0,0 +1,69 @@
+from types import ModuleType
+from typing import List, Optional, Tuple
+import importlib
+import logging
+import pkgutil
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from ..database import Base
+from ..models import admin, models
+
+logger = logging.getLogger(__name__)
+
+# Forward-only schema migrations. Every module in this package named
+# ``mNNNN_<description>`` defines ``upgrade(conn)``; modules are applied in
+# order, each in its own transaction, and the last applied number is kept in
+# the schema_version table.
+#
+# A database without any application tables is created straight from the
+# models and stamped with the latest version, so migrations only ever run
+# against databases created by an earlier release. A database from before
+# migrations existed has no schema_version row and starts at version 0.
+# Migrations must not import the models (they describe the schema at their
+# own point in history) and should tolerate objects that already exist,
+# since SQLite does not make DDL transactional.
+
+VERSION_TABLE = "schema_version"
+
+def load_migrations() -> List[Tuple[int, str, ModuleType]]:
+    migrations = []
+    for info in pkgutil.iter_modules(__path__):
+        if info.name[:1] == "m" and info.name[1:5].isdigit():
+            module = importlib.import_module(f"{__name__}.{info.name}")
+            migrations.append((int(info.name[1:5]), info.name, module))
+    migrations.sort(key=lambda migration: migration[0])
+    return migrations
+
+def current_version(conn: Connection) -> Optional[int]:
+    if not inspect(conn).has_table(VERSION_TABLE):
+        return None
+    return conn.execute(text(f"SELECT version FROM {VERSION_TABLE}")).scalar()
+
+def _set_version(conn: Connection, version: int):
+    conn.execute(text(f"DELETE FROM {VERSION_TABLE}"))
+    conn.execute(text(f"INSERT INTO {VERSION_TABLE} (version) VALUES (:version)"), {"version": version})
+
+def upgrade(engine: Engine, target: Optional[int] = None) -> int:
+    """Bring the database schema up to ``target`` (default: latest). Returns the new version."""
+    migrations = load_migrations()
+    head = migrations[-1][0] if migrations else 0
+    target = head if target is None else target
+
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (version INTEGER NOT NULL)"))
+        if not set(inspect(conn).get_table_names()) & set(Base.metadata.tables):
+            Base.metadata.create_all(conn)
+            _set_version(conn, head)
+            logger.info(f"Created database schema at version {head}")
+            return head
+        version = current_version(conn) or 0
+
+    for number, name, module in migrations:
+        if number <= version or number > target:
+            continue
+        logger.info(f"Applying migration {name}")
+        with engine.begin() as conn:
+            module.upgrade(conn)
+            _set_version(conn, number)
+        version = number
+    return version
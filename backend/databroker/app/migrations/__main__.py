@@ -0,0 +1,28 @@
+import argparse
+import logging
+from ..database import engine
+from . import current_version, load_migrations, upgrade
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
+)
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the NetBackup database schema")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    upgrade_parser = subcommands.add_parser("upgrade", help="Apply pending migrations")
+    upgrade_parser.add_argument("--target", type=int, help="Stop at this version (default: latest)")
+    subcommands.add_parser("current", help="Show the current and latest schema versions")
+    args = parser.parse_args()
+    if args.command == "upgrade":
+        print(f"Schema at version {upgrade(engine, args.target)}")
+    else:
+        with engine.connect() as conn:
+            current = current_version(conn)
+        migrations = load_migrations()
+        head = migrations[-1][0] if migrations else 0
+        print(f"Current version: {current if current is not None else 'unversioned'}, latest: {head}")
+
+if __name__ == "__main__":
+    main()
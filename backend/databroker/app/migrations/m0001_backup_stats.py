@@ -0,0 +1,16 @@
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table
+from sqlalchemy.engine import Connection
+
+# Hourly backup rollup used by the dashboard
+
+backup_stats = Table(
+    "backup_stats",
+    MetaData(),
+    Column("bucket", DateTime, primary_key=True),
+    Column("total", Integer, nullable=False),
+    Column("succeeded", Integer, nullable=False),
+    Column("failed", Integer, nullable=False),
+)
+
+def upgrade(conn: Connection):
+    backup_stats.create(conn, checkfirst=True)
@@ -0,0 +1,21 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+# Indexes for the device list filters and the backup history / dashboard queries
+
+INDEXES = [
+    "ix_device_group_association_group ON device_group_association (group_id, device_id)",
+    "ix_locations_site_id ON locations (site_id)",
+    "ix_devices_status_name ON devices (status, name)",
+    "ix_devices_site_id ON devices (site_id)",
+    "ix_devices_location_id ON devices (location_id)",
+    "ix_devices_name ON devices (name)",
+    "ix_devices_ip_address ON devices (ip_address)",
+    "ix_backup_history_device_created ON backup_history (device_id, created_at DESC)",
+    "ix_backup_history_device_status_created ON backup_history (device_id, status, created_at DESC)",
+    "ix_backup_history_created_status ON backup_history (created_at, status)",
+]
+
+def upgrade(conn: Connection):
+    for index in INDEXES:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index}"))
@@ -0,0 +1,9 @@
+from sqlalchemy import JSON, inspect, text
+from sqlalchemy.engine import Connection
+
+# Rules column for dynamic device groups
+
+def upgrade(conn: Connection):
+    columns = {column["name"] for column in inspect(conn).get_columns("device_groups")}
+    if "rules" not in columns:
+        conn.execute(text(f"ALTER TABLE device_groups ADD COLUMN rules {JSON().compile(dialect=conn.dialect)}"))
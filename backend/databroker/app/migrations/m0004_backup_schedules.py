@@ -0,0 +1,11 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+# Backup schedules on devices and groups, and the scheduler's due-device index
+
+def upgrade(conn: Connection):
+    for table in ("devices", "device_groups"):
+        columns = {column["name"] for column in inspect(conn).get_columns(table)}
+        if "backup_schedule" not in columns:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN backup_schedule VARCHAR"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_devices_status_next_backup ON devices (status, next_backup)"))
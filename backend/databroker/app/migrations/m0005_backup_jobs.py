@@ -0,0 +1,28 @@
+from sqlalchemy import Column, DateTime, Enum, ForeignKey, Index, Integer, MetaData, String, Table
+from sqlalchemy.engine import Connection
+
+# Job queue for distributed collector workers
+
+metadata = MetaData()
+Table("devices", metadata, Column("id", String, primary_key=True))
+backup_jobs = Table(
+    "backup_jobs",
+    metadata,
+    Column("id", String, primary_key=True),
+    Column("device_id", String, ForeignKey("devices.id", ondelete="CASCADE"), nullable=False),
+    Column("status", Enum("QUEUED", "RUNNING", "DONE", "FAILED", name="jobstatus"), nullable=False),
+    Column("attempts", Integer, nullable=False),
+    Column("available_at", DateTime, nullable=False),
+    Column("lease_owner", String),
+    Column("lease_expires_at", DateTime),
+    Column("error", String),
+    Column("created_at", DateTime),
+    Column("updated_at", DateTime),
+    Column("finished_at", DateTime),
+    Index("ix_backup_jobs_status_available", "status", "available_at"),
+    Index("ix_backup_jobs_status_lease", "status", "lease_expires_at"),
+    Index("ix_backup_jobs_device_status", "device_id", "status"),
+)
+
+def upgrade(conn: Connection):
+    backup_jobs.create(conn, checkfirst=True)
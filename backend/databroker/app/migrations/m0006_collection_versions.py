@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, MetaData, String, Table
+from sqlalchemy.engine import Connection
+
+# Write counters behind the ETags of cached API responses
+
+collection_versions = Table(
+    "collection_versions",
+    MetaData(),
+    Column("name", String, primary_key=True),
+    Column("version", Integer, nullable=False),
+)
+
+def upgrade(conn: Connection):
+    collection_versions.create(conn, checkfirst=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Table, JSON, Enum as SQLEnum, func, Text, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Table, JSON, Enum as SQLEnum, func, Text, Boolean, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -22,12 +22,20 @@ class BackupStatus(str, enum.Enum):
     IN_PROGRESS = "in_progress"
     PENDING = "pending"
 
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
 # Association table for Device-DeviceGroup many-to-many relationship
 device_group_association = Table(
     'device_group_association',
     Base.metadata,
     Column('device_id', String, ForeignKey('devices.id'), primary_key=True),
-    Column('group_id', String, ForeignKey('device_groups.id'), primary_key=True)
+    Column('group_id', String, ForeignKey('device_groups.id'), primary_key=True),
+    # The primary key covers device -> groups; this covers group -> devices
+    Index('ix_device_group_association_group', 'group_id', 'device_id'),
 )
 
 class DeviceCredential(Base):
@@ -79,12 +87,18 @@ class Location(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     site = relationship("Site", back_populates="locations")
 
+Index("ix_locations_site_id", Location.site_id)
+
 class DeviceGroup(Base):
     __tablename__ = "device_groups"
 
     id = Column(String, primary_key=True)
     name = Column(String, nullable=False)
     description = Column(String)
+    # Set for dynamic groups; membership is then maintained by app/dynamic_groups.py
+    rules = Column(JSON(none_as_null=True))
+    # Backup schedule for member devices without their own (see app/scheduler)
+    backup_schedule = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     devices = relationship("Device", secondary=device_group_association, back_populates="groups")
@@ -102,6 +116,8 @@ class Device(Base):
     credential_id = Column(String, ForeignKey("device_credentials.id"))
     last_backup = Column(DateTime)
     next_backup = Column(DateTime)
+    # Cron expression or "@every <n>[smhd]"; NULL falls back to the groups' schedules
+    backup_schedule = Column(String)
     config = Column(JSON)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -112,6 +128,14 @@ class Device(Base):
     backup_history = relationship("BackupHistory", back_populates="device", cascade="all, delete-orphan")
     credentials = relationship("DeviceCredentials", back_populates="device", uselist=False)
 
+Index("ix_devices_status_name", Device.status, Device.name)
+Index("ix_devices_site_id", Device.site_id)
+Index("ix_devices_location_id", Device.location_id)
+Index("ix_devices_name", Device.name)
+Index("ix_devices_ip_address", Device.ip_address)
+# The scheduler's queue: due active devices, earliest first
+Index("ix_devices_status_next_backup", Device.status, Device.next_backup)
+
 class BackupHistory(Base):
     __tablename__ = "backup_history"
 
@@ -124,6 +148,50 @@ class BackupHistory(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     device = relationship("Device", back_populates="backup_history")
 
+# A device's history, newest first
+Index("ix_backup_history_device_created", BackupHistory.device_id, BackupHistory.created_at.desc())
+# Latest successful backup per device (collector, config diff)
+Index("ix_backup_history_device_status_created", BackupHistory.device_id, BackupHistory.status, BackupHistory.created_at.desc())
+# Recent activity and time-window scans across all devices
+Index("ix_backup_history_created_status", BackupHistory.created_at, BackupHistory.status)
+
+class BackupStats(Base):
+    # Hourly rollup of backup results, maintained incrementally by app/stats.py
+    __tablename__ = "backup_stats"
+
+    bucket = Column(DateTime, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    succeeded = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+
+class CollectionVersion(Base):
+    # Write counter per table, for ETags of cached API responses (app/versions.py)
+    __tablename__ = "collection_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class BackupJob(Base):
+    # A device backup waiting for, or leased by, a collector worker (app/collector/queue.py)
+    __tablename__ = "backup_jobs"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    device_id = Column(String, ForeignKey("devices.id", ondelete="CASCADE"), nullable=False)
+    status = Column(SQLEnum(JobStatus), nullable=False, default=JobStatus.QUEUED)
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    lease_owner = Column(String)
+    lease_expires_at = Column(DateTime)
+    error = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime)
+
+# Claiming: queued jobs by availability, running jobs by lease expiry
+Index("ix_backup_jobs_status_available", BackupJob.status, BackupJob.available_at)
+Index("ix_backup_jobs_status_lease", BackupJob.status, BackupJob.lease_expires_at)
+Index("ix_backup_jobs_device_status", BackupJob.device_id, BackupJob.status)
+
 class Role(Base):
     __tablename__ = "roles"
 
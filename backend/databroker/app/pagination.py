@@ -0,0 +1,100 @@
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+import base64
+import enum
+import json
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query
+from sqlalchemy.sql.elements import ColumnElement
+
+# Keyset (cursor) pagination. A cursor encodes the sort key values of the
+# last row of a page; the next page starts strictly after it, so every page
+# is an index range scan no matter how deep the client has paged. Rows whose
+# sort value is NULL (e.g. a device never backed up) come last in either
+# direction; comparisons with NULL are never true, so they get their own
+# branch in the cursor condition.
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    payload = []
+    for value in values:
+        if isinstance(value, enum.Enum):
+            value = value.value
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        payload.append(value)
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, columns: Sequence[ColumnElement]) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if not isinstance(payload, list) or len(payload) != len(columns):
+            raise ValueError("cursor does not match sort order")
+        return [_coerce(column, value) for column, value in zip(columns, payload)]
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
+def _coerce(column: ColumnElement, value: Any) -> Any:
+    if value is None:
+        return None
+    enum_class = getattr(column.type, "enum_class", None)
+    if enum_class is not None:
+        return enum_class(value)
+    if column.type.python_type is datetime:
+        return datetime.fromisoformat(value)
+    return value
+
+def parse_sort(sort: str, allowed: dict) -> Tuple[ColumnElement, bool]:
+    """Resolve ``name`` / ``-name`` into a column and a descending flag."""
+    descending = sort.startswith("-")
+    key = sort.lstrip("-+")
+    if key not in allowed:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot sort by '{key}'. Allowed: {', '.join(sorted(allowed))}",
+        )
+    return allowed[key], descending
+
+def keyset_paginate(
+    query: Query,
+    sort_column: ColumnElement,
+    id_column: ColumnElement,
+    descending: bool,
+    cursor: Optional[str],
+    limit: int,
+) -> Tuple[list, Optional[str]]:
+    """Apply ordering, the cursor predicate and the limit to ``query``.
+
+    Returns the page of rows and the cursor for the next page (None on the
+    last page). ``id_column`` breaks ties so the ordering is total.
+    """
+    nullable = getattr(sort_column, "nullable", True)
+    if cursor:
+        last_value, last_id = decode_cursor(cursor, [sort_column, id_column])
+        after_id = id_column < last_id if descending else id_column > last_id
+        if last_value is None:
+            # Within the NULLs, which end the ordering
+            query = query.filter(sort_column.is_(None), after_id)
+        else:
+            terms = [
+                sort_column < last_value if descending else sort_column > last_value,
+                and_(sort_column == last_value, after_id),
+            ]
+            if nullable:
+                terms.append(sort_column.is_(None))
+            query = query.filter(or_(*terms))
+
+    order = sort_column.desc() if descending else sort_column.asc()
+    if nullable:
+        order = order.nulls_last()
+    query = query.order_by(order, id_column.desc() if descending else id_column.asc())
+
+    # Fetch one extra row to learn whether another page exists
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, sort_column.key), getattr(last, id_column.key)])
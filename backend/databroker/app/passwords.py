@@ -0,0 +1,126 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+import asyncio
+import logging
+import threading
+import time
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Password hashing off the request path. bcrypt is deliberately slow (about
+# 250 ms per hash at the default cost) and releases the GIL while it works,
+# so hashes run on a small dedicated thread pool: at most
+# settings.password_hash_workers at once, with up to
+# settings.password_hash_queue more waiting their turn. Beyond that callers
+# are turned away with a 503 instead of queueing the whole API behind a
+# login storm. Queue wait and rejections are reported by stats().
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# Verified instead when the username does not exist, so a failed login takes
+# as long for an unknown user as for a wrong password
+DUMMY_HASH = "$2b$12$8jfFynkSUKTtgW9VgYnmdORJcUxwLw/sE71AMmYwBUxryjAkvkFMK"
+
+# Log when a hash waited this long for a free worker, in seconds
+SLOW_WAIT = 1.0
+
+class PasswordHashingBusy(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many password operations in progress, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
+class PasswordHasher:
+    def __init__(self, workers: int, max_queued: int, context: CryptContext = pwd_context):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.context = context
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._work_total = 0.0
+
+    def _submit(self, fn: Callable, *args) -> Future:
+        with self._lock:
+            if self._pending >= self.workers + self.max_queued:
+                self._rejected += 1
+                raise PasswordHashingBusy()
+            self._pending += 1
+        submitted = time.monotonic()
+
+        def run():
+            started = time.monotonic()
+            waited = started - submitted
+            with self._lock:
+                self._running += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            if waited >= SLOW_WAIT:
+                logger.warning(f"Password hash waited {waited:.1f}s for a worker")
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._pending -= 1
+                    self._running -= 1
+                    self._completed += 1
+                    self._work_total += time.monotonic() - started
+
+        try:
+            return self._executor.submit(run)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+
+    def hash(self, password: str) -> str:
+        return self._submit(self.context.hash, password).result()
+
+    def verify(self, password: str, hashed: str) -> bool:
+        return self._submit(self.context.verify, password, hashed).result()
+
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(self.context.hash, password))
+
+    async def verify_async(self, password: str, hashed: str) -> bool:
+        return await asyncio.wrap_future(self._submit(self.context.verify, password, hashed))
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "max_queued": self.max_queued,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_wait": self._wait_total / self._completed if self._completed else 0.0,
+                "max_wait": self._wait_max,
+                "avg_duration": self._work_total / self._completed if self._completed else 0.0,
+            }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+_hasher: Optional[PasswordHasher] = None
+_hasher_lock = threading.Lock()
+
+def get_hasher() -> PasswordHasher:
+    global _hasher
+    with _hasher_lock:
+        if _hasher is None:
+            _hasher = PasswordHasher(settings.password_hash_workers, settings.password_hash_queue)
+        return _hasher
+
+def stats() -> Dict[str, float]:
+    return get_hasher().stats()
@@ -0,0 +1,232 @@
+from collections import OrderedDict
+from typing import Any, AsyncIterable, Callable, Dict, Iterable, List, Mapping, Optional, Tuple, Type, Union, get_args, get_origin
+import hashlib
+import threading
+import orjson
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
+from .config import settings
+
+# Fast path for list endpoints. Rows come from our own database and already
+# match the response schema, so instead of validating every row into a
+# pydantic model and encoding it through jsonable_encoder, the schema is
+# compiled once into a plain row -> dict function and the result is encoded
+# with orjson. The output is the same JSON the response_model would produce;
+# routes keep response_model for the OpenAPI docs.
+#
+# Clients sending "Accept: application/x-ndjson" get one object per line,
+# streamed. stream_list also streams plain JSON arrays, for results too big
+# to build in memory.
+
+NDJSON = "application/x-ndjson"
+# Rows encoded per chunk when streaming
+STREAM_CHUNK = 500
+
+RowSerializer = Callable[[Any], dict]
+
+_serializers: Dict[type, RowSerializer] = {}
+
+def _nested_model(annotation) -> Tuple[Optional[Type[BaseModel]], bool]:
+    # The ORM-backed model in M, Optional[M] or List[M], and whether it is a list
+    origin = get_origin(annotation)
+    if origin is list:
+        model, _ = _nested_model(get_args(annotation)[0])
+        return model, True
+    if origin is Union:
+        for arg in get_args(annotation):
+            if arg is not type(None):
+                return _nested_model(arg)
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel) \
+            and annotation.model_config.get("from_attributes"):
+        return annotation, False
+    return None, False
+
+def serializer(schema: Type[BaseModel]) -> RowSerializer:
+    """Compile ``schema`` into a function turning an ORM row into a JSON-ready dict."""
+    if schema in _serializers:
+        return _serializers[schema]
+
+    fields = []
+    for name, field in schema.model_fields.items():
+        model, many = _nested_model(field.annotation)
+        default = None if field.is_required() else field.get_default(call_default_factory=True)
+        fields.append((name, serializer(model) if model else None, many, default))
+
+    def to_dict(row) -> dict:
+        record = {}
+        for name, nested, many, default in fields:
+            value = getattr(row, name, default)
+            if nested is not None and value is not None:
+                value = [nested(item) for item in value] if many else nested(value)
+            record[name] = value
+        return record
+
+    _serializers[schema] = to_dict
+    return to_dict
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON in request.headers.get("accept", "")
+
+def json_list(
+    request: Request,
+    rows: Iterable,
+    schema: Type[BaseModel],
+    headers: Optional[Mapping[str, str]] = None,
+) -> Response:
+    """Respond with ``rows`` as a JSON array of ``schema``, or NDJSON if the client asked for it."""
+    to_dict = serializer(schema)
+    if wants_ndjson(request):
+        return stream_list(request, rows, schema, headers)
+    return Response(orjson.dumps([to_dict(row) for row in rows]), media_type="application/json", headers=headers)
+
+# Responses holding secrets (device passwords) must not be kept by browsers,
+# proxies or the response cache below
+NO_STORE = {"Cache-Control": "private, no-store"}
+
+def no_store(response: Response):
+    """Router dependency adding NO_STORE to every response returned as a model."""
+    response.headers.update(NO_STORE)
+
+# Conditional GETs for versioned collections (app/versions.py). The ETag is
+# derived from the URL and the versions of the tables the response is built
+# from, so it is known before any row is read: a matching If-None-Match is
+# answered with 304, and otherwise the body is served from an in-process
+# cache keyed by the ETag while the versions stay the same. Writes change
+# the versions, so stale entries are never hit and age out of the cache.
+
+class ResponseCache:
+    """Response bodies by ETag, least recently used first out once over ``max_bytes``."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[bytes, str]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, etag: str) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            entry = self._entries.get(etag)
+            if entry is not None:
+                self._entries.move_to_end(etag)
+            return entry
+
+    def put(self, etag: str, body: bytes, media_type: str):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(etag, None)
+            if previous is not None:
+                self._size -= len(previous[0])
+            self._entries[etag] = (body, media_type)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+response_cache = ResponseCache(settings.response_cache_bytes)
+
+def make_etag(request: Request, versions: Iterable[Tuple[str, int]]) -> str:
+    query = sorted(request.query_params.multi_items())
+    key = repr((request.url.path, query, wants_ndjson(request), tuple(versions)))
+    return '"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+def _etag_headers(etag: str) -> Dict[str, str]:
+    # no-cache: browsers keep the response but revalidate it on every use
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+def cached_response(request: Request, versions: Iterable[Tuple[str, int]]) -> Tuple[str, Optional[Response]]:
+    """The ETag for the current versions, and a 304 or cached response if there is one.
+
+    Read the versions before the data: a write committed in between then
+    only costs a cache miss, never a stale body under a new ETag.
+    """
+    etag = make_etag(request, versions)
+    if _etag_matches(request, etag):
+        return etag, Response(status_code=304, headers=_etag_headers(etag))
+    cached = response_cache.get(etag)
+    if cached is not None:
+        body, media_type = cached
+        return etag, Response(body, media_type=media_type, headers=_etag_headers(etag))
+    return etag, None
+
+def cache_json(request: Request, etag: str, content, schema: Type[BaseModel]) -> Response:
+    """Encode ``content`` (a row, or a list of rows) as ``schema``, cache it under ``etag`` and respond."""
+    to_dict = serializer(schema)
+    if not isinstance(content, list):
+        body, media_type = orjson.dumps(to_dict(content)), "application/json"
+    elif wants_ndjson(request):
+        body, media_type = b"".join(orjson.dumps(to_dict(row)) + b"\n" for row in content), NDJSON
+    else:
+        body, media_type = orjson.dumps([to_dict(row) for row in content]), "application/json"
+    response_cache.put(etag, body, media_type)
+    return Response(body, media_type=media_type, headers=_etag_headers(etag))
+
+class _Encoder:
+    # Encodes rows a chunk at a time, as one JSON array or as NDJSON lines
+    def __init__(self, to_dict: RowSerializer, ndjson: bool):
+        self.to_dict = to_dict
+        self.ndjson = ndjson
+        self.records: List[dict] = []
+        self.started = False
+
+    def add(self, row) -> Optional[bytes]:
+        self.records.append(self.to_dict(row))
+        if len(self.records) >= STREAM_CHUNK:
+            return self.flush()
+        return None
+
+    def flush(self) -> bytes:
+        records, self.records = self.records, []
+        if self.ndjson:
+            return b"".join(orjson.dumps(record) + b"\n" for record in records)
+        chunk = b",".join(orjson.dumps(record) for record in records)
+        if not self.started:
+            self.started = True
+            return b"[" + chunk
+        return b"," + chunk if chunk else b""
+
+    def finish(self) -> bytes:
+        chunk = self.flush()
+        return chunk if self.ndjson else chunk + b"]"
+
+def _iter_chunks(rows: Iterable, encoder: _Encoder):
+    for row in rows:
+        chunk = encoder.add(row)
+        if chunk:
+            yield chunk
+    yield encoder.finish()
+
+async def _aiter_chunks(rows: AsyncIterable, encoder: _Encoder):
+    async for row in rows:
+        chunk = encoder.add(row)
+        if chunk:
+            yield chunk
+    yield encoder.finish()
+
+def stream_list(
+    request: Request,
+    rows: Union[Iterable, AsyncIterable],
+    schema: Type[BaseModel],
+    headers: Optional[Mapping[str, str]] = None,
+    ndjson: Optional[bool] = None,
+) -> StreamingResponse:
+    """Stream ``rows`` (e.g. a yield_per query) as a JSON array, or as NDJSON if the client asked for it."""
+    if ndjson is None:
+        ndjson = wants_ndjson(request)
+    encoder = _Encoder(serializer(schema), ndjson)
+    chunks = _aiter_chunks(rows, encoder) if hasattr(rows, "__aiter__") else _iter_chunks(rows, encoder)
+    return StreamingResponse(chunks, media_type=NDJSON if ndjson else "application/json", headers=headers)
@@ -2,28 +2,27 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from typing import List
 import uuid
-import bcrypt
 from ..database import get_db
 from ..models.admin import Admin
 from ..schemas.admin_schemas import AdminCreate, AdminUpdate, Admin as AdminSchema, AdminRole
-from ..auth import get_password_hash, check_admin_permission, get_current_admin
+from .. import auth
+from ..auth import get_password_hash, check_admin_permission, invalidate_principal
 import logging
 
 router = APIRouter(prefix="/api/admins", tags=["admins"])
 logger = logging.getLogger(__name__)
 
 def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(password.encode(), salt).decode()
+    return get_password_hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
+    return auth.verify_password(plain_password, hashed_password)
 
 @router.post("/", response_model=AdminSchema)
 def create_admin(
     admin: AdminCreate,
     db: Session = Depends(get_db),
-    current_admin: Admin = Depends(lambda: check_admin_permission(min_role=AdminRole.SUPER_ADMIN.value))
+    current_admin: Admin = Depends(check_admin_permission(min_role=AdminRole.SUPER_ADMIN.value))
 ):
     db_admin = db.query(Admin).filter(Admin.username == admin.username).first()
     if db_admin:
@@ -52,7 +51,7 @@ def get_admins(
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(get_db),
-    _: Admin = Depends(lambda: check_admin_permission(min_role=AdminRole.READ_ONLY))
+    _: Admin = Depends(check_admin_permission(min_role=AdminRole.READ_ONLY))
 ):
     try:
         from datetime import datetime
@@ -71,7 +70,7 @@ def get_admins(
 def get_admin(
     admin_id: str,
     db: Session = Depends(get_db),
-    _: Admin = Depends(lambda: check_admin_permission(min_role=AdminRole.READ_ONLY))
+    _: Admin = Depends(check_admin_permission(min_role=AdminRole.READ_ONLY))
 ):
     try:
         admin = db.query(Admin).filter(Admin.id == admin_id).first()
@@ -87,7 +86,7 @@ def update_admin(
     admin_id: str,
     admin: AdminUpdate,
     db: Session = Depends(get_db),
-    current_admin: Admin = Depends(lambda: check_admin_permission(min_role=AdminRole.SUPER_ADMIN))
+    current_admin: Admin = Depends(check_admin_permission(min_role=AdminRole.SUPER_ADMIN))
 ):
     try:
         db_admin = db.query(Admin).filter(Admin.id == admin_id).first()
@@ -98,12 +97,16 @@ def update_admin(
         if "password" in update_data:
             update_data["password"] = get_password_hash(update_data["password"])
         
+        username = db_admin.username
         for key, value in update_data.items():
             setattr(db_admin, key, value)
         
         db.commit()
+        invalidate_principal(username, db_admin.username)
         db.refresh(db_admin)
         return db_admin
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error updating admin: {str(e)}")
         raise HTTPException(status_code=500, detail="Error updating admin")
@@ -112,7 +115,7 @@ def update_admin(
 def delete_admin(
     admin_id: str,
     db: Session = Depends(get_db),
-    current_admin: Admin = Depends(lambda: check_admin_permission(min_role=AdminRole.SUPER_ADMIN))
+    current_admin: Admin = Depends(check_admin_permission(min_role=AdminRole.SUPER_ADMIN))
 ):
     try:
         if admin_id == current_admin.id:
@@ -122,9 +125,13 @@ def delete_admin(
         if db_admin is None:
             raise HTTPException(status_code=404, detail="Admin not found")
         
+        username = db_admin.username
         db.delete(db_admin)
         db.commit()
+        invalidate_principal(username)
         return {"message": "Admin deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error deleting admin: {str(e)}")
         raise HTTPException(status_code=500, detail="Error deleting admin")
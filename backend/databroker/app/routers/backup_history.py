@@ -1,17 +1,121 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import func
 from sqlalchemy.orm import Session
+from typing import Iterator, List, Literal, Optional
+import csv
+import io
 from ..database import get_db
 from ..models.models import BackupHistory
+from ..auth import get_current_user
+from ..config_store.blobs import read_config
+from ..filters import BackupHistoryFilter
+from ..pagination import keyset_paginate, parse_sort
+from ..responses import STREAM_CHUNK, json_list, serializer, stream_list
+from ..schemas.backup_history_schemas import BackupHistory as BackupHistorySchema
 import logging
 
-router = APIRouter(prefix="/api/backup-history", tags=["backup-history"])
+# Every backup history route requires a logged-in user, including any added later
+router = APIRouter(
+    prefix="/api/backup-history",
+    tags=["backup-history"],
+    dependencies=[Depends(get_current_user)],
+)
 logger = logging.getLogger(__name__)
 
-@router.get("/")
-async def get_backup_history(db: Session = Depends(get_db)):
+SORTABLE_COLUMNS = {
+    "created_at": BackupHistory.created_at,
+}
+
+# Columns only, so exported rows are not tracked by the session
+EXPORT_COLUMNS = [getattr(BackupHistory, field) for field in BackupHistorySchema.model_fields]
+
+@router.get("/", response_model=List[BackupHistorySchema])
+def get_backup_history(
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    sort: str = "-created_at",
+    include_total: bool = False,
+    filters: BackupHistoryFilter = Depends(),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    # Paged like the device list: X-Next-Cursor is passed back as ?cursor=.
+    # Counting can scan millions of rows, so X-Total-Count is opt-in.
+    sort_column, descending = parse_sort(sort, SORTABLE_COLUMNS)
     try:
-        history = db.query(BackupHistory).all()
-        return history
+        history, next_cursor = keyset_paginate(
+            filters.apply(db.query(BackupHistory)), sort_column, BackupHistory.id, descending, cursor, limit
+        )
+        headers = {}
+        if include_total:
+            headers["X-Total-Count"] = str(filters.apply(db.query(func.count(BackupHistory.id))).scalar())
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+        return json_list(request, history, BackupHistorySchema, headers)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting backup history: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching backup history")
+
+def _iter_csv(rows) -> Iterator[str]:
+    to_dict = serializer(BackupHistorySchema)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(BackupHistorySchema.model_fields)
+    for number, row in enumerate(rows, 1):
+        record = to_dict(row)
+        writer.writerow([
+            value.isoformat() if hasattr(value, "isoformat") else getattr(value, "value", value)
+            for value in record.values()
+        ])
+        if number % STREAM_CHUNK == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+@router.get("/export")
+def export_backup_history(
+    request: Request,
+    file_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    filters: BackupHistoryFilter = Depends(),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    # Rows are read from a server-side cursor (stream_results) a chunk at a
+    # time and written out as they arrive, so memory use does not grow with
+    # the size of the export
+    rows = (
+        filters.apply(db.query(*EXPORT_COLUMNS))
+        .order_by(BackupHistory.created_at, BackupHistory.id)
+        .yield_per(STREAM_CHUNK)
+    )
+    headers = {"Content-Disposition": f'attachment; filename="backup-history.{file_format}"'}
+    if file_format == "csv":
+        return StreamingResponse(_iter_csv(rows), media_type="text/csv", headers=headers)
+    return stream_list(request, rows, BackupHistorySchema, headers, ndjson=True)
+
+@router.get("/{history_id}/config", response_class=PlainTextResponse)
+def get_backup_config(
+    history_id: str,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    entry = db.query(BackupHistory).filter(BackupHistory.id == history_id).first()
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Backup not found")
+    if not entry.config_file_path:
+        raise HTTPException(status_code=404, detail="No configuration stored for this backup")
+
+    try:
+        config = read_config(entry.config_file_path)
+    except FileNotFoundError:
+        logger.error(f"Configuration missing for backup {history_id}: {entry.config_file_path}")
+        raise HTTPException(status_code=404, detail="Configuration file not found")
+    except Exception as e:
+        logger.error(f"Error reading configuration for backup {history_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error reading configuration")
+    return PlainTextResponse(config.decode(errors="replace"))
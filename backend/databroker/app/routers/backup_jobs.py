@@ -0,0 +1,63 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from ..database import get_db
+from ..models.models import BackupJob as BackupJobModel, Device, DeviceStatus, JobStatus
+from ..auth import get_current_user
+from ..collector.queue import enqueue
+from ..schemas.backup_job_schemas import BackupJob, BackupJobRequest, BackupJobsQueued
+import logging
+
+# The API only queues backups; collector workers (app/collector/worker.py) run them
+router = APIRouter(prefix="/api/backup-jobs", tags=["backup-jobs"])
+logger = logging.getLogger(__name__)
+
+@router.post("/", response_model=BackupJobsQueued)
+def queue_backups(
+    request: BackupJobRequest,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    try:
+        selected = db.query(Device.id)
+        if request.device_ids is not None:
+            selected = selected.filter(Device.id.in_(request.device_ids))
+        if request.filter is not None:
+            selected = request.filter.to_filter().apply(selected)
+        if request.device_ids is None and request.filter is None:
+            selected = selected.filter(Device.status == DeviceStatus.ACTIVE)
+        return {"queued": enqueue(db, selected)}
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error queueing backups: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error queueing backups")
+
+@router.get("/", response_model=List[BackupJob])
+def get_backup_jobs(
+    status: Optional[JobStatus] = None,
+    device_id: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    try:
+        query = db.query(BackupJobModel)
+        if status is not None:
+            query = query.filter(BackupJobModel.status == status)
+        if device_id is not None:
+            query = query.filter(BackupJobModel.device_id == device_id)
+        return query.order_by(BackupJobModel.created_at.desc()).limit(limit).all()
+    except Exception as e:
+        logger.error(f"Error fetching backup jobs: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error fetching backup jobs")
+
+@router.get("/{job_id}", response_model=BackupJob)
+def get_backup_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    job = db.query(BackupJobModel).filter(BackupJobModel.id == job_id).first()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Backup job not found")
+    return job
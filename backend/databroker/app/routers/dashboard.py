@@ -1,39 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
-from ..database import get_db
-from ..models.models import Device, BackupHistory
+from typing import Literal
+from ..database import get_async_db
+from ..models.models import Device, BackupHistory, DeviceStatus
 from ..auth import get_current_user
-from ..schemas.dashboard_schemas import DashboardStats
+from ..schemas.dashboard_schemas import BackupTrend, DashboardStats
+from .. import stats
 
 router = APIRouter(prefix="/api/dashboard", tags=["dashboard"])
 
 @router.get("/stats", response_model=DashboardStats)
 async def get_dashboard_stats(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
-    # Get device statistics
-    total_devices = db.query(func.count(Device.id)).scalar() or 0
-    active_devices = db.query(func.count(Device.id)).filter(Device.status == "active").scalar() or 0
+    # Device counts are cached and backup counts come from the hourly rollup,
+    # so neither scans the devices or backup_history tables
+    device_counts = await db.run_sync(stats.device_status_counts)
+    total_devices = sum(device_counts.values())
+    active_devices = device_counts.get(DeviceStatus.ACTIVE, 0)
     inactive_devices = total_devices - active_devices
 
     # Get backup statistics for the last 24 hours
     last_24h = datetime.utcnow() - timedelta(hours=24)
-    total_backups = db.query(func.count(BackupHistory.id))\
-        .filter(BackupHistory.created_at >= last_24h).scalar() or 0
-    successful_backups = db.query(func.count(BackupHistory.id))\
-        .filter(BackupHistory.created_at >= last_24h)\
-        .filter(BackupHistory.status == "success").scalar() or 0
+    total_backups, successful_backups, _ = await db.run_sync(stats.backup_totals, last_24h)
     failed_backups = total_backups - successful_backups
 
-    # Get recent activities
-    recent_activities = db.query(BackupHistory)\
-        .join(Device)\
-        .order_by(BackupHistory.created_at.desc())\
-        .limit(10)\
-        .all()
+    # Get recent activities (device name comes from the join, not a lazy load per row)
+    recent_activities = (await db.execute(
+        select(
+            BackupHistory.id,
+            Device.name.label("device_name"),
+            BackupHistory.status,
+            BackupHistory.message,
+            BackupHistory.created_at,
+        )
+        .join(Device, BackupHistory.device_id == Device.id)
+        .order_by(BackupHistory.created_at.desc())
+        .limit(10)
+    )).all()
 
     return {
         "total_devices": total_devices,
@@ -45,7 +52,7 @@ async def get_dashboard_stats(
         "recent_activities": [
             {
                 "id": str(activity.id),
-                "device_name": activity.device.name,
+                "device_name": activity.device_name,
                 "status": activity.status,
                 "message": activity.message or "",  
                 "created_at": activity.created_at.isoformat()
@@ -53,3 +60,16 @@ async def get_dashboard_stats(
             for activity in recent_activities
         ]
     }
+
+@router.get("/trends", response_model=BackupTrend)
+async def get_backup_trends(
+    granularity: Literal["hour", "day"] = "hour",
+    days: int = Query(7, ge=1, le=365),
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user)
+):
+    since = datetime.utcnow() - timedelta(days=days)
+    return {
+        "granularity": granularity,
+        "points": await db.run_sync(stats.backup_trend, since, granularity),
+    }
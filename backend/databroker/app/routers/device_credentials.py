@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from ..database import get_db
+from ..database import get_async_db
 from ..models.models import DeviceCredentials, Device
 from ..schemas.device_credentials_schemas import (
     DeviceCredentials as DeviceCredentialsSchema,
@@ -9,21 +10,27 @@ from ..schemas.device_credentials_schemas import (
     DeviceCredentialsUpdate,
 )
 from ..auth import get_current_user
+from ..responses import NO_STORE, json_list, no_store
 import logging
 
-router = APIRouter(prefix="/api/device-credentials", tags=["device_credentials"])
+# Responses include the passwords, so they are never cached (see responses.NO_STORE)
+router = APIRouter(
+    prefix="/api/device-credentials",
+    tags=["device_credentials"],
+    dependencies=[Depends(no_store)],
+)
 logger = logging.getLogger(__name__)
 
 @router.post("/", response_model=DeviceCredentialsSchema)
 async def create_device_credentials(
     credentials: DeviceCredentialsCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     # Only check device if device_id is provided
     if credentials.device_id:
         # Check if device exists
-        device = db.query(Device).filter(Device.id == credentials.device_id).first()
+        device = await db.scalar(select(Device.id).where(Device.id == credentials.device_id))
         if not device:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -31,9 +38,9 @@ async def create_device_credentials(
             )
 
         # Check if credentials already exist for this device
-        existing_credentials = db.query(DeviceCredentials).filter(
+        existing_credentials = await db.scalar(select(DeviceCredentials.id).where(
             DeviceCredentials.device_id == credentials.device_id
-        ).first()
+        ))
         if existing_credentials:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -42,27 +49,28 @@ async def create_device_credentials(
 
     db_credentials = DeviceCredentials(**credentials.dict())
     db.add(db_credentials)
-    db.commit()
-    db.refresh(db_credentials)
+    await db.commit()
+    await db.refresh(db_credentials)
     return db_credentials
 
 @router.get("/", response_model=List[DeviceCredentialsSchema])
 async def get_all_device_credentials(
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
-    credentials = db.query(DeviceCredentials).all()
-    return credentials
+    result = await db.execute(select(DeviceCredentials))
+    return json_list(request, result.scalars().all(), DeviceCredentialsSchema, headers=NO_STORE)
 
 @router.get("/{device_id}", response_model=DeviceCredentialsSchema)
 async def get_device_credentials(
     device_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
-    credentials = db.query(DeviceCredentials).filter(
+    credentials = await db.scalar(select(DeviceCredentials).where(
         DeviceCredentials.device_id == device_id
-    ).first()
+    ))
     if not credentials:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -74,12 +82,12 @@ async def get_device_credentials(
 async def update_device_credentials(
     device_id: str,
     credentials: DeviceCredentialsUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
-    db_credentials = db.query(DeviceCredentials).filter(
+    db_credentials = await db.scalar(select(DeviceCredentials).where(
         DeviceCredentials.device_id == device_id
-    ).first()
+    ))
     if not db_credentials:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -89,25 +97,25 @@ async def update_device_credentials(
     for field, value in credentials.dict(exclude_unset=True).items():
         setattr(db_credentials, field, value)
 
-    db.commit()
-    db.refresh(db_credentials)
+    await db.commit()
+    await db.refresh(db_credentials)
     return db_credentials
 
 @router.delete("/{device_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_device_credentials(
     device_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
-    credentials = db.query(DeviceCredentials).filter(
+    credentials = await db.scalar(select(DeviceCredentials).where(
         DeviceCredentials.device_id == device_id
-    ).first()
+    ))
     if not credentials:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Credentials not found"
         )
 
-    db.delete(credentials)
-    db.commit()
+    await db.delete(credentials)
+    await db.commit()
     return {"message": "Credentials deleted successfully"}
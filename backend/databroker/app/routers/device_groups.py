@@ -1,13 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import and_, delete, func, insert, literal, select, update
+from sqlalchemy.orm import Session
 from typing import List
 import uuid
 from databroker.app.database import get_db
 from databroker.app.models.models import DeviceGroup, Device, device_group_association
+from databroker.app.loading import DEVICE_GROUP_RESPONSE
+from databroker.app.dynamic_groups import refresh_group
+from databroker.app.responses import cache_json, cached_response
+from databroker.app.versions import DEVICE_GROUPS, collection_versions
 from databroker.app.schemas.device_group_schemas import (
     DeviceGroupCreate,
     DeviceGroupResponse,
     DeviceGroupUpdate,
+    GroupMembershipRequest,
+    GroupMembershipResult,
 )
 from pydantic import BaseModel
 import logging
@@ -18,14 +25,37 @@ logger = logging.getLogger(__name__)
 class DeviceIdRequest(BaseModel):
     device_id: str
 
+def _get_static_group(db: Session, group_id: str):
+    group = db.query(DeviceGroup.id, DeviceGroup.rules).filter(DeviceGroup.id == group_id).first()
+    if group is None:
+        raise HTTPException(status_code=404, detail="Device group not found")
+    if group.rules is not None:
+        raise HTTPException(status_code=400, detail="Members of a dynamic group are defined by its rules")
+    return group
+
+def _reschedule_members(db: Session, group_id: str):
+    # Members following the group's schedule get a new next_backup from the scheduler
+    db.execute(
+        update(Device)
+        .where(Device.id.in_(select(device_group_association.c.device_id).where(
+            device_group_association.c.group_id == group_id
+        )), Device.backup_schedule.is_(None))
+        .values(next_backup=None)
+    )
+
 @router.post("/", response_model=DeviceGroupResponse)
 def create_device_group(group: DeviceGroupCreate, db: Session = Depends(get_db)):
     try:
         db_group = DeviceGroup(
             id=str(uuid.uuid4()),
-            **group.model_dump()
+            **group.model_dump(mode="json")
         )
         db.add(db_group)
+        db.flush()
+        if db_group.rules is not None:
+            refresh_group(db.connection(), db_group.id, db_group.rules)
+        if db_group.backup_schedule is not None:
+            _reschedule_members(db, db_group.id)
         db.commit()
         db.refresh(db_group)
         return db_group
@@ -34,32 +64,40 @@ def create_device_group(group: DeviceGroupCreate, db: Session = Depends(get_db))
         raise HTTPException(status_code=500, detail="Error creating device group")
 
 @router.get("/", response_model=List[DeviceGroupResponse])
-def get_device_groups(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def get_device_groups(request: Request, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     try:
+        etag, cached = cached_response(request, collection_versions(db, DEVICE_GROUPS))
+        if cached is not None:
+            return cached
         groups = (
             db.query(DeviceGroup)
-            .options(joinedload(DeviceGroup.devices))
+            .options(*DEVICE_GROUP_RESPONSE)
             .offset(skip)
             .limit(limit)
             .all()
         )
-        return groups
+        return cache_json(request, etag, groups, DeviceGroupResponse)
     except Exception as e:
         logger.error(f"Error fetching device groups: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching device groups")
 
 @router.get("/{group_id}", response_model=DeviceGroupResponse)
-def get_device_group(group_id: str, db: Session = Depends(get_db)):
+def get_device_group(request: Request, group_id: str, db: Session = Depends(get_db)):
     try:
+        etag, cached = cached_response(request, collection_versions(db, DEVICE_GROUPS))
+        if cached is not None:
+            return cached
         group = (
             db.query(DeviceGroup)
-            .options(joinedload(DeviceGroup.devices))
+            .options(*DEVICE_GROUP_RESPONSE)
             .filter(DeviceGroup.id == group_id)
             .first()
         )
         if group is None:
             raise HTTPException(status_code=404, detail="Device group not found")
-        return group
+        return cache_json(request, etag, group, DeviceGroupResponse)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching device group: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching device group")
@@ -69,16 +107,23 @@ def update_device_group(group_id: str, group: DeviceGroupUpdate, db: Session = D
     try:
         db_group = (
             db.query(DeviceGroup)
-            .options(joinedload(DeviceGroup.devices))
+            .options(*DEVICE_GROUP_RESPONSE)
             .filter(DeviceGroup.id == group_id)
             .first()
         )
         if db_group is None:
             raise HTTPException(status_code=404, detail="Device group not found")
         
-        for key, value in group.model_dump().items():
+        schedule_changed = group.backup_schedule != db_group.backup_schedule
+        for key, value in group.model_dump(mode="json").items():
             setattr(db_group, key, value)
-        
+
+        # Members of a group that stops being dynamic stay as static members
+        db.flush()
+        if db_group.rules is not None:
+            refresh_group(db.connection(), db_group.id, db_group.rules)
+        if schedule_changed:
+            _reschedule_members(db, group_id)
         db.commit()
         db.refresh(db_group)
         return db_group
@@ -91,7 +136,7 @@ def delete_device_group(group_id: str, db: Session = Depends(get_db)):
     try:
         db_group = (
             db.query(DeviceGroup)
-            .options(joinedload(DeviceGroup.devices))
+            .options(*DEVICE_GROUP_RESPONSE)
             .filter(DeviceGroup.id == group_id)
             .first()
         )
@@ -112,28 +157,27 @@ def add_device_to_group(
     db: Session = Depends(get_db)
 ):
     try:
-        # Get the group
-        group = (
-            db.query(DeviceGroup)
-            .options(joinedload(DeviceGroup.devices))
-            .filter(DeviceGroup.id == group_id)
-            .first()
-        )
-        if group is None:
-            raise HTTPException(status_code=404, detail="Device group not found")
-
-        # Get the device
-        device = db.query(Device).filter(Device.id == request.device_id).first()
-        if device is None:
+        _get_static_group(db, group_id)
+        if db.query(Device.id).filter(Device.id == request.device_id).first() is None:
             raise HTTPException(status_code=404, detail="Device not found")
 
         # Add device to group if not already present
-        if device not in group.devices:
-            group.devices.append(device)
+        membership = and_(
+            device_group_association.c.group_id == group_id,
+            device_group_association.c.device_id == request.device_id,
+        )
+        if db.query(device_group_association).filter(membership).first() is None:
+            db.execute(insert(device_group_association).values(group_id=group_id, device_id=request.device_id))
             db.commit()
-            db.refresh(group)
 
-        return group
+        return (
+            db.query(DeviceGroup)
+            .options(*DEVICE_GROUP_RESPONSE)
+            .filter(DeviceGroup.id == group_id)
+            .first()
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error adding device to group: {str(e)}")
         raise HTTPException(status_code=500, detail="Error adding device to group")
@@ -141,28 +185,86 @@ def add_device_to_group(
 @router.delete("/{group_id}/devices/{device_id}")
 def remove_device_from_group(group_id: str, device_id: str, db: Session = Depends(get_db)):
     try:
-        # Get the group
-        group = (
-            db.query(DeviceGroup)
-            .options(joinedload(DeviceGroup.devices))
-            .filter(DeviceGroup.id == group_id)
-            .first()
-        )
-        if group is None:
-            raise HTTPException(status_code=404, detail="Device group not found")
-
-        # Get the device
-        device = db.query(Device).filter(Device.id == device_id).first()
-        if device is None:
+        _get_static_group(db, group_id)
+        if db.query(Device.id).filter(Device.id == device_id).first() is None:
             raise HTTPException(status_code=404, detail="Device not found")
 
         # Remove device from group if present
-        if device in group.devices:
-            group.devices.remove(device)
-            db.commit()
-            db.refresh(group)
+        db.execute(delete(device_group_association).where(and_(
+            device_group_association.c.group_id == group_id,
+            device_group_association.c.device_id == device_id,
+        )))
+        db.commit()
 
         return {"message": "Device removed from group successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error removing device from group: {str(e)}")
         raise HTTPException(status_code=500, detail="Error removing device from group")
+
+@router.post("/{group_id}/devices/bulk", response_model=GroupMembershipResult)
+def update_group_membership(
+    group_id: str,
+    request: GroupMembershipRequest,
+    db: Session = Depends(get_db)
+):
+    # Set-based: memberships are changed with INSERT ... SELECT and DELETE
+    # statements, without loading the group's devices
+    if request.device_ids is None and request.filter is None:
+        raise HTTPException(status_code=400, detail="Provide device_ids and/or filter")
+    _get_static_group(db, group_id)
+
+    try:
+        selected = db.query(Device.id)
+        if request.device_ids is not None:
+            selected = selected.filter(Device.id.in_(request.device_ids))
+        if request.filter is not None:
+            selected = request.filter.to_filter().apply(selected)
+        selected = selected.subquery()
+        members = select(device_group_association.c.device_id).where(
+            device_group_association.c.group_id == group_id
+        )
+        matched = db.query(func.count()).select_from(selected).scalar()
+
+        added = removed = 0
+        if request.action in ("remove", "replace"):
+            keep_selected = request.action == "replace"
+            in_selection = device_group_association.c.device_id.in_(select(selected.c.id))
+            removed = db.execute(delete(device_group_association).where(and_(
+                device_group_association.c.group_id == group_id,
+                ~in_selection if keep_selected else in_selection,
+            ))).rowcount
+        if request.action in ("add", "replace"):
+            added = db.execute(insert(device_group_association).from_select(
+                ["device_id", "group_id"],
+                select(selected.c.id, literal(group_id)).where(selected.c.id.not_in(members)),
+            )).rowcount
+        db.commit()
+
+        total = db.query(func.count()).select_from(members.subquery()).scalar()
+        return {"matched": matched, "added": added, "removed": removed, "total": total}
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error updating group membership: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error updating group membership")
+
+@router.post("/{group_id}/refresh", response_model=GroupMembershipResult)
+def refresh_dynamic_group(group_id: str, db: Session = Depends(get_db)):
+    # Dynamic groups follow device changes on their own; this re-evaluates
+    # everything, e.g. after locations were moved between sites
+    group = db.query(DeviceGroup.id, DeviceGroup.rules).filter(DeviceGroup.id == group_id).first()
+    if group is None:
+        raise HTTPException(status_code=404, detail="Device group not found")
+    if group.rules is None:
+        raise HTTPException(status_code=400, detail="Device group is not dynamic")
+    try:
+        added, removed = refresh_group(db.connection(), group_id, group.rules)
+        db.commit()
+        total = db.query(func.count()).select_from(device_group_association)\
+            .filter(device_group_association.c.group_id == group_id).scalar()
+        return {"matched": total, "added": added, "removed": removed, "total": total}
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error refreshing device group: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error refreshing device group")
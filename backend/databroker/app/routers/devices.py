@@ -1,15 +1,48 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Literal, Optional
 import uuid
 from ..database import get_db
-from ..models.models import Device as DeviceModel, DeviceGroup as DeviceGroupModel
-from ..schemas.schemas import Device, DeviceCreate, DeviceUpdate
+from ..models.models import (
+    Device as DeviceModel,
+    DeviceGroup as DeviceGroupModel,
+    BackupHistory,
+    BackupStatus,
+)
+from ..schemas.schemas import BulkImportResult, Device, DeviceCreate, DeviceUpdate
+from ..auth import get_current_user
+from ..config import settings
+from ..config_store.blobs import ConfigTooLarge, read_config
+from ..config_store.diff import iter_config_diff
+from ..filters import DeviceFilter
+from ..pagination import keyset_paginate, parse_sort
+from ..loading import DEVICE_RESPONSE
+from ..responses import json_list
+from ..device_io import export_devices, guess_format, import_devices, iter_rows
 import logging
 
 router = APIRouter(prefix="/api/devices", tags=["devices"])
 logger = logging.getLogger(__name__)
 
+SORTABLE_COLUMNS = {
+    "name": DeviceModel.name,
+    "ip_address": DeviceModel.ip_address,
+    "type": DeviceModel.type,
+    "status": DeviceModel.status,
+    "created_at": DeviceModel.created_at,
+    "last_backup": DeviceModel.last_backup,
+}
+
+def _load_device(db: Session, device_id: str) -> Optional[DeviceModel]:
+    return (
+        db.query(DeviceModel)
+        .options(*DEVICE_RESPONSE)
+        .filter(DeviceModel.id == device_id)
+        .first()
+    )
+
 @router.post("/", response_model=Device)
 def create_device(device: DeviceCreate, db: Session = Depends(get_db)):
     try:
@@ -25,25 +58,77 @@ def create_device(device: DeviceCreate, db: Session = Depends(get_db)):
 
         db.add(db_device)
         db.commit()
-        db.refresh(db_device)
-        return db_device
+        return _load_device(db, db_device.id)
     except Exception as e:
         logger.error(f"Error creating device: {str(e)}")
         raise HTTPException(status_code=500, detail="Error creating device")
 
 @router.get("/", response_model=List[Device])
-def get_devices(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def get_devices(
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    sort: str = "name",
+    include_total: bool = True,
+    filters: DeviceFilter = Depends(),
+    db: Session = Depends(get_db)
+):
+    # Paging state is returned in headers so the body stays a plain list:
+    # X-Next-Cursor is passed back as ?cursor= to fetch the next page.
+    sort_column, descending = parse_sort(sort, SORTABLE_COLUMNS)
     try:
-        devices = db.query(DeviceModel).offset(skip).limit(limit).all()
-        return devices
+        query = filters.apply(db.query(DeviceModel).options(*DEVICE_RESPONSE))
+        devices, next_cursor = keyset_paginate(
+            query, sort_column, DeviceModel.id, descending, cursor, limit
+        )
+        headers = {}
+        if include_total:
+            total = filters.apply(db.query(func.count(DeviceModel.id))).scalar()
+            headers["X-Total-Count"] = str(total)
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+        return json_list(request, devices, Device, headers)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching devices: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching devices")
 
+@router.post("/bulk", response_model=BulkImportResult)
+def import_devices_bulk(
+    file: UploadFile = File(...),
+    file_format: Optional[Literal["csv", "ndjson"]] = Query(None, alias="format"),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    # The format defaults to the file extension / content type
+    file_format = file_format or guess_format(file.filename, file.content_type)
+    try:
+        result = import_devices(db, iter_rows(file.file, file_format))
+    except Exception as e:
+        logger.error(f"Error importing devices: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error importing devices")
+    logger.info(f"Bulk import: {result.created} created, {result.updated} updated, {result.failed} failed")
+    return result
+
+@router.get("/bulk")
+def export_devices_bulk(
+    file_format: Literal["csv", "ndjson"] = Query("csv", alias="format"),
+    filters: DeviceFilter = Depends(),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    media_type = "text/csv" if file_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_devices(db, filters, file_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="devices.{file_format}"'},
+    )
+
 @router.get("/{device_id}", response_model=Device)
 def get_device(device_id: str, db: Session = Depends(get_db)):
     try:
-        device = db.query(DeviceModel).filter(DeviceModel.id == device_id).first()
+        device = _load_device(db, device_id)
         if device is None:
             raise HTTPException(status_code=404, detail="Device not found")
         return device
@@ -65,10 +150,12 @@ def update_device(device_id: str, device: DeviceUpdate, db: Session = Depends(ge
         if device.group_ids is not None:
             groups = db.query(DeviceGroupModel).filter(DeviceGroupModel.id.in_(device.group_ids)).all()
             db_device.groups = groups
+        if "backup_schedule" in update_data or device.group_ids is not None:
+            # The scheduler recomputes it from the new schedule
+            db_device.next_backup = None
         
         db.commit()
-        db.refresh(db_device)
-        return db_device
+        return _load_device(db, device_id)
     except Exception as e:
         logger.error(f"Error updating device: {str(e)}")
         raise HTTPException(status_code=500, detail="Error updating device")
@@ -86,3 +173,65 @@ def delete_device(device_id: str, db: Session = Depends(get_db)):
     except Exception as e:
         logger.error(f"Error deleting device: {str(e)}")
         raise HTTPException(status_code=500, detail="Error deleting device")
+
+@router.get("/{device_id}/diff")
+def get_device_config_diff(
+    device_id: str,
+    from_id: Optional[str] = Query(None, alias="from"),
+    to_id: Optional[str] = Query(None, alias="to"),
+    context: int = Query(3, ge=0, le=50),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    if db.query(DeviceModel.id).filter(DeviceModel.id == device_id).first() is None:
+        raise HTTPException(status_code=404, detail="Device not found")
+
+    # Default to the two most recent successful backups
+    if from_id is None or to_id is None:
+        latest = (
+            db.query(BackupHistory)
+            .filter(BackupHistory.device_id == device_id)
+            .filter(BackupHistory.status == BackupStatus.SUCCESS)
+            .filter(BackupHistory.config_file_path.isnot(None))
+            .order_by(BackupHistory.created_at.desc())
+            .limit(2)
+            .all()
+        )
+        if to_id is None and latest:
+            to_id = latest[0].id
+        if from_id is None and len(latest) > 1:
+            from_id = latest[1].id
+        if from_id is None or to_id is None:
+            raise HTTPException(status_code=400, detail="Device has fewer than two backups to compare")
+
+    entries = {
+        entry.id: entry
+        for entry in db.query(BackupHistory)
+        .filter(BackupHistory.device_id == device_id)
+        .filter(BackupHistory.id.in_([from_id, to_id]))
+        .all()
+    }
+    for history_id in (from_id, to_id):
+        entry = entries.get(history_id)
+        if entry is None or not entry.config_file_path:
+            raise HTTPException(status_code=404, detail=f"Backup {history_id} not found for this device")
+
+    # Revisions are stored as deltas whose copy operations can reference any
+    # line of the base revision, so they cannot be rebuilt as a line stream;
+    # both are read whole, up to config_diff_max_bytes each
+    limit = settings.config_diff_max_bytes
+    try:
+        old = read_config(entries[from_id].config_file_path, max_size=limit).decode(errors="replace")
+        new = read_config(entries[to_id].config_file_path, max_size=limit).decode(errors="replace")
+    except ConfigTooLarge as e:
+        raise HTTPException(status_code=413, detail=f"Cannot diff: {e}")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Configuration file not found")
+    except Exception as e:
+        logger.error(f"Error reading configurations for diff: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error reading configuration")
+
+    return StreamingResponse(
+        iter_config_diff(old, new, from_label=from_id, to_label=to_id, context=context),
+        media_type="text/x-diff",
+    )
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.orm import Session
 from typing import List
 import uuid
 from ..database import get_db
 from ..models.models import Location as LocationModel
 from ..schemas.schemas import Location, LocationCreate
+from ..loading import LOCATION_RESPONSE
+from ..responses import cache_json, cached_response
+from ..versions import LOCATIONS, collection_versions
 import logging
 
 router = APIRouter(prefix="/api/locations", tags=["locations"])
@@ -26,30 +29,41 @@ def create_location(location: LocationCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Error creating location")
 
 @router.get("/", response_model=List[Location])
-def get_locations(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def get_locations(request: Request, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     try:
-        locations = db.query(LocationModel).options(joinedload(LocationModel.site)).offset(skip).limit(limit).all()
-        return locations
+        etag, cached = cached_response(request, collection_versions(db, LOCATIONS))
+        if cached is not None:
+            return cached
+        locations = db.query(LocationModel).options(*LOCATION_RESPONSE).offset(skip).limit(limit).all()
+        return cache_json(request, etag, locations, Location)
     except Exception as e:
         logger.error(f"Error fetching locations: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching locations")
 
 @router.get("/site/{site_id}", response_model=List[Location])
-def get_locations_by_site(site_id: str, db: Session = Depends(get_db)):
+def get_locations_by_site(request: Request, site_id: str, db: Session = Depends(get_db)):
     try:
-        locations = db.query(LocationModel).options(joinedload(LocationModel.site)).filter(LocationModel.site_id == site_id).all()
-        return locations
+        etag, cached = cached_response(request, collection_versions(db, LOCATIONS))
+        if cached is not None:
+            return cached
+        locations = db.query(LocationModel).options(*LOCATION_RESPONSE).filter(LocationModel.site_id == site_id).all()
+        return cache_json(request, etag, locations, Location)
     except Exception as e:
         logger.error(f"Error fetching locations by site: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching locations by site")
 
 @router.get("/{location_id}", response_model=Location)
-def get_location(location_id: str, db: Session = Depends(get_db)):
+def get_location(request: Request, location_id: str, db: Session = Depends(get_db)):
     try:
-        location = db.query(LocationModel).options(joinedload(LocationModel.site)).filter(LocationModel.id == location_id).first()
+        etag, cached = cached_response(request, collection_versions(db, LOCATIONS))
+        if cached is not None:
+            return cached
+        location = db.query(LocationModel).options(*LOCATION_RESPONSE).filter(LocationModel.id == location_id).first()
         if location is None:
             raise HTTPException(status_code=404, detail="Location not found")
-        return location
+        return cache_json(request, etag, location, Location)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching location: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching location")
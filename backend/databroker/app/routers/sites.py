@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from typing import List
 import uuid
 from ..database import get_db
 from ..models.models import Site as SiteModel
 from ..schemas.schemas import Site, SiteCreate
+from ..responses import cache_json, cached_response
+from ..versions import SITES, collection_versions
 import logging
 
 router = APIRouter(prefix="/api/sites", tags=["sites"])
@@ -26,21 +28,29 @@ def create_site(site: SiteCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Error creating site")
 
 @router.get("/", response_model=List[Site])
-def get_sites(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def get_sites(request: Request, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     try:
+        etag, cached = cached_response(request, collection_versions(db, SITES))
+        if cached is not None:
+            return cached
         sites = db.query(SiteModel).offset(skip).limit(limit).all()
-        return sites
+        return cache_json(request, etag, sites, Site)
     except Exception as e:
         logger.error(f"Error fetching sites: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching sites")
 
 @router.get("/{site_id}", response_model=Site)
-def get_site(site_id: str, db: Session = Depends(get_db)):
+def get_site(request: Request, site_id: str, db: Session = Depends(get_db)):
     try:
+        etag, cached = cached_response(request, collection_versions(db, SITES))
+        if cached is not None:
+            return cached
         site = db.query(SiteModel).filter(SiteModel.id == site_id).first()
         if site is None:
             raise HTTPException(status_code=404, detail="Site not found")
-        return site
+        return cache_json(request, etag, site, Site)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching site: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching site")
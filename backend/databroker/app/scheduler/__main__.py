@@ -0,0 +1,50 @@
+import argparse
+import asyncio
+import logging
+from ..collector.engine import BackupEngine
+from ..collector.queue import QueueDispatcher
+from .service import BackupScheduler
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
+)
+
+async def once(scheduler: BackupScheduler):
+    try:
+        return await scheduler.tick()
+    finally:
+        await scheduler.engine.close_connections()
+
+def main():
+    parser = argparse.ArgumentParser(description="Back up network devices on their schedules")
+    parser.add_argument("--once", action="store_true", help="Back up the devices due now and exit")
+    parser.add_argument("--enqueue", action="store_true",
+                        help="Queue due devices for collector workers instead of backing them up here")
+    parser.add_argument("--max-concurrency", type=int, help="Global limit on concurrent sessions")
+    parser.add_argument("--site-concurrency", type=int, help="Limit on concurrent sessions per site")
+    args = parser.parse_args()
+
+    if args.enqueue:
+        engine = QueueDispatcher()
+    else:
+        engine = BackupEngine(max_concurrency=args.max_concurrency, site_concurrency=args.site_concurrency)
+    scheduler = BackupScheduler(engine)
+    try:
+        if args.once:
+            summary = asyncio.run(once(scheduler))
+            if summary is None:
+                print("No devices are due")
+            elif args.enqueue:
+                print(f"Queued {summary.total} devices")
+            else:
+                print(f"Backed up {summary.succeeded}/{summary.total} devices ({summary.failed} failed)")
+        else:
+            asyncio.run(scheduler.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+from datetime import datetime, timedelta
+import asyncio
+
+class Clock:
+    """Wall clock used by the scheduler (naive UTC, like the rest of the models)."""
+
+    def now(self) -> datetime:
+        return datetime.utcnow()
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+class FakeClock(Clock):
+    """A clock that only moves when told to; sleeping advances it instantly."""
+
+    def __init__(self, start: datetime):
+        self.current = start
+
+    def now(self) -> datetime:
+        return self.current
+
+    def advance(self, seconds: float):
+        self.current += timedelta(seconds=seconds)
+
+    async def sleep(self, seconds: float):
+        self.advance(seconds)
+        # Let other tasks run, as a real sleep would
+        await asyncio.sleep(0)
@@ -0,0 +1,122 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+import hashlib
+import re
+
+# Backup schedules. A schedule is a 5-field cron expression
+# ("minute hour day-of-month month day-of-week"), one of the @hourly /
+# @daily / @weekly / @monthly shortcuts, or "@every <n>[smhd]".
+
+SHORTCUTS = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+}
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+EPOCH = datetime(1970, 1, 1)
+
+class Schedule(ABC):
+    @abstractmethod
+    def next_after(self, at: datetime) -> datetime:
+        """The first run strictly after ``at``."""
+
+class IntervalSchedule(Schedule):
+    def __init__(self, seconds: int):
+        if seconds <= 0:
+            raise ValueError("interval must be positive")
+        self.seconds = seconds
+
+    def next_after(self, at: datetime) -> datetime:
+        # Runs are aligned to multiples of the interval since the epoch
+        elapsed = int((at - EPOCH).total_seconds())
+        return EPOCH + timedelta(seconds=(elapsed // self.seconds + 1) * self.seconds)
+
+def _parse_field(field: str, low: int, high: int) -> Set[int]:
+    values: Set[int] = set()
+    for part in field.split(","):
+        range_part, _, step = part.partition("/")
+        step_size = int(step) if step else 1
+        if range_part == "*":
+            start, end = low, high
+        elif "-" in range_part:
+            start, end = (int(value) for value in range_part.split("-", 1))
+        else:
+            start = int(range_part)
+            end = high if step else start
+        if not (low <= start <= end <= high) or step_size <= 0:
+            raise ValueError(f"'{part}' is out of range {low}-{high}")
+        values.update(range(start, end + 1, step_size))
+    return values
+
+class CronSchedule(Schedule):
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError("a cron expression has 5 fields")
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = _parse_field(fields[2], 1, 31)
+        self.months = _parse_field(fields[3], 1, 12)
+        # 0 and 7 are both Sunday; stored as Python weekdays (Monday = 0)
+        self.weekdays = {(day - 1) % 7 for day in _parse_field(fields[4], 0, 7)}
+        # As in cron, a restricted day-of-month and day-of-week match either
+        self.any_day = fields[2] == "*" or fields[4] == "*"
+        # Rejects expressions such as "0 0 30 2 *"
+        self.next_after(datetime(2000, 1, 1))
+
+    def _day_matches(self, at: datetime) -> bool:
+        in_days = at.day in self.days
+        in_weekdays = at.weekday() in self.weekdays
+        if self.any_day:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def next_after(self, at: datetime) -> datetime:
+        at = at.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Skip whole months, days and hours that cannot match
+        limit = at + timedelta(days=366 * 5)
+        while at < limit:
+            if at.month not in self.months:
+                at = (at.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(at):
+                at = at.replace(hour=0, minute=0) + timedelta(days=1)
+            elif at.hour not in self.hours:
+                at = at.replace(minute=0) + timedelta(hours=1)
+            elif at.minute not in self.minutes:
+                at += timedelta(minutes=1)
+            else:
+                return at
+        raise ValueError("the expression never matches")
+
+_EVERY = re.compile(r"^@every\s+(\d+)\s*([smhd])$")
+
+def parse_schedule(text: str) -> Schedule:
+    text = text.strip()
+    every = _EVERY.match(text)
+    try:
+        if every:
+            return IntervalSchedule(int(every.group(1)) * UNITS[every.group(2)])
+        return CronSchedule(SHORTCUTS.get(text, text))
+    except ValueError as e:
+        raise ValueError(f"Invalid schedule '{text}': {e}")
+
+def validate_schedule(text: Optional[str]) -> Optional[str]:
+    """Pydantic validator helper: raises ValueError for an invalid schedule."""
+    if text is not None:
+        parse_schedule(text)
+    return text
+
+def splay(device_id: str, window: int) -> timedelta:
+    """A stable per-device offset in [0, window) seconds, to spread out runs."""
+    if window <= 0:
+        return timedelta(0)
+    digest = hashlib.sha1(device_id.encode()).digest()
+    return timedelta(seconds=int.from_bytes(digest[:8], "big") % window)
+
+def next_run(schedules: List[Schedule], device_id: str, after: datetime, jitter: int) -> datetime:
+    """The device's next run: the earliest of its schedules, offset by its splay."""
+    offset = splay(device_id, jitter)
+    return min(schedule.next_after(after - offset) for schedule in schedules) + offset
@@ -0,0 +1,228 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set
+import asyncio
+import logging
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+from ..collector.engine import BackupEngine, BackupRunSummary
+from ..config import settings
+from ..database import SessionLocal
+from ..models.models import Device, DeviceGroup, DeviceStatus, device_group_association
+from .clock import Clock
+from .schedules import Schedule, next_run, parse_schedule, splay
+
+logger = logging.getLogger(__name__)
+
+_devices = Device.__table__
+
+def _set_next_backup(db: Session, rows: List[dict]):
+    # Rescheduling is not a change to the device, so updated_at and the
+    # collection versions are left alone
+    db.execute(
+        update(_devices)
+        .where(_devices.c.id == bindparam("device_id"))
+        .values(next_backup=bindparam("due"), updated_at=_devices.c.updated_at)
+        .execution_options(track_versions=False),
+        rows,
+    )
+
+class BackupScheduler:
+    """Starts backups of active devices when their next_backup comes due.
+
+    The (status, next_backup) index is the queue: each tick reads only the
+    earliest due devices, moves their next_backup to the following run of
+    their schedule, then hands them to the collection engine without
+    waiting for the backups, so a slow device cannot hold up the rest of
+    the schedule. A device's schedule is its own, else the earliest of its
+    groups', else the default. After downtime an overdue device runs once
+    and is then rescheduled from the current time, so missed runs are not
+    replayed.
+    """
+
+    def __init__(
+        self,
+        engine: Optional[BackupEngine] = None,
+        session_factory: Callable[[], Session] = SessionLocal,
+        clock: Optional[Clock] = None,
+        batch_size: Optional[int] = None,
+        jitter: Optional[int] = None,
+        max_sleep: Optional[float] = None,
+        default_schedule: Optional[str] = None,
+    ):
+        self.engine = engine or BackupEngine(session_factory=session_factory)
+        self.session_factory = session_factory
+        self.clock = clock or Clock()
+        self.batch_size = batch_size or settings.scheduler_batch_size
+        self.jitter = settings.scheduler_jitter if jitter is None else jitter
+        self.max_sleep = max_sleep or settings.scheduler_max_sleep
+        self.default_schedule = parse_schedule(default_schedule or settings.default_backup_schedule)
+        self._parsed: Dict[str, Schedule] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="backup-scheduler")
+        self._stopped = False
+        self._runs: Set[asyncio.Task] = set()
+
+    def _parse(self, text: str) -> Optional[Schedule]:
+        if text not in self._parsed:
+            try:
+                self._parsed[text] = parse_schedule(text)
+            except ValueError as e:
+                logger.error(f"Ignoring backup schedule: {str(e)}")
+                self._parsed[text] = None
+        return self._parsed[text]
+
+    def _schedules(self, db: Session, devices: List[tuple]) -> Dict[str, List[Schedule]]:
+        """Effective schedules for (id, backup_schedule, ...) device rows."""
+        schedules = {}
+        inherit = []
+        for device in devices:
+            own = self._parse(device.backup_schedule) if device.backup_schedule else None
+            if own:
+                schedules[device.id] = [own]
+            else:
+                inherit.append(device.id)
+        if inherit:
+            rows = (
+                db.query(device_group_association.c.device_id, DeviceGroup.backup_schedule)
+                .join(DeviceGroup, DeviceGroup.id == device_group_association.c.group_id)
+                .filter(device_group_association.c.device_id.in_(inherit))
+                .filter(DeviceGroup.backup_schedule.isnot(None))
+            )
+            for device_id, text in rows:
+                schedule = self._parse(text)
+                if schedule:
+                    schedules.setdefault(device_id, []).append(schedule)
+        for device_id in inherit:
+            schedules.setdefault(device_id, [self.default_schedule])
+        return schedules
+
+    def _schedule_new(self, db: Session, now: datetime) -> int:
+        """Give active devices without a next_backup one.
+
+        Devices never backed up are spread over the jitter window from now;
+        the rest continue from their last backup (due now if that run was missed).
+        """
+        devices = (
+            db.query(Device.id, Device.backup_schedule, Device.last_backup)
+            .filter(Device.status == DeviceStatus.ACTIVE, Device.next_backup.is_(None))
+            .limit(self.batch_size)
+            .all()
+        )
+        if not devices:
+            return 0
+        schedules = self._schedules(db, devices)
+        rows = []
+        for device in devices:
+            if device.last_backup is None:
+                due = now + splay(device.id, self.jitter)
+            else:
+                due = max(next_run(schedules[device.id], device.id, device.last_backup, self.jitter), now)
+            rows.append({"device_id": device.id, "due": due})
+        _set_next_backup(db, rows)
+        return len(rows)
+
+    def claim_due(self) -> List[str]:
+        """Reschedule the earliest due devices and return their ids."""
+        db = self.session_factory()
+        try:
+            now = self.clock.now()
+            while self._schedule_new(db, now) == self.batch_size:
+                pass
+            devices = (
+                db.query(Device.id, Device.backup_schedule)
+                .filter(Device.status == DeviceStatus.ACTIVE, Device.next_backup <= now)
+                .order_by(Device.next_backup)
+                .limit(self.batch_size)
+                .all()
+            )
+            if devices:
+                schedules = self._schedules(db, devices)
+                _set_next_backup(db, [
+                    {"device_id": device.id, "due": next_run(schedules[device.id], device.id, now, self.jitter)}
+                    for device in devices
+                ])
+            db.commit()
+            return [device.id for device in devices]
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def next_due(self) -> Optional[datetime]:
+        db = self.session_factory()
+        try:
+            return (
+                db.query(Device.next_backup)
+                .filter(Device.status == DeviceStatus.ACTIVE, Device.next_backup.isnot(None))
+                .order_by(Device.next_backup)
+                .limit(1)
+                .scalar()
+            )
+        finally:
+            db.close()
+
+    async def tick(self) -> Optional[BackupRunSummary]:
+        """Back up the devices due now, if any, and wait for the backups to finish."""
+        loop = asyncio.get_running_loop()
+        device_ids = await loop.run_in_executor(self._executor, self.claim_due)
+        if not device_ids:
+            return None
+        logger.info(f"Scheduled backup of {len(device_ids)} devices")
+        return await self.engine.run(device_ids)
+
+    def _start(self, device_ids: List[str]):
+        """Back up ``device_ids`` in the background."""
+        logger.info(f"Scheduled backup of {len(device_ids)} devices")
+        task = asyncio.create_task(self.engine.run(device_ids))
+        self._runs.add(task)
+        task.add_done_callback(self._finished)
+
+    def _finished(self, task: asyncio.Task):
+        self._runs.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Error in scheduled backup run: {str(task.exception())}")
+
+    async def run(self):
+        """Start due backups until stop() is called, sleeping until the next device is due.
+
+        Backups run in the background, so the next devices are started on
+        time however long earlier ones take; stopping waits for them.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while not self._stopped:
+                try:
+                    device_ids = await loop.run_in_executor(self._executor, self.claim_due)
+                except Exception as e:
+                    logger.error(f"Error in backup scheduler: {str(e)}")
+                    device_ids = []
+                if device_ids:
+                    self._start(device_ids)
+                    if len(device_ids) >= self.batch_size:
+                        # More may be due already
+                        continue
+                delay = self.max_sleep
+                try:
+                    due = await loop.run_in_executor(self._executor, self.next_due)
+                except Exception as e:
+                    logger.error(f"Error reading the backup schedule: {str(e)}")
+                    due = None
+                if due is not None:
+                    delay = min(delay, max((due - self.clock.now()).total_seconds(), 0))
+                await self.clock.sleep(delay)
+        except asyncio.CancelledError:
+            for task in self._runs:
+                task.cancel()
+            raise
+        finally:
+            if self._runs:
+                await asyncio.gather(*self._runs, return_exceptions=True)
+            await self.engine.close_connections()
+
+    def stop(self):
+        self._stopped = True
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.engine.close()
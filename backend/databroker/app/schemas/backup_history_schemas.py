@@ -0,0 +1,15 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+
+class BackupHistory(BaseModel):
+    id: str
+    device_id: str
+    status: str
+    message: Optional[str] = None
+    config_file_path: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
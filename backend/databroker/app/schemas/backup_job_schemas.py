@@ -0,0 +1,27 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+from ..filters import DeviceSelector
+
+class BackupJobRequest(BaseModel):
+    # Devices are selected by id, by filter, or both; neither means all active devices
+    device_ids: Optional[List[str]] = None
+    filter: Optional[DeviceSelector] = None
+
+class BackupJobsQueued(BaseModel):
+    queued: int
+
+class BackupJob(BaseModel):
+    id: str
+    device_id: str
+    status: str
+    attempts: int
+    available_at: datetime
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
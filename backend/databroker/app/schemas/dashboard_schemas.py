@@ -17,3 +17,13 @@ class DashboardStats(BaseModel):
     successful_backups: int
     failed_backups: int
     recent_activities: List[RecentActivity]
+
+class BackupTrendPoint(BaseModel):
+    bucket: datetime
+    total: int
+    succeeded: int
+    failed: int
+
+class BackupTrend(BaseModel):
+    granularity: str
+    points: List[BackupTrendPoint]
@@ -1,10 +1,19 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, field_validator
+from typing import List, Literal, Optional
 from datetime import datetime
+from ..dynamic_groups import GroupRules
+from ..filters import DeviceSelector
+from ..scheduler.schedules import validate_schedule
 
 class DeviceGroupBase(BaseModel):
     name: str
     description: Optional[str] = None
+    # Makes the group dynamic: members are the devices matching the rules
+    rules: Optional[GroupRules] = None
+    # Default backup schedule for members without their own
+    backup_schedule: Optional[str] = None
+
+    _valid_schedule = field_validator("backup_schedule")(validate_schedule)
 
 class DeviceGroupCreate(DeviceGroupBase):
     pass
@@ -30,3 +39,15 @@ class DeviceGroupResponse(DeviceGroupBase):
 
     class Config:
         from_attributes = True
+
+class GroupMembershipRequest(BaseModel):
+    # Devices are selected by id, by filter, or both (devices matching both)
+    action: Literal["add", "remove", "replace"]
+    device_ids: Optional[List[str]] = None
+    filter: Optional[DeviceSelector] = None
+
+class GroupMembershipResult(BaseModel):
+    matched: int
+    added: int
+    removed: int
+    total: int
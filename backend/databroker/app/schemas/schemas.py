@@ -1,7 +1,8 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional, List
 from datetime import datetime
 from enum import Enum
+from ..scheduler.schedules import validate_schedule
 
 class DeviceType(str, Enum):
     SWITCH = "Switch"
@@ -112,6 +113,10 @@ class DeviceBase(BaseModel):
     location_id: Optional[str] = None
     credential_id: Optional[str] = None
     config: Optional[dict] = None
+    # Cron expression or "@every <n>[smhd]"; unset uses the groups' schedules
+    backup_schedule: Optional[str] = None
+
+    _valid_schedule = field_validator("backup_schedule")(validate_schedule)
 
 class DeviceCreate(DeviceBase):
     group_ids: Optional[List[str]] = None
@@ -132,3 +137,27 @@ class Device(DeviceBase, BaseModelWithTimestamp):
 
     class Config:
         from_attributes = True
+
+# Bulk import/export. Site, location, credential and groups may be given
+# by id or by name (sites also by code); groups are ';'-separated in CSV.
+class DeviceImportRow(BaseModel):
+    id: Optional[str] = None
+    name: str
+    ip_address: str
+    type: DeviceType
+    status: Optional[DeviceStatus] = None
+    site: Optional[str] = None
+    location: Optional[str] = None
+    credential: Optional[str] = None
+    groups: Optional[List[str]] = None
+    config: Optional[dict] = None
+
+class BulkImportError(BaseModel):
+    row: int
+    error: str
+
+class BulkImportResult(BaseModel):
+    created: int = 0
+    updated: int = 0
+    failed: int = 0
+    errors: List[BulkImportError] = []
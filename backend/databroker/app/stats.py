@@ -0,0 +1,159 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+import threading
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from .models.models import BackupHistory, BackupStats, BackupStatus, Device, DeviceStatus
+from .versions import DEVICES, collection_versions
+
+logger = logging.getLogger(__name__)
+
+# Dashboard statistics without scanning devices/backup_history per request.
+# Backup results are rolled up into hourly buckets as they are written.
+#
+# Device status counts are not counters but a cache of one GROUP BY over
+# devices: each process keeps the last result with the devices collection
+# version it was read at (app/versions.py), and counts again once any
+# process has written a device. Backup bookkeeping does not change that
+# version, so the counts stay cached through backup runs.
+
+def bucket_start(at: datetime) -> datetime:
+    return at.replace(minute=0, second=0, microsecond=0)
+
+def record_backups(db: Session, results: Iterable[Tuple[BackupStatus, datetime]]):
+    """Add backup results to the hourly rollup. Runs in the caller's transaction."""
+    deltas: Dict[datetime, List[int]] = defaultdict(lambda: [0, 0, 0])
+    for status, at in results:
+        counts = deltas[bucket_start(at)]
+        counts[0] += 1
+        if status == BackupStatus.SUCCESS:
+            counts[1] += 1
+        elif status == BackupStatus.FAILED:
+            counts[2] += 1
+
+    for bucket, (total, succeeded, failed) in deltas.items():
+        _increment_bucket(db, bucket, total, succeeded, failed)
+
+def _increment_bucket(db: Session, bucket: datetime, total: int, succeeded: int, failed: int):
+    dialect = db.bind.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(BackupStats).values(bucket=bucket, total=total, succeeded=succeeded, failed=failed)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[BackupStats.bucket],
+            set_={
+                "total": BackupStats.total + stmt.excluded.total,
+                "succeeded": BackupStats.succeeded + stmt.excluded.succeeded,
+                "failed": BackupStats.failed + stmt.excluded.failed,
+            },
+        )
+        db.execute(stmt)
+        return
+
+    updated = db.query(BackupStats).filter(BackupStats.bucket == bucket).update({
+        BackupStats.total: BackupStats.total + total,
+        BackupStats.succeeded: BackupStats.succeeded + succeeded,
+        BackupStats.failed: BackupStats.failed + failed,
+    }, synchronize_session=False)
+    if not updated:
+        db.add(BackupStats(bucket=bucket, total=total, succeeded=succeeded, failed=failed))
+        db.flush()
+
+def rebuild_backup_stats(db: Session):
+    """Recompute the rollup from backup_history, e.g. for an existing database."""
+    db.query(BackupStats).delete(synchronize_session=False)
+    hour = func.strftime("%Y-%m-%d %H:00:00", BackupHistory.created_at) \
+        if db.bind.dialect.name == "sqlite" else func.date_trunc("hour", BackupHistory.created_at)
+    rows = (
+        db.query(hour.label("bucket"), BackupHistory.status, func.count(BackupHistory.id))
+        .filter(BackupHistory.created_at.isnot(None))
+        .group_by(hour, BackupHistory.status)
+        .all()
+    )
+    buckets: Dict[datetime, BackupStats] = {}
+    for bucket, status, count in rows:
+        if isinstance(bucket, str):
+            bucket = datetime.fromisoformat(bucket)
+        stats = buckets.setdefault(bucket, BackupStats(bucket=bucket, total=0, succeeded=0, failed=0))
+        stats.total += count
+        if status == BackupStatus.SUCCESS:
+            stats.succeeded += count
+        elif status == BackupStatus.FAILED:
+            stats.failed += count
+    db.add_all(buckets.values())
+    db.commit()
+    logger.info(f"Rebuilt backup statistics: {len(buckets)} hourly buckets")
+
+def backup_totals(db: Session, since: datetime) -> Tuple[int, int, int]:
+    """Backups started at or after ``since``: (total, succeeded, failed).
+
+    Whole hours come from the rollup. The part of the hour ``since`` falls
+    in is counted from backup_history instead, so no row is counted twice
+    and none from before ``since``.
+    """
+    first_bucket = bucket_start(since)
+    if first_bucket < since:
+        first_bucket += timedelta(hours=1)
+    total, succeeded, failed = db.query(
+        func.coalesce(func.sum(BackupStats.total), 0),
+        func.coalesce(func.sum(BackupStats.succeeded), 0),
+        func.coalesce(func.sum(BackupStats.failed), 0),
+    ).filter(BackupStats.bucket >= first_bucket).one()
+    if first_bucket > since:
+        rows = (
+            db.query(BackupHistory.status, func.count(BackupHistory.id))
+            .filter(BackupHistory.created_at >= since, BackupHistory.created_at < first_bucket)
+            .group_by(BackupHistory.status)
+            .all()
+        )
+        for status, count in rows:
+            total += count
+            if status == BackupStatus.SUCCESS:
+                succeeded += count
+            elif status == BackupStatus.FAILED:
+                failed += count
+    return total, succeeded, failed
+
+def backup_trend(db: Session, since: datetime, granularity: str = "hour") -> List[dict]:
+    since = bucket_start(since)
+    if granularity == "day":
+        since = since.replace(hour=0)
+    rows = (
+        db.query(BackupStats)
+        .filter(BackupStats.bucket >= since)
+        .order_by(BackupStats.bucket)
+        .all()
+    )
+    points: Dict[datetime, dict] = {}
+    for row in rows:
+        key = row.bucket if granularity == "hour" else row.bucket.replace(hour=0)
+        point = points.setdefault(key, {"bucket": key, "total": 0, "succeeded": 0, "failed": 0})
+        point["total"] += row.total
+        point["succeeded"] += row.succeeded
+        point["failed"] += row.failed
+    return list(points.values())
+
+_device_counts: Optional[Tuple[tuple, Dict[DeviceStatus, int]]] = None
+_device_counts_lock = threading.Lock()
+
+def device_status_counts(db: Session) -> Dict[DeviceStatus, int]:
+    global _device_counts
+    versions = collection_versions(db, DEVICES)
+    with _device_counts_lock:
+        if _device_counts is not None and _device_counts[0] == versions:
+            return _device_counts[1]
+    counts = dict(db.query(Device.status, func.count(Device.id)).group_by(Device.status).all())
+    with _device_counts_lock:
+        _device_counts = (versions, counts)
+    return counts
+
+def invalidate_device_counts():
+    # For when the versions themselves are reset, e.g. by clearing every table
+    global _device_counts
+    with _device_counts_lock:
+        _device_counts = None
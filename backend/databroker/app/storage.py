@@ -0,0 +1,178 @@
+from concurrent.futures import Future
+from typing import Callable, Generic, List, Optional, Sequence, Tuple, TypeVar
+import io
+import logging
+import queue
+import threading
+from sqlalchemy import Table, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+def configure_sqlite(engine: Engine):
+    """Apply the connection pragmas to every new connection of a SQLite engine.
+
+    WAL lets the API keep reading while a backup run writes, and the busy
+    timeout makes a writer wait for the lock instead of failing with
+    "database is locked".
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    in_memory = engine.url.database in (None, "", ":memory:")
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA busy_timeout = {settings.sqlite_busy_timeout}")
+            if not in_memory:
+                cursor.execute("PRAGMA journal_mode = WAL")
+                cursor.execute(f"PRAGMA mmap_size = {settings.sqlite_mmap_size}")
+            cursor.execute(f"PRAGMA synchronous = {settings.sqlite_synchronous}")
+            # Negative cache_size is in KiB rather than pages
+            cursor.execute(f"PRAGMA cache_size = -{settings.sqlite_cache_size}")
+            cursor.execute("PRAGMA temp_store = MEMORY")
+        finally:
+            cursor.close()
+
+def bulk_insert(db: Session, table: Table, rows: List[dict]):
+    """Insert many rows in the session's transaction.
+
+    On PostgreSQL, large batches are streamed with COPY, which is several
+    times faster than a multi-row INSERT; every other backend (and small
+    batches) use a plain executemany INSERT. All rows must have the same keys.
+    """
+    if not rows:
+        return
+    if db.bind.dialect.name == "postgresql" and len(rows) >= settings.db_copy_threshold:
+        # COPY bypasses the statement events that maintain collection versions
+        from .versions import mark_changed
+        _copy_rows(db, table, rows)
+        mark_changed(db.connection(), table.name)
+    else:
+        db.execute(table.insert(), rows)
+
+def _copy_rows(db: Session, table: Table, rows: List[dict]):
+    dialect = db.bind.dialect
+    names = list(rows[0])
+    processors = [table.c[name].type.bind_processor(dialect) for name in names]
+
+    # CSV format: NULL is an unquoted empty field, every value is quoted
+    buffer = io.StringIO()
+    for row in rows:
+        fields = []
+        for name, process in zip(names, processors):
+            value = row[name]
+            if process is not None:
+                value = process(value)
+            fields.append("" if value is None else '"' + str(value).replace('"', '""') + '"')
+        buffer.write(",".join(fields) + "\n")
+
+    preparer = dialect.identifier_preparer
+    columns = ", ".join(preparer.quote(name) for name in names)
+    sql = f"COPY {preparer.format_table(table)} ({columns}) FROM STDIN WITH (FORMAT csv)"
+    cursor = db.connection().connection.dbapi_connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):
+            # psycopg2
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+        else:
+            # psycopg 3
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
+
+_STOP = object()
+
+class BatchWriter(Generic[T]):
+    """Funnels writes through a single thread and commits them in batches.
+
+    ``handler(db, items)`` writes a batch of submitted items; the writer
+    commits once per batch. Batches form naturally: whatever was submitted
+    while the previous commit ran goes into the next one (up to
+    ``max_batch``), so an idle writer adds no latency and a busy one
+    amortizes each commit over many items. If a batch fails, its items are
+    retried one at a time so one bad item cannot fail the others.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        handler: Callable[[Session, List[T]], None],
+        max_batch: Optional[int] = None,
+        name: str = "db-writer",
+    ):
+        self.session_factory = session_factory
+        self.handler = handler
+        self.max_batch = max_batch or settings.writer_max_batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item: T) -> Future:
+        """Queue ``item``; the future resolves once it is committed."""
+        if self._closed:
+            raise RuntimeError("BatchWriter is closed")
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def close(self):
+        """Write everything already submitted, then stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            if entry is _STOP:
+                return
+            batch = [entry]
+            stopping = False
+            while len(batch) < self.max_batch:
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            self._write(batch)
+            if stopping:
+                return
+
+    def _write(self, batch: Sequence[Tuple[T, Future]]):
+        try:
+            self._commit([item for item, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            logger.warning(f"Batch of {len(batch)} writes failed, retrying individually: {str(e)}")
+            for entry in batch:
+                self._write([entry])
+            return
+        for _, future in batch:
+            future.set_result(None)
+
+    def _commit(self, items: List[T]):
+        db = self.session_factory()
+        try:
+            self.handler(db, items)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
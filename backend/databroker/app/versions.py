@@ -0,0 +1,81 @@
+from typing import Dict, Iterable, Set, Tuple
+from sqlalchemy import select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from .database import CHANGED_COLLECTIONS
+from .models.models import (
+    CollectionVersion,
+    Device,
+    DeviceGroup,
+    Location,
+    Site,
+    device_group_association,
+)
+
+# Version counters for rarely changing collections. Every INSERT, UPDATE or
+# DELETE on a tracked table, through the ORM or Core on any engine, bumps the
+# table's counter in collection_versions in the same transaction, so a
+# rolled back write leaves the version alone and every API process sees the
+# same numbers. Responses built from these tables are identified by the
+# versions they were built from (see responses.cached_response): reading
+# the counters is one primary-key lookup, and only a changed version means
+# touching the rows again.
+#
+# Writes only record their tables; each table's counter is bumped once, just
+# before the transaction commits (the listeners are in database.py). Every
+# writer of a table updates the same counter row, and holds its lock until
+# COMMIT: bumping at the end keeps concurrent writers from waiting on each
+# other for the length of their transactions, e.g. during a bulk import.
+
+# The tables each cached response (or dashboard count, see stats.py) is built from
+SITES = (Site.__tablename__,)
+LOCATIONS = (Location.__tablename__, Site.__tablename__)
+DEVICE_GROUPS = (DeviceGroup.__tablename__, device_group_association.name, Device.__tablename__)
+DEVICES = (Device.__tablename__,)
+
+TRACKED = frozenset(SITES + LOCATIONS + DEVICE_GROUPS)
+
+def collection_versions(db: Session, tables: Iterable[str]) -> Tuple[Tuple[str, int], ...]:
+    """Current versions of ``tables``. Read these before the rows they cover."""
+    tables = sorted(tables)
+    versions: Dict[str, int] = dict(db.execute(
+        select(CollectionVersion.name, CollectionVersion.version).where(CollectionVersion.name.in_(tables))
+    ).all())
+    return tuple((table, versions.get(table, 0)) for table in tables)
+
+def _bump(conn: Connection, table: str):
+    dialect = conn.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(CollectionVersion).values(name=table, version=1)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=[CollectionVersion.name],
+            set_={"version": CollectionVersion.version + 1},
+        ))
+        return
+
+    updated = conn.execute(
+        update(CollectionVersion)
+        .where(CollectionVersion.name == table)
+        .values(version=CollectionVersion.version + 1)
+    ).rowcount
+    if not updated:
+        conn.execute(CollectionVersion.__table__.insert().values(name=table, version=1))
+
+def mark_changed(conn: Connection, table: str):
+    """Record that the transaction on ``conn`` wrote ``table``; its version is bumped at commit.
+
+    Called for every written statement (see database.py), and directly for
+    writes that do not go through SQLAlchemy statements (COPY).
+    """
+    if table in TRACKED:
+        conn.info.setdefault(CHANGED_COLLECTIONS, set()).add(table)
+
+def bump_versions(conn: Connection, tables: Set[str]):
+    """Bump each of ``tables`` once, as the transaction that wrote them commits."""
+    # In name order, so concurrent commits lock the counter rows in the same order
+    for table in sorted(tables):
+        _bump(conn, table)
@@ -0,0 +1,178 @@
+"""Local SSH server that behaves like a network device for collector testing.
+
+Accepts any username/password and answers ``show running-config`` with a
+generated configuration, both as an exec request and in an interactive
+Cisco IOS-like shell (user and privileged prompts, ``enable`` with a
+password, ``--More--`` paging until ``terminal length 0``), and answers
+``show version`` (with a changing uptime) and ``show inventory``. The config
+is also served over SFTP and SCP as ``system:running-config``. Run it and
+point devices at 127.0.0.1 with NETBACKUP_SSH_PORT set to the listening port,
+and add the known_hosts line it prints to NETBACKUP_SSH_KNOWN_HOSTS.
+"""
+import argparse
+import asyncio
+import asyncssh
+import os
+import tempfile
+import time
+
+def generate_config(hostname: str = "fake-device", interfaces: int = 48) -> str:
+    lines = ["!", f"hostname {hostname}", "!"]
+    for i in range(1, interfaces + 1):
+        lines += [
+            f"interface GigabitEthernet1/0/{i}",
+            f" description access port {i}",
+            " switchport mode access",
+            f" switchport access vlan {100 + i % 10}",
+            "!",
+        ]
+    lines += ["router bgp 65000", " neighbor 10.0.0.1 remote-as 65001", "!", "end", ""]
+    return "\n".join(lines)
+
+def generate_version(hostname: str, started: float) -> str:
+    minutes = int(time.monotonic() - started) // 60
+    return "\n".join([
+        "Cisco IOS Software, C2960X Software (C2960X-UNIVERSALK9-M), Version 15.2(7)E8",
+        f"{hostname} uptime is {minutes} minutes",
+        "System image file is \"flash:c2960x-universalk9-mz.152-7.E8.bin\"",
+        "",
+    ])
+
+INVENTORY = (
+    'NAME: "1", DESCR: "WS-C2960X-48FPD-L"\n'
+    "PID: WS-C2960X-48FPD-L , VID: V05 , SN: FOC1234X0AB\n"
+)
+
+class FakeDeviceServer(asyncssh.SSHServer):
+    def __init__(self, connections: list = None):
+        self.connections = connections
+
+    def connection_made(self, conn: asyncssh.SSHServerConnection):
+        if self.connections is not None:
+            self.connections.append(conn)
+
+    def begin_auth(self, username: str) -> bool:
+        return True
+
+    def password_auth_supported(self) -> bool:
+        return True
+
+    def validate_password(self, username: str, password: str) -> bool:
+        return True
+
+# One host key for every fake device in the process, so a single known_hosts
+# line (see known_hosts_line) trusts them all
+HOST_KEY = asyncssh.generate_private_key("ssh-ed25519")
+
+def known_hosts_line(host: str = "127.0.0.1", port: str = "*") -> str:
+    return f"[{host}]:{port} {HOST_KEY.export_public_key().decode().strip()}\n"
+
+PAGE_LINES = 23
+MORE = " --More-- "
+INVALID = "% Invalid input detected at '^' marker.\r\n"
+
+async def write_paged(process: asyncssh.SSHServerProcess, text: str):
+    lines = text.split("\n")
+    process.channel.set_line_mode(False)
+    try:
+        for start in range(0, len(lines), PAGE_LINES):
+            page = lines[start:start + PAGE_LINES]
+            process.stdout.write("\r\n".join(page) + ("\r\n" if start + PAGE_LINES < len(lines) else ""))
+            if start + PAGE_LINES < len(lines):
+                process.stdout.write(MORE)
+                if not await process.stdin.read(1):
+                    return
+                process.stdout.write("\b" * len(MORE) + " " * len(MORE) + "\b" * len(MORE))
+    finally:
+        process.channel.set_line_mode(True)
+
+async def run_shell(process: asyncssh.SSHServerProcess, config: str, hostname: str, enable_password: str,
+                    started: float):
+    privileged = enable_password is None
+    paging = True
+    while True:
+        process.stdout.write(f"\r\n{hostname}{'#' if privileged else '>'}")
+        line = await process.stdin.readline()
+        if not line:
+            break
+        command = line.strip()
+        if command in ("exit", "quit"):
+            break
+        if command == "enable":
+            if not privileged:
+                process.stdout.write("Password: ")
+                process.channel.set_echo(False)
+                password = await process.stdin.readline()
+                process.channel.set_echo(True)
+                privileged = password.strip() == enable_password
+                if not privileged:
+                    process.stdout.write("\r\n% Access denied\r\n")
+        elif command == "terminal length 0":
+            paging = False
+        elif command.startswith("terminal width"):
+            pass
+        elif command in ("show running-config", "show run") and privileged:
+            if paging:
+                await write_paged(process, config)
+            else:
+                process.stdout.write(config.replace("\n", "\r\n"))
+        elif command == "show version":
+            process.stdout.write(generate_version(hostname, started).replace("\n", "\r\n"))
+        elif command == "show inventory":
+            process.stdout.write(INVENTORY.replace("\n", "\r\n"))
+        elif command:
+            process.stdout.write(INVALID)
+    process.exit(0)
+
+def make_process_handler(config: str, hostname: str = "fake-device", enable_password: str = None):
+    started = time.monotonic()
+
+    async def handle_process(process: asyncssh.SSHServerProcess):
+        if not process.command:
+            await run_shell(process, config, hostname, enable_password, started)
+        elif process.command and process.command.strip() in ("show running-config", "show run"):
+            process.stdout.write(config)
+            process.exit(0)
+        else:
+            process.stderr.write(f"% Invalid input: {process.command}\n")
+            process.exit(1)
+    return handle_process
+
+async def start_server(host: str = "127.0.0.1", port: int = 8022, config: str = None, enable_password: str = None,
+                       files: dict = None, connections: list = None):
+    """Start the fake device and return the asyncssh acceptor.
+
+    With ``enable_password`` the shell starts in user mode and ``enable`` asks for it.
+    ``files`` (name -> bytes) are served over SFTP and SCP next to the config.
+    Each accepted connection is appended to ``connections``, if given.
+    """
+    config = config or generate_config()
+    root = tempfile.mkdtemp(prefix="fake-device-")
+    with open(os.path.join(root, "system:running-config"), "w") as f:
+        f.write(config)
+    for name, content in (files or {}).items():
+        with open(os.path.join(root, name), "wb") as f:
+            f.write(content)
+    return await asyncssh.create_server(
+        lambda: FakeDeviceServer(connections),
+        host,
+        port,
+        server_host_keys=[HOST_KEY],
+        process_factory=make_process_handler(config, enable_password=enable_password),
+        sftp_factory=lambda chan: asyncssh.SFTPServer(chan, chroot=root),
+        allow_scp=True,
+    )
+
+async def serve(host: str, port: int, enable_password: str = None):
+    server = await start_server(host, port, enable_password=enable_password)
+    print(f"Fake device listening on {host}:{port}")
+    print(f"known_hosts line: {known_hosts_line(host, str(port))}", end="")
+    await server.wait_closed()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake SSH network device")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8022)
+    parser.add_argument("--enable-password", help="Start in user mode and require this enable password")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.enable_password))
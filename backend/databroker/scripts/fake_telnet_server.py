@@ -0,0 +1,141 @@
+"""Local Telnet server that behaves like a legacy network device for collector testing.
+
+Negotiates echo and suppress-go-ahead, asks for a username and password
+(any are accepted, or only ``--password`` when given), and then runs the
+same IOS-like shell as the fake SSH device, with ``--More--`` paging until
+``terminal length 0``. Point devices at it with
+``{"protocol": "telnet", "port": <port>}`` in their config.
+"""
+from typing import Optional
+import argparse
+import asyncio
+from fake_device_server import INVALID, MORE, PAGE_LINES, generate_config
+
+IAC, DONT, DO, WONT, WILL, SB, SE = 255, 254, 253, 252, 251, 250, 240
+ECHO, SGA, TTYPE, NAWS = 1, 3, 24, 31
+
+class TelnetConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.pending = bytearray()
+        self.received_options = []
+
+    def write(self, text: str):
+        self.writer.write(text.encode())
+
+    async def _fill(self) -> bool:
+        chunk = await self.reader.read(4096)
+        if not chunk:
+            return False
+        i = 0
+        while i < len(chunk):
+            # Options are recorded, not acted on: tests check the client's answers
+            if chunk[i] == IAC and i + 1 < len(chunk) and chunk[i + 1] in (DO, DONT, WILL, WONT):
+                self.received_options.append((chunk[i + 1], chunk[i + 2]))
+                i += 3
+            elif chunk[i] == IAC and i + 1 < len(chunk) and chunk[i + 1] == SB:
+                i = chunk.index(bytes((IAC, SE)), i) + 2
+            else:
+                self.pending.append(chunk[i])
+                i += 1
+        return True
+
+    async def readline(self) -> Optional[str]:
+        # None once the client has closed the connection
+        while b"\n" not in self.pending:
+            if not await self._fill():
+                return None
+        line, _, rest = bytes(self.pending).partition(b"\n")
+        self.pending = bytearray(rest)
+        return line.decode(errors="replace").strip("\r\x00")
+
+    async def read_key(self) -> str:
+        while not self.pending:
+            if not await self._fill():
+                return ""
+        key = chr(self.pending.pop(0))
+        return key
+
+async def handle(conn: TelnetConnection, config: str, hostname: str, password: str):
+    conn.writer.write(bytes((IAC, WILL, ECHO, IAC, WILL, SGA, IAC, DO, NAWS, IAC, DO, TTYPE)))
+    conn.write("\r\nUser Access Verification\r\n")
+    while True:
+        conn.write("\r\nUsername: ")
+        username = await conn.readline()
+        if not username:
+            return
+        conn.write(username + "\r\n")
+        conn.write("Password: ")
+        # Read the password even when any is accepted, so it is not taken for a command
+        given = await conn.readline()
+        if password is None or given == password:
+            break
+        conn.write("\r\n% Login invalid\r\n")
+
+    paging = True
+    while True:
+        conn.write(f"\r\n{hostname}#")
+        line = await conn.readline()
+        if line is None:
+            return
+        command = line.strip()
+        # The device has the echo option, so it echoes input itself
+        conn.write(command + "\r\n")
+        if command in ("exit", "quit"):
+            return
+        if command == "terminal length 0":
+            paging = False
+        elif command.startswith("terminal width"):
+            pass
+        elif command in ("show running-config", "show run"):
+            lines = config.split("\n")
+            for start in range(0, len(lines), PAGE_LINES if paging else len(lines)):
+                last = start + (PAGE_LINES if paging else len(lines)) >= len(lines)
+                conn.write("\r\n".join(lines[start:start + (PAGE_LINES if paging else len(lines))]))
+                if not last:
+                    conn.write("\r\n" + MORE)
+                    if not await conn.read_key():
+                        return
+                    conn.write("\b" * len(MORE) + " " * len(MORE) + "\b" * len(MORE))
+        elif command:
+            conn.write(INVALID)
+
+async def start_server(host: str = "127.0.0.1", port: int = 8023, config: str = None,
+                       hostname: str = "fake-telnet", password: str = None, delay: float = 0,
+                       connections: list = None):
+    """Start the fake device and return the asyncio server.
+
+    ``delay`` seconds are waited before the login banner, to simulate slow devices.
+    Each TelnetConnection is appended to ``connections``, if given, so tests
+    can look at the options the client sent.
+    """
+    config = config or generate_config(hostname)
+
+    async def on_connect(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        conn = TelnetConnection(reader, writer)
+        if connections is not None:
+            connections.append(conn)
+        try:
+            await asyncio.sleep(delay)
+            await handle(conn, config, hostname, password)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(on_connect, host, port, backlog=1024)
+
+async def serve(host: str, port: int, password: str = None):
+    server = await start_server(host, port, password=password)
+    print(f"Fake Telnet device listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake Telnet network device")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8023)
+    parser.add_argument("--password", help="Only accept this password")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.password))
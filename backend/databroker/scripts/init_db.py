@@ -3,6 +3,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.database import engine, SessionLocal
+from app.migrations import upgrade
 from app.models.models import (
     Base, 
     User,
@@ -39,7 +40,7 @@ def init_db():
         # Drop all tables
         Base.metadata.drop_all(bind=engine)
         # Create tables
-        Base.metadata.create_all(bind=engine)
+        upgrade(engine)
         
         # Create session
         db = SessionLocal()
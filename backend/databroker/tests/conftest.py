@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+
+# Settings are read when the app is imported, so the test database and
+# backup directory are chosen before any import from databroker.app
+_tmp = tempfile.mkdtemp(prefix="netbackup-tests-")
+os.environ.setdefault("NETBACKUP_DATABASE_URL", f"sqlite:///{os.path.join(_tmp, 'netbackup.db')}")
+os.environ.setdefault("NETBACKUP_BACKUP_DIR", os.path.join(_tmp, "backups"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+# The fake devices in scripts/ (fake_device_server, fake_telnet_server)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+# Trust the fake SSH devices' host key, as an operator would a device's
+from fake_device_server import known_hosts_line
+with open(os.path.join(_tmp, "known_hosts"), "w") as f:
+    f.write(known_hosts_line())
+os.environ.setdefault("NETBACKUP_SSH_KNOWN_HOSTS", os.path.join(_tmp, "known_hosts"))
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+from databroker.app import auth, stats
+from databroker.app.database import Base, SessionLocal, engine
+from databroker.app.main import app
+from databroker.app.responses import response_cache
+
+def _reset():
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(delete(table).execution_options(track_versions=False))
+    response_cache.clear()
+    auth.clear_principals()
+    stats.invalidate_device_counts()
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        _reset()
+
+@pytest.fixture
+def client(db):
+    app.dependency_overrides[auth.get_current_user] = lambda: None
+    try:
+        with TestClient(app) as test_client:
+            yield test_client
+    finally:
+        app.dependency_overrides.clear()
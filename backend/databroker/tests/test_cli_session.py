@@ -0,0 +1,106 @@
+import asyncio
+import pytest
+from databroker.app.collector.drivers import get_driver
+from databroker.app.collector.transport import READ_SIZE, CliSession, CollectionError, exact_prompt
+
+class ScriptedDevice:
+    """A CLI channel that answers each line written to it with the next scripted reply.
+
+    A reply is a list of chunks, each returned by one read() as if it had
+    arrived in its own packet.
+    """
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.written = []
+        self.chunks = asyncio.Queue()
+
+    def start(self, *chunks: bytes):
+        for chunk in chunks:
+            self.chunks.put_nowait(chunk)
+
+    def write(self, data: bytes):
+        self.written.append(data)
+        if data.endswith(b"\n") and self.replies:
+            for chunk in self.replies.pop(0):
+                self.chunks.put_nowait(chunk)
+
+    async def read(self, n: int) -> bytes:
+        chunk = await self.chunks.get()
+        assert len(chunk) <= n
+        return chunk
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 10))
+
+def session_for(device: ScriptedDevice, platform: str = "cisco_ios") -> CliSession:
+    return CliSession(device, device, get_driver(platform), "router1", timeout=1)
+
+@pytest.mark.parametrize("output, other", [
+    (b"\r\nrouter1#", b"\r\nrouter2#"),
+    (b"banner\r\nrouter1# ", b"banner\r\nrouter1#"),
+    (b"{master}\r\nadmin@mx1> ", b"{master}\r\nadmin@mx1# "),
+    (b"fw1(config)#", b"\nfw1#"),
+])
+def test_exact_prompt(output, other):
+    prompt = exact_prompt(output)
+    assert prompt.search(b"\n" + output)
+    assert prompt.search(b"output\r\n" + output.rsplit(b"\n", 1)[-1])
+    assert not prompt.search(b"\n" + other)
+
+def test_command_output_ends_only_at_the_device_prompt():
+    # A config line that looks like a prompt ends a 64 KiB read
+    filler = b"!\r\n" * ((READ_SIZE - 64) // 3)
+    first = b"show running-config\r\n" + filler + b"banner motd ^\r\nswitch7#"
+    rest = b"\r\n^\r\nend\r\n\r\nrouter1#"
+    device = ScriptedDevice(
+        [b"terminal length 0\r\nrouter1#"],
+        [b"terminal width 511\r\nrouter1#"],
+        [first, rest],
+    )
+    device.start(b"\r\nrouter1#")
+    session = session_for(device)
+
+    async def collect():
+        await session.open()
+        return await session.run("show running-config")
+
+    config = run(collect())
+    assert config.endswith("banner motd ^\nswitch7#\n^\nend\n")
+    assert device.written[-1] == b"show running-config\n"
+
+def test_enable_learns_the_privileged_prompt():
+    device = ScriptedDevice(
+        [b"enable\r\nPassword: "],
+        [b"\r\nrouter1#"],
+        [b"terminal length 0\r\nrouter1#"],
+        [b"terminal width 511\r\nrouter1#"],
+        # The unprivileged prompt no longer ends command output
+        [b"show version\r\nrouter1>\r\nversion 15.2\r\n", b"router1#"],
+    )
+    device.start(b"\r\nrouter1>")
+    session = session_for(device)
+
+    async def collect():
+        await session.open("secret")
+        return await session.run("show version")
+
+    assert run(collect()) == "router1>\nversion 15.2\n"
+    assert device.written[:2] == [b"enable\n", b"secret\n"]
+
+def test_a_different_prompt_times_out():
+    device = ScriptedDevice(
+        [b"terminal length 0\r\nrouter1#"],
+        [b"terminal width 511\r\nrouter1#"],
+        [b"show clock\r\n12:00:00\r\nrouter2#"],
+    )
+    device.start(b"\r\nrouter1#")
+    session = session_for(device)
+
+    async def collect():
+        await session.open()
+        session.timeout = 0.2
+        return await session.run("show clock")
+
+    with pytest.raises(CollectionError, match="Timed out"):
+        run(collect())
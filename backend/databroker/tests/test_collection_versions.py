@@ -0,0 +1,107 @@
+from datetime import datetime
+import os
+import subprocess
+import sys
+import textwrap
+from sqlalchemy import delete, event, update
+from sqlalchemy.engine import Engine
+from databroker.app.collector.engine import BackupEngine, BackupResult
+from databroker.app.collector.transport import DeviceTarget
+from databroker.app.database import SessionLocal
+from databroker.app.models.models import BackupStatus, Device, DeviceStatus, DeviceType, Site
+from databroker.app.scheduler.clock import FakeClock
+from databroker.app.scheduler.service import BackupScheduler
+from databroker.app.versions import DEVICE_GROUPS, SITES, collection_versions
+
+def versions(db, tables=SITES + DEVICE_GROUPS):
+    db.rollback()
+    return dict(collection_versions(db, tables))
+
+def add_device(db, device_id="device-1"):
+    db.add(Device(id=device_id, name=device_id, ip_address="10.0.0.1", type=DeviceType.ROUTER, status=DeviceStatus.ACTIVE,
+                  backup_schedule="@hourly"))
+    db.commit()
+
+def test_writes_bump_once_per_transaction(db):
+    db.add_all([Site(id=f"site-{i}", name=f"Site {i}", code=f"S{i}") for i in range(3)])
+    db.commit()
+    assert versions(db)["sites"] == 1
+
+    db.execute(update(Site).where(Site.id == "site-0").values(name="Renamed"))
+    db.execute(delete(Site).where(Site.id == "site-1"))
+    db.commit()
+    assert versions(db)["sites"] == 2
+
+    db.execute(delete(Site))
+    db.rollback()
+    assert versions(db)["sites"] == 2
+
+def test_versions_are_bumped_only_at_commit(db):
+    # The counter row is locked from its update to COMMIT, so it is updated last
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        for i in range(3):
+            db.add(Site(id=f"site-{i}", name=f"Site {i}", code=f"S{i}"))
+            db.flush()
+        db.execute(update(Site).values(name="Renamed"))
+        assert not [statement for statement in statements if "collection_versions" in statement]
+        db.commit()
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+    assert len([statement for statement in statements if "collection_versions" in statement]) == 1
+    assert "collection_versions" in statements[-1]
+    assert versions(db)["sites"] == 1
+
+def test_backup_bookkeeping_does_not_bump_devices(db):
+    add_device(db)
+    before = versions(db)["devices"]
+
+    # The engine's ORM bulk update of last_backup
+    engine = BackupEngine()
+    try:
+        now = datetime.utcnow()
+        target = DeviceTarget(device_id="device-1", name="device-1", host="10.0.0.1", port=22)
+        engine._write_results(db, [BackupResult(target, BackupStatus.SUCCESS, now, now, config_ref="sha256:0")])
+        db.commit()
+    finally:
+        engine.close()
+    db.expire_all()
+    assert db.get(Device, "device-1").last_backup == now
+
+    # The scheduler's next_backup updates
+    scheduler = BackupScheduler(engine=engine, session_factory=SessionLocal, clock=FakeClock(now), jitter=0)
+    try:
+        assert scheduler.claim_due() == []
+        db.expire_all()
+        scheduler.clock.current = db.get(Device, "device-1").next_backup
+        assert scheduler.claim_due() == ["device-1"]
+    finally:
+        scheduler.close()
+
+    assert versions(db)["devices"] == before
+
+    # Any other change to a device does bump it
+    db.execute(update(Device).values(name="renamed"))
+    db.commit()
+    assert versions(db)["devices"] == before + 1
+
+def test_processes_that_never_import_versions_bump_them(db):
+    # E.g. a script or worker that writes through the models only
+    script = textwrap.dedent("""
+        import sys
+        from databroker.app.database import SessionLocal
+        from databroker.app.models.models import Site
+        assert "databroker.app.versions" not in sys.modules
+        db = SessionLocal()
+        db.add(Site(id="site-x", name="X", code="X"))
+        db.commit()
+    """)
+    backend = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ, PYTHONPATH=backend)
+    subprocess.run([sys.executable, "-c", script], env=env, check=True, timeout=60)
+    assert versions(db)["sites"] == 1
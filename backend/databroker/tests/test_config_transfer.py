@@ -0,0 +1,58 @@
+import asyncio
+import gzip
+import pytest
+from fake_device_server import generate_config, start_server
+from databroker.app.collector.transport import CollectionError, DeviceTarget, fetch_config_file
+
+CONFIG = generate_config("mx1", interfaces=2000).encode()
+COMPRESSED = gzip.compress(CONFIG)
+
+FILES = {
+    "juniper.conf.gz": COMPRESSED,
+    "truncated.conf.gz": COMPRESSED[:len(COMPRESSED) // 2],
+    # Complete deflate data, but without the gzip trailer
+    "no-trailer.conf.gz": COMPRESSED[:-8],
+    "corrupt.conf.gz": COMPRESSED[:100] + bytes(200) + COMPRESSED[300:],
+    "plain.conf": CONFIG,
+}
+
+def download(transfer: str, name: str):
+    async def run():
+        server = await start_server(port=0, files=FILES)
+        port = server.sockets[0].getsockname()[1]
+        target = DeviceTarget(
+            device_id="mx1", name="mx1", host="127.0.0.1", port=port,
+            username="netbackup", password="secret", transfer=transfer, config_file=name,
+        )
+        received = []
+
+        async def sink(chunk: bytes):
+            received.append(chunk)
+
+        try:
+            size = await fetch_config_file(target, sink)
+        finally:
+            server.close()
+            await server.wait_closed()
+        return size, b"".join(received)
+
+    return asyncio.run(asyncio.wait_for(run(), 30))
+
+@pytest.mark.parametrize("transfer", ["sftp", "scp"])
+def test_gzipped_config_is_decompressed(transfer):
+    size, config = download(transfer, "juniper.conf.gz")
+    assert size == len(COMPRESSED)
+    assert config == CONFIG
+
+@pytest.mark.parametrize("transfer", ["sftp", "scp"])
+def test_plain_config_is_passed_on(transfer):
+    assert download(transfer, "plain.conf") == (len(CONFIG), CONFIG)
+
+@pytest.mark.parametrize("name, error", [
+    ("truncated.conf.gz", "is truncated"),
+    ("no-trailer.conf.gz", "is truncated"),
+    ("corrupt.conf.gz", "is not valid gzip"),
+])
+def test_incomplete_gzip_is_an_error(name, error):
+    with pytest.raises(CollectionError, match=error):
+        download("sftp", name)
@@ -0,0 +1,76 @@
+from contextlib import contextmanager
+from datetime import datetime
+import uuid
+from sqlalchemy import event, update
+from sqlalchemy.engine import Engine
+from databroker.app import stats
+from databroker.app.database import SessionLocal
+from databroker.app.models.models import BackupHistory, BackupStatus, Device, DeviceStatus, DeviceType
+
+@contextmanager
+def group_bys():
+    seen = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "GROUP BY" in statement:
+            seen.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        yield seen
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+
+def add_backups(db, *results):
+    db.add(Device(id="device-1", name="device-1", ip_address="10.0.0.1", type=DeviceType.ROUTER))
+    db.flush()
+    for status, at in results:
+        db.add(BackupHistory(id=str(uuid.uuid4()), device_id="device-1", status=status, created_at=at))
+    stats.record_backups(db, results)
+    db.commit()
+
+def test_backup_totals_count_each_backup_once(db):
+    add_backups(
+        db,
+        (BackupStatus.SUCCESS, datetime(2024, 3, 4, 10, 10)),
+        (BackupStatus.FAILED, datetime(2024, 3, 4, 10, 45)),
+        (BackupStatus.SUCCESS, datetime(2024, 3, 4, 10, 50)),
+        (BackupStatus.SUCCESS, datetime(2024, 3, 4, 11, 20)),
+        (BackupStatus.FAILED, datetime(2024, 3, 4, 12, 5)),
+    )
+    # Part of the 10:00 bucket, then whole hours
+    assert stats.backup_totals(db, datetime(2024, 3, 4, 10, 30)) == (4, 2, 2)
+    assert stats.backup_totals(db, datetime(2024, 3, 4, 10, 0)) == (5, 3, 2)
+    assert stats.backup_totals(db, datetime(2024, 3, 4, 11, 59)) == (1, 0, 1)
+    assert stats.backup_totals(db, datetime(2024, 3, 4, 13, 0)) == (0, 0, 0)
+
+def test_device_counts_follow_writes_from_other_processes(db):
+    db.add_all(
+        Device(id=f"device-{i}", name=f"device-{i}", ip_address="10.0.0.1", type=DeviceType.ROUTER,
+               status=DeviceStatus.ACTIVE if i % 2 else DeviceStatus.INACTIVE)
+        for i in range(4)
+    )
+    db.commit()
+    stats.invalidate_device_counts()
+
+    with group_bys() as counted:
+        assert stats.device_status_counts(db) == {DeviceStatus.ACTIVE: 2, DeviceStatus.INACTIVE: 2}
+        assert stats.device_status_counts(db) == {DeviceStatus.ACTIVE: 2, DeviceStatus.INACTIVE: 2}
+    assert len(counted) == 1
+
+    # Backup bookkeeping leaves the counts cached
+    db.execute(update(Device).values(last_backup=datetime.utcnow()).execution_options(track_versions=False))
+    db.commit()
+    with group_bys() as counted:
+        stats.device_status_counts(db)
+    assert counted == []
+
+    # A write through another connection, as from another API process
+    other = SessionLocal()
+    try:
+        other.execute(update(Device).where(Device.id == "device-0").values(status=DeviceStatus.ACTIVE))
+        other.commit()
+    finally:
+        other.close()
+    db.rollback()
+    assert stats.device_status_counts(db) == {DeviceStatus.ACTIVE: 3, DeviceStatus.INACTIVE: 1}
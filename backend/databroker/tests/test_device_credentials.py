@@ -0,0 +1,32 @@
+import pytest
+from databroker.app.models.models import Device, DeviceType
+from databroker.app.responses import response_cache
+
+@pytest.fixture
+def credentials(client, db):
+    db.add(Device(id="device-1", name="device-1", ip_address="10.0.0.1", type=DeviceType.ROUTER))
+    db.commit()
+    response = client.post("/api/device-credentials/", json={
+        "name": "router", "username": "netbackup", "password": "s3cret", "device_id": "device-1",
+    })
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "private, no-store"
+    return response.json()
+
+@pytest.mark.parametrize("path", ["/api/device-credentials/", "/api/device-credentials/device-1"])
+def test_credentials_are_never_cached(client, credentials, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    assert "s3cret" in response.text
+    assert response.headers["cache-control"] == "private, no-store"
+    assert "etag" not in response.headers
+    assert not response_cache._entries
+
+    # No conditional requests either: the passwords are always sent afresh
+    assert client.get(path, headers={"If-None-Match": "*"}).status_code == 200
+
+def test_updated_credentials_are_not_cached(client, credentials):
+    response = client.put("/api/device-credentials/device-1", json={"password": "n3w"})
+    assert response.json()["password"] == "n3w"
+    assert response.headers["cache-control"] == "private, no-store"
+    assert client.get("/api/device-credentials/device-1").json()["password"] == "n3w"
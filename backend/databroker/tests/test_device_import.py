@@ -0,0 +1,54 @@
+import pytest
+from databroker.app.config import settings
+from databroker.app.models.models import Device
+
+ROWS = 600
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # Several committed chunks before the end of the file
+    monkeypatch.setattr(settings, "bulk_chunk_size", 50)
+
+def csv_rows(count: int) -> bytes:
+    lines = ["id,name,ip_address,type"]
+    lines += [f"device-{i:04d},device-{i:04d},10.0.{i // 250}.{i % 250},Switch" for i in range(count)]
+    return ("\n".join(lines) + "\n").encode()
+
+def ndjson_rows(count: int) -> bytes:
+    return "".join(
+        f'{{"id": "device-{i:04d}", "name": "device-{i:04d}", "ip_address": "10.0.0.1", "type": "Switch"}}\n'
+        for i in range(count)
+    ).encode()
+
+def upload(client, content: bytes, file_format: str):
+    return client.post(
+        f"/api/devices/bulk?format={file_format}",
+        files={"file": (f"devices.{file_format}", content)},
+    )
+
+def test_import_creates_devices(client, db):
+    response = upload(client, csv_rows(ROWS), "csv")
+    assert response.status_code == 200, response.text
+    assert response.json() == {"created": ROWS, "updated": 0, "failed": 0, "errors": []}
+    assert db.query(Device).count() == ROWS
+
+@pytest.mark.parametrize("file_format, content", [
+    ("csv", csv_rows(ROWS) + b"device-x,\xff\xfe,10.0.0.1,Switch\n"),
+    ("ndjson", ndjson_rows(ROWS) + b'{"name": "\xff\xfe"}\n'),
+    # Over the csv module's field size limit
+    ("csv", csv_rows(ROWS) + b'device-x,"' + b"x" * 200000 + b'",10.0.0.1,Switch\n'),
+])
+def test_unreadable_rest_of_file_is_reported_with_the_imported_rows(client, db, file_format, content):
+    response = upload(client, content, file_format)
+    assert response.status_code == 200, response.text
+    result = response.json()
+
+    # The rows committed before the bad data are counted, not rolled back
+    # behind an error response
+    imported = db.query(Device).count()
+    assert 0 < imported <= ROWS
+    assert result["created"] == imported
+    assert result["failed"] == 1
+    [error] = result["errors"]
+    assert "Could not read the file" in error["error"]
+    assert error["row"] > imported
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+import pytest
+from databroker.app.models.models import Device, DeviceType
+
+def add_devices(db, names, **values):
+    db.add_all(
+        Device(id=f"id-{name}", name=name, ip_address="10.0.0.1", type=DeviceType.SWITCH, **values)
+        for name in names
+    )
+    db.commit()
+
+def all_pages(client, sort, limit=2, **params):
+    names, cursor = [], None
+    while True:
+        response = client.get("/api/devices/", params={"sort": sort, "limit": limit, "cursor": cursor, **params})
+        assert response.status_code == 200, response.text
+        names += [device["name"] for device in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            return names
+
+@pytest.mark.parametrize("sort", ["last_backup", "-last_backup"])
+def test_paging_by_a_nullable_column_returns_every_device(client, db, sort):
+    start = datetime(2024, 3, 4)
+    db.add_all(
+        Device(id=f"id-{i}", name=f"device-{i}", ip_address="10.0.0.1", type=DeviceType.SWITCH,
+               last_backup=start + timedelta(hours=i % 3) if i % 2 else None)
+        for i in range(9)
+    )
+    db.commit()
+
+    names = all_pages(client, sort)
+    backed_up = sorted(
+        (f"device-{i}" for i in range(9) if i % 2),
+        key=lambda name: (int(name[-1]) % 3, f"id-{name}"),
+        reverse=sort.startswith("-"),
+    )
+    never = sorted((f"device-{i}" for i in range(9) if not i % 2), reverse=sort.startswith("-"))
+    # Devices never backed up come last, in either direction
+    assert names == backed_up + never
+
+    # The same order in one page
+    assert all_pages(client, sort, limit=100) == names
+
+def test_name_filter_matches_wildcards_literally(client, db):
+    add_devices(db, ["core_1", "core-1", "edge%", "edge-2"])
+    assert all_pages(client, "name", name="_") == ["core_1"]
+    assert all_pages(client, "name", name="e%") == ["edge%"]
+    assert all_pages(client, "name", name="core") == ["core-1", "core_1"]
+
+def test_ip_prefix_text_filter_matches_wildcards_literally(client, db):
+    db.add_all([
+        Device(id="a", name="a", ip_address="10.0.0.1", type=DeviceType.SWITCH),
+        Device(id="b", name="b", ip_address="10_0.0.1", type=DeviceType.SWITCH),
+    ])
+    db.commit()
+    assert all_pages(client, "name", ip_prefix="10_") == ["b"]
@@ -0,0 +1,49 @@
+import pytest
+from pydantic import ValidationError
+from databroker.app.dynamic_groups import GroupRules
+from databroker.app.models.models import Device, DeviceType
+
+@pytest.mark.parametrize("pattern", [
+    "^lon-fw[0-9]+$",
+    "core|edge",
+    r"^(?:lon|par)-[a-z]{2,3}\.example\.net$",
+    r"sw[^-_]*?\-0[1-9]",
+    "[]a]",
+])
+def test_portable_patterns_are_accepted(pattern):
+    assert GroupRules(name_regex=pattern).name_regex == pattern
+
+@pytest.mark.parametrize("pattern", [
+    r"fw\d+",              # \d: any Unicode digit in Python, locale dependent in PostgreSQL
+    r"\bcore",             # word boundary in Python, backspace in PostgreSQL
+    r"core\Z",
+    "(?<=lon-)fw",         # lookbehind
+    "(?=lon)",
+    "(?P<site>lon)-fw",    # named group
+    "(?i)core",
+    "[[:digit:]]+",        # POSIX class, a plain set in Python
+    "a*+",                 # possessive
+    "a{,3}",
+])
+def test_patterns_read_differently_are_rejected(pattern):
+    with pytest.raises(ValidationError, match="unsupported syntax"):
+        GroupRules(name_regex=pattern)
+
+def test_invalid_patterns_are_rejected():
+    with pytest.raises(ValidationError, match="invalid regular expression"):
+        GroupRules(name_regex="fw(")
+
+def test_group_members_follow_the_pattern(client, db):
+    db.add_all(
+        Device(id=name, name=name, ip_address="10.0.0.1", type=DeviceType.FIREWALL)
+        for name in ["lon-fw1", "lon-fw22", "lon-fwa", "par-fw1"]
+    )
+    db.commit()
+    response = client.post("/api/device-groups/", json={
+        "name": "London firewalls", "rules": {"name_regex": "^lon-fw[0-9]+$"},
+    })
+    assert response.status_code == 200, response.text
+    assert sorted(device["name"] for device in response.json()["devices"]) == ["lon-fw1", "lon-fw22"]
+
+    response = client.post("/api/device-groups/", json={"name": "Bad", "rules": {"name_regex": r"fw\d"}})
+    assert response.status_code == 422
@@ -0,0 +1,197 @@
+from collections import Counter
+import asyncio
+import multiprocessing
+import time
+from sqlalchemy import select
+from databroker.app.collector import queue
+from databroker.app.collector.engine import BackupEngine, BackupRunSummary
+from databroker.app.collector.worker import CollectorWorker
+from databroker.app.database import SessionLocal
+from databroker.app.models.models import (
+    BackupHistory, BackupJob, BackupStatus, Device, DeviceStatus, DeviceType, JobStatus,
+)
+
+# Collector workers sharing one SQLite database (WAL mode) from separate
+# processes, as they would on one host. Processes are spawned, so they open
+# their own connections to the test database named in the environment.
+
+JOBS = 120
+WORKERS = 3
+TIMEOUT = 60
+
+spawn = multiprocessing.get_context("spawn")
+
+class RecordingEngine:
+    """Stands in for BackupEngine: reports the devices it was given to the test."""
+
+    def __init__(self, worker_id: str, results):
+        self.worker_id = worker_id
+        self.results = results
+
+    async def run(self, device_ids, leases=None):
+        device_ids = list(device_ids)
+        self.results.put((self.worker_id, device_ids))
+        # Let the other workers claim while this batch "runs"
+        await asyncio.sleep(0.01)
+        return BackupRunSummary(total=len(device_ids), succeeded=len(device_ids))
+
+    async def close_connections(self):
+        pass
+
+    def close(self):
+        pass
+
+def run_worker(worker_id: str, start, results):
+    # Start claiming together, once every process has imported the app
+    start.wait(TIMEOUT)
+    worker = CollectorWorker(RecordingEngine(worker_id, results), worker_id=worker_id, batch_size=7)
+    try:
+        asyncio.run(worker.run(until_empty=True))
+    finally:
+        worker.close()
+
+def crash_after_claim(worker_id: str, claimed, reclaimed, results):
+    # Leases a job, then stops renewing it, as if its host had hung. Once
+    # another worker holds the job, it wakes up and tries to finish it.
+    db = SessionLocal()
+    try:
+        jobs = queue.claim(db, worker_id, 10, lease_seconds=1)
+        claimed.set()
+        reclaimed.wait(TIMEOUT)
+        job_ids = [lease.job_id for lease in jobs]
+        results.put(("claimed", jobs))
+        results.put(("heartbeat", queue.heartbeat(db, worker_id, job_ids)))
+        results.put(("complete", queue.complete(db, worker_id, job_ids)))
+    finally:
+        db.close()
+
+def retry_expired(worker_id: str, claimed, reclaimed, stale_done, results):
+    claimed.wait(TIMEOUT)
+    db = SessionLocal()
+    try:
+        jobs = []
+        deadline = time.monotonic() + TIMEOUT
+        while not jobs and time.monotonic() < deadline:
+            time.sleep(0.1)
+            jobs = queue.claim(db, worker_id, 10)
+        reclaimed.set()
+        # Finish only after the stale worker tried, so the job is still running then
+        stale_done.wait(TIMEOUT)
+        results.put(("reclaimed", jobs))
+        results.put(("completed", queue.complete(db, worker_id, [lease.job_id for lease in jobs])))
+    finally:
+        db.close()
+
+def add_devices(db, count: int):
+    db.add_all(
+        Device(id=f"device-{i:03d}", name=f"device-{i:03d}", ip_address="10.0.0.1",
+               type=DeviceType.SWITCH, status=DeviceStatus.ACTIVE)
+        for i in range(count)
+    )
+    db.commit()
+    return queue.enqueue(db, select(Device.id))
+
+def join(processes):
+    for process in processes:
+        process.join(TIMEOUT)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+        assert process.exitcode == 0, f"{process.name} exited with {process.exitcode}"
+
+def drain(results, count: int):
+    return [results.get(timeout=TIMEOUT) for _ in range(count)]
+
+def test_each_job_is_claimed_by_exactly_one_worker(db):
+    assert add_devices(db, JOBS) == JOBS
+    start, results = spawn.Barrier(WORKERS), spawn.Queue()
+    workers = [
+        spawn.Process(target=run_worker, args=(f"worker-{n}", start, results), name=f"worker-{n}")
+        for n in range(WORKERS)
+    ]
+    for worker in workers:
+        worker.start()
+
+    batches = []
+    while sum(len(device_ids) for _, device_ids in batches) < JOBS:
+        batches.append(results.get(timeout=TIMEOUT))
+    join(workers)
+
+    runs = Counter(device_id for _, device_ids in batches for device_id in device_ids)
+    assert set(runs) == {f"device-{i:03d}" for i in range(JOBS)}
+    assert max(runs.values()) == 1, [device_id for device_id, count in runs.items() if count > 1]
+    assert results.empty()
+    assert len({worker_id for worker_id, _ in batches}) > 1
+
+    db.expire_all()
+    jobs = db.query(BackupJob).all()
+    assert len(jobs) == JOBS
+    assert {job.status for job in jobs} == {JobStatus.DONE}
+    assert {job.attempts for job in jobs} == {1}
+    assert {job.lease_owner for job in jobs} <= {f"worker-{n}" for n in range(WORKERS)}
+
+def test_expired_lease_is_retried_and_the_stale_worker_is_fenced_off(db):
+    assert add_devices(db, 3) == 3
+    claimed, reclaimed, stale_done = spawn.Event(), spawn.Event(), spawn.Event()
+    stale_results, results = spawn.Queue(), spawn.Queue()
+    stale = spawn.Process(
+        target=crash_after_claim, args=("stale", claimed, reclaimed, stale_results), name="stale",
+    )
+    rescuer = spawn.Process(
+        target=retry_expired, args=("rescuer", claimed, reclaimed, stale_done, results), name="rescuer",
+    )
+    stale.start()
+    rescuer.start()
+
+    stale_outcome = dict(drain(stale_results, 3))
+    stale_done.set()
+    outcome = dict(drain(results, 2))
+    join([stale, rescuer])
+
+    assert len(stale_outcome["claimed"]) == 3
+    # The same jobs, retried once their lease ran out
+    assert sorted(lease.job_id for lease in outcome["reclaimed"]) == sorted(
+        lease.job_id for lease in stale_outcome["claimed"]
+    )
+    # The stale worker no longer holds the leases: it can neither renew nor finish them
+    assert stale_outcome["heartbeat"] == 0
+    assert stale_outcome["complete"] == 0
+    assert outcome["completed"] == 3
+
+    db.expire_all()
+    for job in db.query(BackupJob):
+        assert (job.status, job.attempts, job.lease_owner) == (JobStatus.DONE, 2, "rescuer")
+
+def test_result_of_a_lost_lease_is_not_recorded(db):
+    assert add_devices(db, 1) == 1
+    [stale] = queue.claim(db, "stale", 10)
+    # The lease runs out and another worker takes the job while "stale" is still collecting
+    db.query(BackupJob).update({"lease_expires_at": BackupJob.created_at})
+    db.commit()
+    [current] = queue.claim(db, "rescuer", 10)
+    assert current.attempt == stale.attempt + 1
+
+    async def fetch(target):
+        return "hostname device-000\n"
+
+    async def backup(lease):
+        return await engine.run([lease.device_id], leases={lease.device_id: lease})
+
+    engine = BackupEngine(fetch=fetch)
+    try:
+        asyncio.run(backup(stale))
+        # An earlier claim is fenced off even when it was made by the same worker
+        asyncio.run(backup(stale._replace(worker_id="rescuer")))
+        db.expire_all()
+        assert db.query(BackupHistory).count() == 0
+        job = db.query(BackupJob).one()
+        assert (job.status, job.lease_owner) == (JobStatus.RUNNING, "rescuer")
+
+        asyncio.run(backup(current))
+    finally:
+        engine.close()
+    db.expire_all()
+    assert [entry.status for entry in db.query(BackupHistory)] == [BackupStatus.SUCCESS]
+    job = db.query(BackupJob).one()
+    assert (job.status, job.attempts, job.finished_at is not None) == (JobStatus.DONE, 2, True)
+    assert db.get(Device, "device-000").last_backup is not None
@@ -0,0 +1,98 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from databroker.app.models.models import (
+    BackupHistory,
+    BackupStatus,
+    Device,
+    DeviceCredential,
+    DeviceCredentials,
+    DeviceGroup,
+    DeviceType,
+    Location,
+    Site,
+)
+from databroker.app.responses import response_cache
+
+# List endpoints must load a page with a fixed number of statements, however
+# many rows and relationships it holds: an N+1 load shows up as a count that
+# grows with the number of rows.
+
+MAX_QUERIES = 10
+
+LIST_ENDPOINTS = [
+    "/api/devices/?limit=1000",
+    "/api/device-groups/?limit=1000",
+    "/api/sites/?limit=1000",
+    "/api/locations/?limit=1000",
+    "/api/device-credentials/",
+    "/api/backup-history/?limit=1000",
+]
+
+def seed(db, start: int, stop: int):
+    now = datetime.utcnow()
+    for i in range(start, stop):
+        site = Site(id=f"site-{i}", name=f"Site {i}", code=f"S{i}")
+        location = Location(id=f"location-{i}", name=f"Location {i}", site=site)
+        credential = DeviceCredential(id=f"credential-{i}", name=f"cred-{i}", username="u", password="p")
+        group = DeviceGroup(id=f"group-{i}", name=f"Group {i}")
+        device = Device(
+            id=f"device-{i}",
+            name=f"device-{i}",
+            ip_address=f"10.{i // 250}.{i % 250}.1",
+            type=DeviceType.SWITCH,
+            site=site,
+            location=location,
+            credential=credential,
+            groups=[group],
+        )
+        db.add_all([site, location, credential, group, device])
+        db.add(DeviceCredentials(name=f"creds-{i}", username="u", password="p", device_id=device.id))
+        db.add(BackupHistory(
+            id=f"history-{i}",
+            device_id=device.id,
+            status=BackupStatus.SUCCESS,
+            created_at=now - timedelta(minutes=i),
+        ))
+    db.commit()
+
+@contextmanager
+def statements():
+    # count_queries() is bound to the request's context, which TestClient runs
+    # in its own thread; count every statement on any engine instead
+    executed = []
+
+    def record(conn, cursor, statement, *args):
+        executed.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        yield executed
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+
+def query_counts(client):
+    counts = {}
+    response_cache.clear()
+    for url in LIST_ENDPOINTS:
+        with statements() as executed:
+            response = client.get(url)
+        assert response.status_code == 200, response.text
+        counts[url] = (len(executed), len(response.json()))
+    return counts
+
+@pytest.mark.parametrize("count", [5, 20])
+def test_list_endpoints_issue_constant_queries(client, db, count):
+    seed(db, 0, count)
+    small = query_counts(client)
+    seed(db, count, count * 10)
+    large = query_counts(client)
+
+    for url in LIST_ENDPOINTS:
+        small_queries, small_rows = small[url]
+        large_queries, large_rows = large[url]
+        assert (small_rows, large_rows) == (count, count * 10), url
+        assert small_queries == large_queries, f"{url}: {small_queries} -> {large_queries} statements"
+        assert 0 < large_queries <= MAX_QUERIES, f"{url}: {large_queries} statements"
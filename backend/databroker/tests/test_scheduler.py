@@ -0,0 +1,306 @@
+from datetime import datetime, timedelta
+import asyncio
+import pytest
+from databroker.app.collector.engine import BackupEngine
+from databroker.app.database import SessionLocal
+from databroker.app.models.models import Device, DeviceStatus, DeviceType
+from databroker.app.scheduler.clock import FakeClock
+from databroker.app.scheduler.schedules import (
+    CronSchedule,
+    IntervalSchedule,
+    Schedule,
+    next_run,
+    parse_schedule,
+    splay,
+)
+from databroker.app.scheduler.service import BackupScheduler
+
+START = datetime(2024, 3, 4, 10, 0)  # a Monday
+
+def test_schedule_is_abstract():
+    with pytest.raises(TypeError):
+        Schedule()
+
+@pytest.mark.parametrize("expression, at, expected", [
+    ("*/15 * * * *", datetime(2024, 3, 4, 10, 7, 30), datetime(2024, 3, 4, 10, 15)),
+    # Strictly after: a run exactly at ``at`` is not the next one
+    ("*/15 * * * *", datetime(2024, 3, 4, 10, 15), datetime(2024, 3, 4, 10, 30)),
+    ("@daily", datetime(2024, 3, 4, 10, 0), datetime(2024, 3, 5)),
+    ("@hourly", datetime(2024, 3, 4, 23, 30), datetime(2024, 3, 5)),
+    ("@weekly", datetime(2024, 3, 4), datetime(2024, 3, 10)),
+    ("@monthly", datetime(2024, 12, 15), datetime(2025, 1, 1)),
+    # Weekdays only: Friday evening -> Monday morning
+    ("30 2 * * 1-5", datetime(2024, 3, 8, 20, 0), datetime(2024, 3, 11, 2, 30)),
+    # 7 is Sunday as well as 0
+    ("0 6 * * 7", datetime(2024, 3, 4), datetime(2024, 3, 10, 6, 0)),
+    # Restricted day-of-month and day-of-week match either
+    ("0 0 15 * 1", datetime(2024, 3, 5), datetime(2024, 3, 11)),
+    ("0 0 15 * 1", datetime(2024, 3, 12), datetime(2024, 3, 15)),
+    # Only in leap years
+    ("0 0 29 2 *", datetime(2024, 3, 1), datetime(2028, 2, 29)),
+])
+def test_cron_next_after(expression, at, expected):
+    assert parse_schedule(expression).next_after(at) == expected
+
+@pytest.mark.parametrize("expression", [
+    "* * * *",
+    "60 * * * *",
+    "0 24 * * *",
+    "0 0 30 2 *",
+    "*/0 * * * *",
+    "@every 0m",
+    "@every 5w",
+    "@yearly",
+])
+def test_invalid_schedules_are_rejected(expression):
+    with pytest.raises(ValueError, match="Invalid schedule"):
+        parse_schedule(expression)
+
+@pytest.mark.parametrize("expression, at, expected", [
+    # Aligned to multiples of the interval since the epoch
+    ("@every 15m", datetime(2024, 3, 4, 10, 7), datetime(2024, 3, 4, 10, 15)),
+    ("@every 15m", datetime(2024, 3, 4, 10, 15), datetime(2024, 3, 4, 10, 30)),
+    ("@every 90s", datetime(1970, 1, 1, 0, 1), datetime(1970, 1, 1, 0, 1, 30)),
+    ("@every 6h", datetime(2024, 3, 4, 19, 0), datetime(2024, 3, 5)),
+    ("@every 2d", datetime(2024, 3, 4, 10, 0), datetime(2024, 3, 6)),
+])
+def test_every_next_after(expression, at, expected):
+    schedule = parse_schedule(expression)
+    assert isinstance(schedule, IntervalSchedule)
+    assert schedule.next_after(at) == expected
+
+def test_splay_is_stable_and_within_the_window():
+    offsets = [splay(f"device-{i}", 900) for i in range(1000)]
+    assert all(timedelta(0) <= offset < timedelta(seconds=900) for offset in offsets)
+    assert offsets == [splay(f"device-{i}", 900) for i in range(1000)]
+    # Spread over the window rather than bunched up
+    assert len({offset.seconds // 90 for offset in offsets}) == 10
+    assert splay("device-1", 0) == timedelta(0)
+
+def test_next_run_is_offset_by_the_splay():
+    hourly = CronSchedule("0 * * * *")
+    for i in range(200):
+        device_id = f"device-{i}"
+        due = next_run([hourly], device_id, START, 900)
+        assert due > START
+        # The scheduled minute plus at most the jitter window
+        run = due - splay(device_id, 900)
+        assert run.minute == 0 and run.second == 0
+        assert timedelta(0) <= due - run < timedelta(seconds=900)
+        # Once due, the next run is the following hour
+        assert next_run([hourly], device_id, due, 900) == due + timedelta(hours=1)
+
+def test_next_run_takes_the_earliest_schedule():
+    schedules = [CronSchedule("0 3 * * *"), IntervalSchedule(4 * 3600)]
+    assert next_run(schedules, "device-1", START, 0) == datetime(2024, 3, 4, 12, 0)
+
+class FakeEngine:
+    """Records which devices each run was asked to back up, and when."""
+
+    def __init__(self, clock: FakeClock, runs: int = 0, on_done=None):
+        self.clock = clock
+        self.runs = []
+        self.stop_after = runs
+        self.on_done = on_done
+
+    async def run(self, device_ids):
+        self.runs.append((self.clock.now(), sorted(device_ids)))
+        if self.on_done and len(self.runs) >= self.stop_after:
+            self.on_done()
+        return None
+
+    async def close_connections(self):
+        pass
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def clock():
+    return FakeClock(START)
+
+@pytest.fixture
+def make_scheduler(db, clock):
+    schedulers = []
+
+    def make(jitter=0, default_schedule="@daily", runs=0):
+        engine = FakeEngine(clock, runs)
+        scheduler = BackupScheduler(
+            engine=engine,
+            session_factory=SessionLocal,
+            clock=clock,
+            jitter=jitter,
+            default_schedule=default_schedule,
+        )
+        engine.on_done = scheduler.stop
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.close()
+
+def add_device(db, device_id, schedule=None, last_backup=None, status=DeviceStatus.ACTIVE):
+    db.add(Device(
+        id=device_id,
+        name=device_id,
+        ip_address="10.0.0.1",
+        type=DeviceType.ROUTER,
+        status=status,
+        backup_schedule=schedule,
+        last_backup=last_backup,
+    ))
+    db.commit()
+
+def next_backup(db, device_id):
+    db.expire_all()
+    return db.get(Device, device_id).next_backup
+
+def test_new_devices_are_spread_over_the_jitter_window(db, clock, make_scheduler):
+    scheduler = make_scheduler(jitter=600)
+    for i in range(50):
+        add_device(db, f"device-{i}")
+    add_device(db, "inactive", status=DeviceStatus.INACTIVE)
+
+    assert scheduler.claim_due() == [
+        f"device-{i}" for i in range(50) if splay(f"device-{i}", 600) == timedelta(0)
+    ]
+    for i in range(50):
+        device_id = f"device-{i}"
+        due = next_backup(db, device_id)
+        if splay(device_id, 600):
+            assert due == START + splay(device_id, 600)
+        else:
+            assert due > START
+    assert next_backup(db, "inactive") is None
+
+def test_devices_run_when_due_and_are_rescheduled(db, clock, make_scheduler):
+    scheduler = make_scheduler()
+    add_device(db, "hourly", "@hourly", last_backup=START)
+    add_device(db, "quarter", "@every 15m", last_backup=START)
+
+    assert scheduler.claim_due() == []
+    assert next_backup(db, "quarter") == datetime(2024, 3, 4, 10, 15)
+    assert next_backup(db, "hourly") == datetime(2024, 3, 4, 11, 0)
+
+    clock.advance(14 * 60)
+    assert scheduler.claim_due() == []
+    clock.advance(60)
+    assert scheduler.claim_due() == ["quarter"]
+    assert next_backup(db, "quarter") == datetime(2024, 3, 4, 10, 30)
+
+    clock.current = datetime(2024, 3, 4, 11, 0)
+    assert sorted(scheduler.claim_due()) == ["hourly", "quarter"]
+    assert next_backup(db, "hourly") == datetime(2024, 3, 4, 12, 0)
+    assert next_backup(db, "quarter") == datetime(2024, 3, 4, 11, 15)
+
+def test_missed_runs_are_caught_up_once(db, clock, make_scheduler):
+    scheduler = make_scheduler()
+    add_device(db, "router", "@hourly", last_backup=START - timedelta(hours=1))
+    assert scheduler.claim_due() == ["router"]
+    assert next_backup(db, "router") == datetime(2024, 3, 4, 11, 0)
+
+    # Down for three days: the device runs once, then continues from now
+    clock.advance(3 * 86400 + 25 * 60)
+    assert scheduler.claim_due() == ["router"]
+    assert next_backup(db, "router") == datetime(2024, 3, 7, 11, 0)
+    assert scheduler.claim_due() == []
+
+def test_overdue_device_without_next_backup_runs_now(db, clock, make_scheduler):
+    # E.g. a device activated again after a long time
+    scheduler = make_scheduler()
+    add_device(db, "router", "@daily", last_backup=START - timedelta(days=10))
+    assert scheduler.claim_due() == ["router"]
+    assert next_backup(db, "router") == datetime(2024, 3, 5)
+
+def test_run_sleeps_until_the_next_device_is_due(db, clock, make_scheduler):
+    scheduler = make_scheduler(runs=6)
+    add_device(db, "fast", "@every 20m", last_backup=START)
+    add_device(db, "slow", "@hourly", last_backup=START)
+
+    asyncio.run(scheduler.run())
+
+    assert scheduler.engine.runs == [
+        (datetime(2024, 3, 4, 10, 20), ["fast"]),
+        (datetime(2024, 3, 4, 10, 40), ["fast"]),
+        (datetime(2024, 3, 4, 11, 0), ["fast", "slow"]),
+        (datetime(2024, 3, 4, 11, 20), ["fast"]),
+        (datetime(2024, 3, 4, 11, 40), ["fast"]),
+        (datetime(2024, 3, 4, 12, 0), ["fast", "slow"]),
+    ]
+
+def test_run_catches_up_after_downtime(db, clock, make_scheduler):
+    scheduler = make_scheduler(runs=2)
+    add_device(db, "router", "@hourly", last_backup=START - timedelta(days=2))
+    # next_backup from before the downtime
+    db.query(Device).update({Device.next_backup: START - timedelta(days=1)})
+    db.commit()
+
+    asyncio.run(scheduler.run())
+
+    # One catch-up run now, then back on the hourly schedule
+    assert scheduler.engine.runs == [
+        (START, ["router"]),
+        (datetime(2024, 3, 4, 11, 0), ["router"]),
+    ]
+
+class StuckEngine(FakeEngine):
+    """Backups of "stuck" do not finish until the test has seen enough runs."""
+
+    async def run(self, device_ids):
+        if not hasattr(self, "released"):
+            self.released = asyncio.Event()
+        await super().run(device_ids)
+        if len(self.runs) >= self.stop_after:
+            self.released.set()
+        if "stuck" in device_ids:
+            await self.released.wait()
+
+def test_slow_backup_does_not_delay_other_schedules(db, clock, make_scheduler):
+    scheduler = make_scheduler(runs=6)
+    scheduler.engine = StuckEngine(clock, 6, scheduler.stop)
+    add_device(db, "fast", "@every 20m", last_backup=START)
+    add_device(db, "stuck", "@hourly", last_backup=START)
+
+    asyncio.run(asyncio.wait_for(scheduler.run(), 10))
+
+    assert scheduler.engine.runs == [
+        (datetime(2024, 3, 4, 10, 20), ["fast"]),
+        (datetime(2024, 3, 4, 10, 40), ["fast"]),
+        (datetime(2024, 3, 4, 11, 0), ["fast", "stuck"]),
+        (datetime(2024, 3, 4, 11, 20), ["fast"]),
+        (datetime(2024, 3, 4, 11, 40), ["fast"]),
+        (datetime(2024, 3, 4, 12, 0), ["fast", "stuck"]),
+    ]
+
+def test_engine_does_not_start_a_device_still_being_backed_up(db):
+    add_device(db, "fast")
+    add_device(db, "stuck")
+    add_device(db, "other")
+    fetched = []
+
+    async def overlapping_runs():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def fetch(target):
+            fetched.append(target.device_id)
+            if target.device_id == "stuck":
+                started.set()
+                await release.wait()
+            return f"hostname {target.name}\n"
+
+        engine.fetch = fetch
+        first = asyncio.create_task(engine.run(["fast", "stuck"]))
+        await started.wait()
+        second = await engine.run(["stuck", "other"])
+        release.set()
+        return await first, second
+
+    engine = BackupEngine()
+    try:
+        first, second = asyncio.run(overlapping_runs())
+    finally:
+        engine.close()
+    assert (first.total, first.succeeded) == (2, 2)
+    assert (second.total, second.succeeded) == (1, 1)
+    assert sorted(fetched) == ["fast", "other", "stuck"]
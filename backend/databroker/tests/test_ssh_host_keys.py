@@ -0,0 +1,46 @@
+import asyncio
+import logging
+import asyncssh
+import pytest
+from fake_device_server import generate_config, start_server
+from databroker.app.collector import transport
+from databroker.app.collector.transport import CollectionError, DeviceTarget, fetch_running_config
+from databroker.app.config import settings
+
+def fetch(**server_options):
+    async def run():
+        server = await start_server(port=0, **server_options)
+        try:
+            port = server.sockets[0].getsockname()[1]
+            return await fetch_running_config(DeviceTarget(
+                device_id="device-0", name="device-0", host="127.0.0.1", port=port,
+                username="netbackup", password="secret", device_type="Switch",
+            ))
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    return asyncio.run(asyncio.wait_for(run(), 30))
+
+@pytest.fixture
+def impostor(monkeypatch):
+    # A device whose host key is not the one in known_hosts, e.g. a man in the middle
+    monkeypatch.setattr("fake_device_server.HOST_KEY", asyncssh.generate_private_key("ssh-ed25519"))
+
+def test_known_host_key_is_accepted():
+    assert fetch() == generate_config()
+
+def test_unknown_host_key_is_refused(impostor):
+    with pytest.raises(CollectionError, match="Host key is not trusted"):
+        fetch()
+
+def test_skipping_the_check_is_explicit_and_logged(impostor, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "ssh_verify_host_keys", False)
+    monkeypatch.setattr(transport, "_warned_unverified", False)
+    with caplog.at_level(logging.WARNING, logger=transport.__name__):
+        assert fetch() == generate_config()
+        assert fetch() == generate_config()
+    assert [record.message for record in caplog.records if "host key checking is off" in record.message] == [
+        "SSH host key checking is off (NETBACKUP_SSH_VERIFY_HOST_KEYS=false): "
+        "device connections are not protected against interception"
+    ]
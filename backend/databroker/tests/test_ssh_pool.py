@@ -0,0 +1,109 @@
+import asyncio
+from fake_device_server import INVENTORY, generate_config, start_server
+from databroker.app.collector.engine import BackupEngine
+from databroker.app.collector.transport import DeviceTarget, SSHConnectionPool, fetch_device_config
+from databroker.app.config_store.blobs import read_config
+from databroker.app.models.models import BackupHistory, BackupStatus, Device, DeviceType
+
+def target(port: int, device_id: str = "device-0") -> DeviceTarget:
+    return DeviceTarget(
+        device_id=device_id, name=device_id, host="127.0.0.1", port=port,
+        username="netbackup", password="secret", device_type="Switch",
+    )
+
+def with_server(session, connections=None):
+    async def run():
+        server = await start_server(port=0, connections=connections)
+        try:
+            return await session(server.sockets[0].getsockname()[1])
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    return asyncio.run(asyncio.wait_for(run(), 30))
+
+def test_sessions_on_one_device_share_a_connection():
+    async def session(port: int):
+        pool = SSHConnectionPool(max_sessions=2)
+        opened = asyncio.Event()
+        seen = []
+
+        async def use():
+            async with pool.connection(target(port)) as conn:
+                seen.append(conn)
+                if len(seen) == 2:
+                    opened.set()
+                await opened.wait()
+
+        await asyncio.gather(use(), use())
+        try:
+            assert seen[0] is seen[1]
+            assert len(pool._connections) == 1
+        finally:
+            await pool.close()
+
+    with_server(session)
+
+def test_show_commands_run_beside_the_config_on_one_connection():
+    connections = []
+
+    async def session(port: int):
+        pool = SSHConnectionPool()
+        try:
+            return await fetch_device_config(target(port), pool)
+        finally:
+            await pool.close()
+
+    config = with_server(session, connections)
+    header, body = config.split("!\nhostname", 1)
+    assert "!" + "\nhostname" + body == generate_config()
+    assert header.startswith("! show version\n! Cisco IOS Software")
+    # The uptime changes on its own, so it would make every backup a new revision
+    assert "uptime" not in header
+    assert "".join(f"! {line}\n" for line in INVENTORY.splitlines()) in header
+    assert len(connections) == 1
+
+def test_a_rejected_show_command_is_left_out():
+    async def session(port: int):
+        device = target(port)
+        device.show_commands = ["show inventory", "show bogus"]
+        return await fetch_device_config(device)
+
+    config = with_server(session)
+    assert config.startswith("! show inventory\n")
+    assert "bogus" not in config
+
+def test_engine_reuses_device_connections_across_runs(db):
+    devices = 6
+    db.add_all(
+        Device(id=f"device-{i}", name=f"device-{i}", ip_address="127.0.0.1", type=DeviceType.SWITCH)
+        for i in range(devices)
+    )
+    db.commit()
+    engine = BackupEngine(max_concurrency=2)
+    connections = []
+
+    async def session(port: int):
+        targets = [target(port, f"device-{i}") for i in range(devices)]
+        try:
+            first = await engine.run_targets(targets)
+            # Still open for the next run, within the idle TTL
+            assert len(engine.pool._connections) == devices
+            second = await engine.run_targets(targets)
+            return first, second
+        finally:
+            await engine.close_connections()
+
+    try:
+        summaries = with_server(session, connections)
+    finally:
+        engine.close()
+
+    for summary in summaries:
+        assert (summary.succeeded, summary.failed) == (devices, 0), summary.failures
+    # One handshake per device for the config and both show commands, in both runs
+    assert len(connections) == devices
+    history = db.query(BackupHistory).filter(BackupHistory.status == BackupStatus.SUCCESS).all()
+    assert len(history) == 2 * devices
+    config = read_config(history[0].config_file_path).decode()
+    assert config.startswith("! show version\n") and config.endswith(generate_config())
@@ -0,0 +1,64 @@
+import asyncio
+import pytest
+from fake_device_server import PAGE_LINES, generate_config
+from fake_telnet_server import DO, ECHO, NAWS, SGA, TTYPE, WILL, start_server
+from databroker.app.collector.drivers import get_driver
+from databroker.app.collector.telnet import (
+    PASSWORD_PROMPT,
+    USERNAME_PROMPT,
+    TelnetStream,
+    fetch_running_config_telnet,
+)
+from databroker.app.collector.transport import CliSession, CollectionError, DeviceTarget
+
+CONFIG = generate_config("edge1")
+
+def with_server(session, password=None):
+    """Run ``session(port)`` against a fresh fake Telnet device; returns its result and the server's connections."""
+    async def run():
+        connections = []
+        server = await start_server(port=0, config=CONFIG, hostname="edge1",
+                                    password=password, connections=connections)
+        try:
+            return await session(server.sockets[0].getsockname()[1]), connections
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    return asyncio.run(asyncio.wait_for(run(), 30))
+
+def target(port: int, password: str = "secret") -> DeviceTarget:
+    return DeviceTarget(
+        device_id="edge1", name="edge1", host="127.0.0.1", port=port, device_type="Switch",
+        username="netbackup", password=password, protocol="telnet",
+    )
+
+@pytest.mark.parametrize("password", [None, "secret"])
+def test_fetch_running_config(password):
+    config, [conn] = with_server(lambda port: fetch_running_config_telnet(target(port)), password)
+    assert config == CONFIG
+    # The device's options are accepted, and the terminal ones it asked for offered
+    assert set(conn.received_options) >= {(DO, ECHO), (DO, SGA), (WILL, NAWS), (WILL, TTYPE)}
+
+def test_wrong_password_is_a_login_failure():
+    with pytest.raises(CollectionError, match="login to 127.0.0.1 failed"):
+        with_server(lambda port: fetch_running_config_telnet(target(port, "wrong")), "secret")
+
+def test_pager_is_answered_and_removed():
+    # Without "terminal length 0" the device pages its output with --More--
+    assert CONFIG.count("\n") > 3 * PAGE_LINES
+
+    async def session(port: int) -> str:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        stream = TelnetStream(reader, writer)
+        try:
+            cli = CliSession(stream, stream, get_driver("cisco_ios"), "edge1", timeout=10)
+            await cli.read_until(USERNAME_PROMPT)
+            await cli.send("netbackup", PASSWORD_PROMPT)
+            await cli.send("secret")
+            return await cli.run("show running-config")
+        finally:
+            stream.close()
+
+    config, _ = with_server(session, "secret")
+    assert config == CONFIG